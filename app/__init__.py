@@ -7,11 +7,21 @@ treatment recommendations for grapevine diseases.
 Modules:
     config          Environment variables and constants
     dosage_rules    Dosage calculations and treatment products
+    embeddings      Embedding backends (PyTorch / ONNX)
+    extractive      No-LLM plans assembled from the knowledge sheets
+    health          Background component health monitor
     ingestion       Knowledge base indexing into Weaviate
-    llm_client      HuggingFace LLM API wrapper
+    llm_client      LLM client: backend routing (EWMA latency / errors) and hedging
     main            FastAPI application and endpoints
+    metrics         Prometheus metrics (stage latency, counters)
+    plan_store      Nightly precomputed plans (versioned SQLite store)
+    profiling       Admin-only per-request profiling
     prompts         LLM prompt construction
     rag_pipeline    Main RAG pipeline orchestration
     schemas         Pydantic request/response models
+    snapshot        Knowledge index snapshot export/import
+    tokens          Token counting (chunk sizes, prompt budgets)
+    tracing         Request span tracing and export
+    warmup          Startup warm-up and readiness state
     weaviate_client Weaviate connection and vector search
 """
\ No newline at end of file
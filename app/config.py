@@ -18,11 +18,20 @@ DEFAULT_SEVERITY = "low"
 
 # ── Season ──
 DEFAULT_SEASON = "unknown"
+SEASONS = ("winter", "spring", "summer", "autumn", DEFAULT_SEASON)
 
 # ── Dosage ──
 MIN_RECOMMENDED_VOLUME_L_HA = 200
 MAX_RECOMMENDED_VOLUME_L_HA = 400
 
+# Rule files (manifest.yaml, dosage.csv, products.yaml — see app.dosage_rules),
+# re-read every DOSAGE_RULES_RELOAD_INTERVAL_S when changed (0 disables)
+DOSAGE_RULES_DIR = os.getenv(
+    "DOSAGE_RULES_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "data", "rules"),
+)
+DOSAGE_RULES_RELOAD_INTERVAL_S = float(os.getenv("DOSAGE_RULES_RELOAD_INTERVAL_S", "60"))
+
 # ── Hugging Face Inference API ──
 HF_API_URL = os.getenv(
     "HF_API_URL",
@@ -34,13 +43,188 @@ HF_MODEL_ID = os.getenv(
     "meta-llama/Meta-Llama-3-8B-Instruct",
 )
 
+# ── LLM backends (routing and hedging, see app.llm_client) ──
+# Ordered OpenAI-compatible backends, "url|model,url|model" (model optional:
+# HF_MODEL_ID). Empty: the single HF_API_URL backend. Calls go to the backend
+# with the best EWMA latency / error rate; unmeasured backends are tried first.
+LLM_BACKENDS = tuple(
+    item.strip() for item in os.getenv("LLM_BACKENDS", "").split(",") if item.strip()
+)
+# Weight of the latest call in the latency / error-rate moving averages
+LLM_EWMA_ALPHA = float(os.getenv("LLM_EWMA_ALPHA", "0.2"))
+# Hedging: once the first backend exceeds its p95 latency, the same request is
+# sent to the next one and the first valid answer wins
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+# Hedge delay while a backend has too few successful calls for a p95
+LLM_HEDGE_DELAY_S = float(os.getenv("LLM_HEDGE_DELAY_S", "5"))
+# Hedged calls in flight at once (primary waiting on its delay, or hedge sent).
+# Beyond it, calls go out unhedged: a losing hedge holds its slot until its
+# HTTP call returns, so this bounds the extra load hedging adds under pressure
+LLM_HEDGE_MAX_INFLIGHT = int(os.getenv("LLM_HEDGE_MAX_INFLIGHT", "8"))
+
+# ── Generation backend (see app.llm_client) ──
+# "http"  : OpenAI-compatible chat-completions endpoints (HF_API_URL / LLM_BACKENDS)
+# "local" : small causal LM run in process on CPU (requires torch + transformers)
+# "stub"  : canned valid plan after STUB_LLM_DELAY_S (load tests, benchmarks)
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "http").strip().lower()
+LOCAL_LLM_MODEL_ID = os.getenv("LOCAL_LLM_MODEL_ID", "Qwen/Qwen2.5-0.5B-Instruct")
+# torch intra-op threads of the local backend (0 = torch default)
+LOCAL_LLM_THREADS = int(os.getenv("LOCAL_LLM_THREADS", "0"))
+STUB_LLM_DELAY_S = float(os.getenv("STUB_LLM_DELAY_S", "0"))
+# After a failed backend load (e.g. local model weights unreachable), calls fail
+# fast for this long before the next load attempt
+GENERATION_LOAD_RETRY_S = float(os.getenv("GENERATION_LOAD_RETRY_S", "300"))
+
 # ── Weaviate ──
 WEAVIATE_URL = os.getenv("WEAVIATE_URL", "")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "")
 
+# Alias read by the query path. Ingestion builds versioned collections
+# (VitiScanKnowledge_v1, _v2, ...) and repoints this alias once validated.
+KNOWLEDGE_COLLECTION = os.getenv("KNOWLEDGE_COLLECTION", "VitiScanKnowledge")
+# Chunk fields stored as Weaviate properties and in snapshots (see app.ingestion,
+# app.snapshot)
+CHUNK_PROPERTIES = (
+    "text", "section", "disease_id", "cnn_label", "disease_name", "type",
+    "category", "farming_mode", "subsection", "chunk_index", "token_count",
+    "plan_field", "plan_mode",
+)
+KNOWLEDGE_KEEP_VERSIONS = int(os.getenv("KNOWLEDGE_KEEP_VERSIONS", "2"))
+
+# ── Embeddings ──
+EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID", "sentence-transformers/all-MiniLM-L6-v2")
+# "torch" (SentenceTransformer) or "onnx" (onnxruntime, CPU — see app.embeddings)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+EMBEDDING_ONNX_DIR = os.getenv(
+    "EMBEDDING_ONNX_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "models", "all-MiniLM-L6-v2-onnx"),
+)
+EMBEDDING_ONNX_QUANTIZED = os.getenv("EMBEDDING_ONNX_QUANTIZED", "false").lower() == "true"
+
+# ── Retrieval backend ──
+# "weaviate" : vector search in Weaviate (default)
+# "snapshot" : in-process search over an exported snapshot (see app.snapshot)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "weaviate").strip().lower()
+KNOWLEDGE_SNAPSHOT_DIR = os.getenv(
+    "KNOWLEDGE_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "data", "snapshot"),
+)
+
+# ── Caches ──
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "256"))
+# Retrieved chunks are cached per (disease, mode, severity); the TTL bounds
+# how long a re-index takes to be visible to the API.
+RETRIEVAL_CACHE_TTL_S = float(os.getenv("RETRIEVAL_CACHE_TTL_S", "300"))
+
+# ── Generation strategy ──
+# "rag"        : retrieved chunks + LLM (default)
+# "extractive" : plan assembled from the knowledge sheets, no LLM call (see app.extractive)
+GENERATION_STRATEGY = os.getenv("GENERATION_STRATEGY", "rag").strip().lower()
+# On a failed LLM call, answer with the extractive plan instead of a generic message
+EXTRACTIVE_FALLBACK = os.getenv("EXTRACTIVE_FALLBACK", "true").lower() == "true"
+EXTRACTIVE_INDEX_PATH = os.getenv(
+    "EXTRACTIVE_INDEX_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "extractive_index.json"),
+)
+
+
+# ── Quality tiers (?quality= on /solutions) ──
+# Per tier:
+# top_k          : chunks retrieved
+# context_tokens : prompt context budget, in tokens as counted for CHUNK_MAX_TOKENS
+#                  (see app.tokens; 0 = every chunk)
+# max_new_tokens : completion cap (0 = no LLM call: the plan store, else an
+#                  extractive plan)
+# model          : LLM model asked for ("" = the configured backends' models)
+# Each tier is overridable with QUALITY_<TIER>="key=value,...",
+# e.g. QUALITY_BALANCED="max_new_tokens=400,model=meta-llama/Llama-3.2-3B-Instruct"
+def _quality_tier(name: str, **defaults):
+    overrides = dict(
+        (part.strip() for part in item.split("=", 1))
+        for item in os.getenv(f"QUALITY_{name.upper()}", "").split(",")
+        if "=" in item
+    )
+    return {key: type(value)(overrides.get(key, value)) for key, value in defaults.items()}
+
+
+QUALITY_TIERS = {
+    # Latency-sensitive clients (mobile): no LLM call, tiny context
+    "fast":     _quality_tier("fast", top_k=3, context_tokens=256, max_new_tokens=0, model=""),
+    "balanced": _quality_tier("balanced", top_k=5, context_tokens=900, max_new_tokens=450, model=""),
+    # Thorough advisory reports: every retrieved chunk, long completion
+    "full":     _quality_tier("full", top_k=8, context_tokens=0, max_new_tokens=700, model=""),
+}
+DEFAULT_QUALITY = os.getenv("DEFAULT_QUALITY", "full").strip().lower()
+
+# ── Label policies ──
+# How the plan of each label is produced ("label=policy,..."; unlisted labels use "llm"):
+# "template" : precomputed from the knowledge sheets, no retrieval or LLM call
+# "cached"   : generated once per label / mode / severity / season, then reused
+#              (dosage is still computed per request)
+# "llm"      : full pipeline on every request
+LABEL_POLICIES = dict(
+    (part.strip().lower() for part in item.split("=", 1))
+    for item in os.getenv(
+        "LABEL_POLICIES", "healthy=template,phaeomoniella_chlamydospora=template"
+    ).split(",")
+    if "=" in item
+)
+# Stale-while-revalidate: past the soft TTL a cached plan is still served while
+# one background regeneration replaces it; past the hard TTL it is regenerated
+# in the request
+PLAN_CACHE_SOFT_TTL_S = float(os.getenv("PLAN_CACHE_SOFT_TTL_S", "3600"))
+PLAN_CACHE_HARD_TTL_S = float(os.getenv("PLAN_CACHE_HARD_TTL_S", "86400"))
+PLAN_CACHE_REFRESH_WORKERS = int(os.getenv("PLAN_CACHE_REFRESH_WORKERS", "2"))
+
+# ── Plan store (nightly precomputation, see app.plan_store) ──
+# Plans of every label × mode × severity × season, generated offline and
+# served with the requested area's dosage; the LLM is only called on a miss
+# (empty path: store disabled)
+PLAN_STORE_PATH = os.getenv(
+    "PLAN_STORE_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "plans", "plan_store.sqlite"),
+)
+# How often the API checks the store for a newer live version
+PLAN_STORE_CHECK_INTERVAL_S = float(os.getenv("PLAN_STORE_CHECK_INTERVAL_S", "30"))
+PLAN_STORE_KEEP_VERSIONS = int(os.getenv("PLAN_STORE_KEEP_VERSIONS", "3"))
+PLAN_PRECOMPUTE_WORKERS = int(os.getenv("PLAN_PRECOMPUTE_WORKERS", "4"))
+# Area written in the precomputation prompts (plans are served for any area)
+PLAN_PRECOMPUTE_AREA_M2 = float(os.getenv("PLAN_PRECOMPUTE_AREA_M2", "10000"))
+
+# ── Startup warm-up ──
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+WARMUP_PRIME_CACHES = os.getenv("WARMUP_PRIME_CACHES", "true").lower() == "true"
+WARMUP_PING_LLM = os.getenv("WARMUP_PING_LLM", "false").lower() == "true"
+
+# ── Health monitor ──
+# Background probe interval (0 disables probing: configuration-based status only)
+HEALTH_PROBE_INTERVAL_S = float(os.getenv("HEALTH_PROBE_INTERVAL_S", "30"))
+HEALTH_PROBE_TIMEOUT_S = float(os.getenv("HEALTH_PROBE_TIMEOUT_S", "5"))
+HEALTH_HISTORY_SIZE = int(os.getenv("HEALTH_HISTORY_SIZE", "20"))
+
+# ── Tracing ──
+# Where finished request traces go: "none", "file" (JSON lines) or "http" (collector)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").strip().lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/traces.jsonl")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "")
+
+# ── Admin / profiling ──
+# Token required in the X-Admin-Token header by admin-only features (unset = disabled)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# ?profile=true on /solutions: "sampling" (collapsed stacks) or "deterministic" (cProfile)
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling").strip().lower()
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "1"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
 # ── Knowledge base ──
 KNOWLEDGE_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "knowledge")
 
+# ── Chunking (ingestion) ──
+# Token window and overlap used to split knowledge sections into sub-chunks.
+# MiniLM truncates inputs at 256 word pieces, so windows stay well below that.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "128"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "24"))
+
 
 # ── Disease label mapping (INRAE CNN labels → English names) ──
 DISEASE_NAMES: dict[str, str] = {
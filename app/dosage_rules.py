@@ -1,211 +1,71 @@
 """
 dosage_rules.py — Dosage rules and treatment products by disease and farming mode.
+
+Rules are data edited by agronomists, loaded from DOSAGE_RULES_DIR
+(data/rules/, format documented in manifest.yaml):
+- manifest.yaml : rule set version and severity multipliers
+- dosage.csv    : dose and spray volume per (label, mode, region, growth stage)
+- products.yaml : treatment products per (label, mode)
+
+The files are compiled into a RuleSet: read-only records (pre-rendered
+product bullets, per-severity effective doses) indexed by
+(label, mode, region, stage), so a request resolves its rule with a few
+dict lookups. Reloading builds and validates a complete new RuleSet, then
+swaps the module reference in one assignment: a request reads either the old
+or the new rule set, never a mix, and an invalid edit leaves the current
+rules in place (see reload_rules, start_rules_watcher).
+
+Two entry points share the same output contract:
+- compute_dosage       : one plot (request path)
+- compute_dosage_batch : columnar inputs (tens of thousands of plots),
+                         computed with NumPy in one pass
+
+NumPy and PyYAML are imported on first use only, so importing this module
+(and app.main) stays cheap.
 """
 
-from typing import Dict, Any, Optional
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import repeat
+from pathlib import Path
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Dict, Any, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+import csv
+import hashlib
+import io
+import logging
+import math
 import re
-from app.config import DISEASE_NAMES
-
-# ── Dosage rules by disease and farming mode ───────────────────────────────────
-DOSAGE_RULES: Dict[str, Dict[str, Dict[str, Optional[float]]]] = {
-    "plasmopara_viticola": {
-        "conventional": {"dose_l_ha": 1.6, "volume_bouillie_l_ha": 250.0},
-        "organic":      {"dose_l_ha": 2.8, "volume_bouillie_l_ha": 300.0},
-    },
-    "erysiphe_necator": {
-        "conventional": {"dose_l_ha": 0.8, "volume_bouillie_l_ha": 220.0},
-        "organic":      {"dose_l_ha": 6.0, "volume_bouillie_l_ha": 250.0},
-    },
-    "colomerus_vitis": {
-        "conventional": {"dose_l_ha": 0.9, "volume_bouillie_l_ha": 180.0},
-        "organic":      {"dose_l_ha": 1.2, "volume_bouillie_l_ha": 200.0},
-    },
-    "elsinoe_ampelina": {
-        "conventional": {"dose_l_ha": 2.0, "volume_bouillie_l_ha": 250.0},
-        "organic":      {"dose_l_ha": 3.0, "volume_bouillie_l_ha": 300.0},
-    },
-    "guignardia_bidwellii": {
-        "conventional": {"dose_l_ha": 1.5, "volume_bouillie_l_ha": 250.0},
-        "organic":      {"dose_l_ha": 2.5, "volume_bouillie_l_ha": 300.0},
-    },
-    "phaeomoniella_chlamydospora": {
-        "conventional": {"dose_l_ha": None, "volume_bouillie_l_ha": 200.0},
-        "organic":      {"dose_l_ha": None, "volume_bouillie_l_ha": 200.0},
-    },
-    "healthy": {
-        "conventional": {"dose_l_ha": 0.0, "volume_bouillie_l_ha": 0.0},
-        "organic":      {"dose_l_ha": 0.0, "volume_bouillie_l_ha": 0.0},
-    },
-}
-
-
-# ── Treatment products by disease and farming mode ─────────────────────────────
-TREATMENT_PRODUCTS: Dict[str, Dict[str, Dict[str, Any]]] = {
-    "plasmopara_viticola": {
-        "conventional": {
-            "type": "Anti-downy mildew (fungicides)",
-            "examples": [
-                "CAA family (e.g. dimethomorph)",
-                "QoI family (e.g. azoxystrobin)",
-                "Contact products (e.g. folpet)"
-            ],
-            "dose_unit": "kg/ha or L/ha (depending on formulation)",
-            "strategy": "Preventive + reinforce after rainfall",
-            "note": "Alternate fungicide families to limit resistance. Increase frequency during repeated rainfall."
-        },
-        "organic": {
-            "type": "Copper / biocontrol",
-            "examples": [
-                "Copper (copper hydroxide / Bordeaux mixture)",
-                "Phosphonates (subject to local regulations)",
-                "Natural defense stimulators (NDS)"
-            ],
-            "dose_unit": "kg/ha",
-            "strategy": "Preventive",
-            "note": "Copper is mainly preventive: target risk periods (leaf wetness). Respect annual regulatory limits."
-        },
-    },
-    "erysiphe_necator": {
-        "conventional": {
-            "type": "Anti-powdery mildew (fungicides)",
-            "examples": [
-                "Triazoles (e.g. myclobutanil / tebuconazole)",
-                "Strobilurins (QoI)",
-                "Sulfur (as complement if compatible)"
-            ],
-            "dose_unit": "kg/ha or L/ha",
-            "strategy": "Strict preventive",
-            "note": "Powdery mildew cannot be reversed: regularity is critical. Mandatory rotation of modes of action."
-        },
-        "organic": {
-            "type": "Sulfur / biocontrol",
-            "examples": [
-                "Wettable sulfur",
-                "Potassium bicarbonate",
-                "Vegetable oils (depending on conditions)"
-            ],
-            "dose_unit": "kg/ha",
-            "strategy": "Preventive",
-            "note": "Sulfur is effective but risk of phytotoxicity above 30°C. Adjust interval based on weather and disease pressure."
-        },
-    },
-    "colomerus_vitis": {
-        "conventional": {
-            "type": "Acaricide",
-            "examples": [
-                "Abamectin (subject to authorization)",
-                "Spirodiclofen (subject to authorization)",
-                "Hexythiazox (subject to authorization)"
-            ],
-            "dose_unit": "L/ha",
-            "strategy": "Targeted",
-            "note": "Intervene early if outbreak detected. Avoid systematic treatments to preserve beneficial fauna."
-        },
-        "organic": {
-            "type": "Oils / soap / sulfur",
-            "examples": [
-                "Paraffinic oil (white oils)",
-                "Black soap (mechanical effect)",
-                "Sulfur (partial effect)"
-            ],
-            "dose_unit": "L/ha",
-            "strategy": "Pressure reduction",
-            "note": "Mainly mechanical approach: target the right stage and ensure good coverage. Repeat if necessary."
-        },
-    },
-    "elsinoe_ampelina": {
-        "conventional": {
-            "type": "Contact fungicide",
-            "examples": [
-                "Mancozeb (if locally authorized)",
-                "Folpet",
-                "Copper (depending on strategy)"
-            ],
-            "dose_unit": "kg/ha",
-            "strategy": "Preventive",
-            "note": "Intervene early on young tissues during humid periods. Reinforce after heavy rain or rapid growth."
-        },
-        "organic": {
-            "type": "Copper / biocontrol",
-            "examples": [
-                "Copper (hydroxide / Bordeaux mixture)",
-                "Biocontrol (plant extracts subject to authorization)"
-            ],
-            "dose_unit": "kg/ha",
-            "strategy": "Preventive",
-            "note": "Efficacy depends on application regularity and weather (rain = washout). Improve ventilation."
-        },
-    },
-    "guignardia_bidwellii": {
-        "conventional": {
-            "type": "Anti-black rot (fungicides)",
-            "examples": [
-                "Dithiocarbamates (subject to regulations)",
-                "Strobilurins (QoI)",
-                "Contact fungicides (e.g. captan / folpet depending on availability)"
-            ],
-            "dose_unit": "kg/ha or L/ha",
-            "strategy": "Preventive + reinforce after rainfall",
-            "note": "Target risk periods (rain + heat). Ensure good bunch coverage and renew after washout."
-        },
-        "organic": {
-            "type": "Copper / biocontrol",
-            "examples": [
-                "Copper (Bordeaux mixture / hydroxide)",
-                "Natural defense stimulators (NDS)"
-            ],
-            "dose_unit": "kg/ha",
-            "strategy": "Preventive",
-            "note": "Mainly preventive protection. Reinforce prophylaxis (ventilation, removal of infected debris)."
-        },
-    },
-    "phaeomoniella_chlamydospora": {
-        "conventional": {
-            "type": "No direct curative treatment",
-            "examples": [
-                "Sanitary pruning / trunk surgery (depending on practice)",
-                "Replacement of severely affected vines"
-            ],
-            "dose_unit": "",
-            "strategy": "Prophylaxis + vineyard management",
-            "note": "Esca is a wood disease: the approach is mainly agronomic (hygiene, wound protection, vine management)."
-        },
-        "organic": {
-            "type": "No direct curative treatment",
-            "examples": [
-                "Prophylaxis (pruning hygiene)",
-                "Water stress management and canopy ventilation"
-            ],
-            "dose_unit": "",
-            "strategy": "Prophylaxis",
-            "note": "Same logic: wood disease. Monitoring + cultural measures; no standard product treatment available."
-        },
-    },
-    "healthy": {
-        "conventional": {
-            "type": "None",
-            "examples": [],
-            "dose_unit": "",
-            "strategy": "None",
-            "note": "No treatment required. Maintain regular monitoring."
-        },
-        "organic": {
-            "type": "None",
-            "examples": [],
-            "dose_unit": "",
-            "strategy": "None",
-            "note": "No treatment required. Maintain regular monitoring."
-        },
-    },
-}
-
-
-# ── Severity multipliers ───────────────────────────────────────────────────────
-SEVERITY_MULTIPLIER = {
-    "low":      0.75,
-    "moderate": 1.0,
-    "high":     1.4,
-}
+import threading
+
+from app.config import (
+    DISEASE_NAMES,
+    DOSAGE_RULES_DIR,
+    SUPPORTED_MODES,
+    SUPPORTED_SEVERITIES,
+)
+from app.metrics import RULES_RELOADS
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rule files, relative to the rules directory
+MANIFEST_FILE = "manifest.yaml"
+DOSAGE_FILE   = "dosage.csv"
+PRODUCTS_FILE = "products.yaml"
+RULE_FILES    = (MANIFEST_FILE, DOSAGE_FILE, PRODUCTS_FILE)
+
+DOSAGE_COLUMNS = ("label", "mode", "region", "stage", "dose_l_ha", "volume_bouillie_l_ha")
+
+# Wildcard region / growth stage in dosage.csv
+ANY = "*"
+
+
+class RulesError(Exception):
+    """Raised when the rule files are missing, malformed or inconsistent."""
 
 
 # ── CNN label aliases ──────────────────────────────────────────────────────────
@@ -216,7 +76,7 @@ CNN_LABEL_ALIASES: Dict[str, str] = {label: label for label in DISEASE_NAMES.key
 
 def _normalize_cnn_label(raw_label: str) -> str:
     """
-    Normalizes a CNN label to a valid DOSAGE_RULES key.
+    Normalizes a CNN label to a canonical rule label.
     Accepts INRAE scientific names and common aliases.
     """
     if not raw_label:
@@ -248,12 +108,402 @@ def format_treatment_product(product: Dict[str, Any]) -> list[str]:
     return bullets
 
 
+def _scope_key(value: Optional[str]) -> str:
+    """Region / growth stage key: lower-cased, ANY when not given."""
+    if value is None:
+        return ANY
+    key = str(value).strip().lower()
+    return key or ANY
+
+
+# ── Compiled rules ─────────────────────────────────────────────────────────────
+
+# Rule kinds, mirroring the branches of compute_dosage
+RULE_UNKNOWN      = 0     # label or mode without a rule → {}
+RULE_NO_TREATMENT = 1     # dose 0 and spray volume 0 (healthy)
+RULE_NO_DOSE      = 2     # dose None (e.g. Esca): spray volume only
+RULE_STANDARD     = 3
+
+RuleKey = Tuple[str, str, str, str]     # (label, mode, region, stage)
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledRule:
+    """
+    One (label, mode, region, stage) rule, resolved at load time: everything
+    that does not depend on the plot (area) is precomputed.
+    """
+    label: str
+    mode: str
+    region: str
+    stage: str
+    kind: int
+    volume_bouillie_l_ha: float
+    # Effective dose (dose × severity multiplier) and its rounded value, per
+    # canonical severity; None holds the default multiplier (1.0)
+    effective_dose: Mapping[Optional[str], float]
+    rounded_dose: Mapping[Optional[str], float]
+    bullets: Tuple[str, ...]
+
+    @property
+    def key(self) -> RuleKey:
+        return (self.label, self.mode, self.region, self.stage)
+
+
+def _compile_rule(
+    key: RuleKey,
+    dose_l_ha: Optional[float],
+    volume: float,
+    product: Optional[Dict[str, Any]],
+    multipliers: Mapping[str, float],
+) -> CompiledRule:
+    if dose_l_ha == 0.0 and volume == 0.0:
+        kind = RULE_NO_TREATMENT
+    elif dose_l_ha is None:
+        kind = RULE_NO_DOSE
+    else:
+        kind = RULE_STANDARD
+
+    effective = {severity: (dose_l_ha or 0.0) * mult for severity, mult in {None: 1.0, **multipliers}.items()}
+    label, mode, region, stage = key
+    return CompiledRule(
+        label=label,
+        mode=mode,
+        region=region,
+        stage=stage,
+        kind=kind,
+        volume_bouillie_l_ha=volume,
+        effective_dose=MappingProxyType(effective),
+        rounded_dose=MappingProxyType({severity: round(dose, 2) for severity, dose in effective.items()}),
+        bullets=tuple(format_treatment_product(product)),
+    )
+
+
+class RuleSet:
+    """
+    One loaded version of the rule files. Never mutated after construction:
+    a reload builds a new RuleSet instead.
+    """
+
+    __slots__ = ("version", "checksum", "source", "loaded_at", "severity_multipliers", "rules", "_arrays")
+
+    def __init__(
+        self,
+        version: str,
+        checksum: str,
+        source: Path,
+        severity_multipliers: Mapping[str, float],
+        rules: Mapping[RuleKey, CompiledRule],
+    ):
+        self.version   = version
+        self.checksum  = checksum
+        self.source    = source
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.severity_multipliers = MappingProxyType(dict(severity_multipliers))
+        self.rules     = MappingProxyType(dict(rules))
+        self._arrays: Optional[Dict[str, Any]] = None
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def lookup(
+        self, label: str, mode: str, region: Optional[str] = None, stage: Optional[str] = None,
+    ) -> Optional[CompiledRule]:
+        """
+        Most specific rule for a canonical label and mode: region + stage,
+        then region, then stage, then the "* / *" default. None if the
+        label / mode pair has no rule.
+        """
+        rules = self.rules
+        if region is None and stage is None:
+            return rules.get((label, mode, ANY, ANY))
+        region, stage = _scope_key(region), _scope_key(stage)
+        return (
+            rules.get((label, mode, region, stage))
+            or rules.get((label, mode, region, ANY))
+            or rules.get((label, mode, ANY, stage))
+            or rules.get((label, mode, ANY, ANY))
+        )
+
+    def severity_key(self, severity: Optional[str]) -> Optional[str]:
+        """Canonical severity key of CompiledRule.effective_dose (None = multiplier 1.0)."""
+        multipliers = self.severity_multipliers
+        if severity in multipliers:
+            return severity
+        key = (severity or "").strip().lower()
+        return key if key in multipliers else None
+
+    def arrays(self) -> Dict[str, Any]:
+        """
+        The rules laid out as flat NumPy lookup arrays indexed by rule id
+        (position in `rules`), built on first use by the batch path.
+        """
+        if self._arrays is None:
+            import numpy as np
+
+            rules = list(self.rules.values())
+            self._arrays = {
+                "ids":     {r.key: i for i, r in enumerate(rules)},
+                "dose":    np.array([
+                    np.nan if r.kind == RULE_NO_DOSE else r.effective_dose[None] for r in rules
+                ], dtype=np.float64),
+                "volume":  np.array([r.volume_bouillie_l_ha for r in rules], dtype=np.float64),
+                "kind":    np.array([r.kind for r in rules], dtype=np.int8),
+                "bullets": [r.bullets for r in rules],
+            }
+        return self._arrays
+
+
+# ── Loading ────────────────────────────────────────────────────────────────────
+
+def _read_rule_files(rules_dir: Path) -> Tuple[Dict[str, bytes], str]:
+    """
+    Returns:
+        (file name → content, sha256 of all contents)
+
+    Raises:
+        RulesError: If a rule file is missing or unreadable
+    """
+    contents: Dict[str, bytes] = {}
+    digest = hashlib.sha256()
+    for name in RULE_FILES:
+        try:
+            data = (rules_dir / name).read_bytes()
+        except OSError as e:
+            raise RulesError(f"Cannot read rule file {rules_dir / name}: {e}") from e
+        contents[name] = data
+        digest.update(name.encode("utf-8") + b"\0" + data + b"\0")
+    return contents, digest.hexdigest()
+
+
+def _parse_yaml(name: str, data: bytes) -> Any:
+    import yaml
+
+    try:
+        return yaml.safe_load(data.decode("utf-8"))
+    except (UnicodeDecodeError, yaml.YAMLError) as e:
+        raise RulesError(f"{name}: invalid YAML ({e})") from e
+
+
+def _parse_number(value: Optional[str], where: str, column: str, allow_empty: bool = False) -> Optional[float]:
+    value = (value or "").strip()
+    if not value and allow_empty:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise RulesError(f"{where}: {column} must be a number, got '{value}'") from None
+    if not math.isfinite(number) or number < 0:
+        raise RulesError(f"{where}: {column} must be a non-negative number, got '{value}'")
+    return number
+
+
+def _parse_manifest(data: bytes) -> Tuple[str, Dict[str, float]]:
+    manifest = _parse_yaml(MANIFEST_FILE, data)
+    if not isinstance(manifest, dict) or not manifest.get("version"):
+        raise RulesError(f"{MANIFEST_FILE}: a non-empty 'version' is required")
+
+    raw = manifest.get("severity_multipliers")
+    if not isinstance(raw, dict):
+        raise RulesError(f"{MANIFEST_FILE}: 'severity_multipliers' must be a mapping")
+    multipliers: Dict[str, float] = {}
+    for severity, value in raw.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value < math.inf:
+            raise RulesError(f"{MANIFEST_FILE}: multiplier of '{severity}' must be a positive number")
+        multipliers[str(severity).strip().lower()] = float(value)
+    missing = set(SUPPORTED_SEVERITIES) - set(multipliers)
+    if missing:
+        raise RulesError(f"{MANIFEST_FILE}: missing severity multipliers for {sorted(missing)}")
+    return str(manifest["version"]), multipliers
+
+
+def _parse_products(data: bytes) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    products = _parse_yaml(PRODUCTS_FILE, data) or {}
+    if not isinstance(products, dict) or not all(isinstance(modes, dict) for modes in products.values()):
+        raise RulesError(f"{PRODUCTS_FILE}: expected label → mode → product mappings")
+    return products
+
+
+def _parse_dosage(data: bytes) -> Dict[RuleKey, Tuple[Optional[float], float]]:
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise RulesError(f"{DOSAGE_FILE}: not valid UTF-8 ({e})") from e
+
+    reader = csv.DictReader(io.StringIO(text))
+    if tuple(reader.fieldnames or ()) != DOSAGE_COLUMNS:
+        raise RulesError(f"{DOSAGE_FILE}: expected columns {','.join(DOSAGE_COLUMNS)}")
+
+    rows: Dict[RuleKey, Tuple[Optional[float], float]] = {}
+    for row in reader:
+        where = f"{DOSAGE_FILE}:{reader.line_num}"
+        label = (row["label"] or "").strip()
+        mode  = (row["mode"] or "").strip().lower()
+        if label not in DISEASE_NAMES:
+            raise RulesError(f"{where}: unknown label '{label}'")
+        if mode not in SUPPORTED_MODES:
+            raise RulesError(f"{where}: unknown mode '{mode}'")
+        key = (label, mode, _scope_key(row["region"]), _scope_key(row["stage"]))
+        if key in rows:
+            raise RulesError(f"{where}: duplicate rule for {'/'.join(key)}")
+        rows[key] = (
+            _parse_number(row["dose_l_ha"], where, "dose_l_ha", allow_empty=True),
+            _parse_number(row["volume_bouillie_l_ha"], where, "volume_bouillie_l_ha"),
+        )
+
+    # Every label / mode pair needs a default row, the end of the lookup fallback
+    pairs = {(label, mode) for label, mode, _, _ in rows}
+    missing = sorted(pair for pair in pairs if (*pair, ANY, ANY) not in rows)
+    if missing:
+        raise RulesError(f"{DOSAGE_FILE}: no default '*,*' row for {', '.join('/'.join(p) for p in missing)}")
+    return rows
+
+
+def load_rule_set(rules_dir: Union[str, Path] = DOSAGE_RULES_DIR) -> RuleSet:
+    """
+    Loads, validates and compiles the rule files of a directory.
+
+    Raises:
+        RulesError: If a file is missing, malformed or inconsistent
+    """
+    rules_dir = Path(rules_dir).resolve()
+    contents, checksum = _read_rule_files(rules_dir)
+    return _build_rule_set(rules_dir, contents, checksum)
+
+
+def _build_rule_set(rules_dir: Path, contents: Dict[str, bytes], checksum: str) -> RuleSet:
+    version, multipliers = _parse_manifest(contents[MANIFEST_FILE])
+    products = _parse_products(contents[PRODUCTS_FILE])
+    rows     = _parse_dosage(contents[DOSAGE_FILE])
+
+    rules = {
+        key: _compile_rule(key, dose, volume, (products.get(key[0]) or {}).get(key[1]), multipliers)
+        for key, (dose, volume) in rows.items()
+    }
+    return RuleSet(version, checksum, rules_dir, multipliers, rules)
+
+
+# ── Active rule set (atomic swap) ──────────────────────────────────────────────
+
+_RULE_SET: Optional[RuleSet] = None
+_LOCK   = threading.Lock()
+_STOP   = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+
+
+def get_rule_set() -> RuleSet:
+    """
+    The active rule set, loaded from DOSAGE_RULES_DIR on first use.
+    Callers should read it once per computation, so that a concurrent
+    reload cannot mix two versions in one result.
+
+    Raises:
+        RulesError: If the first load fails
+    """
+    rule_set = _RULE_SET
+    if rule_set is None:
+        rule_set, _ = reload_rules()
+    return rule_set
+
+
+def reload_rules(rules_dir: Union[str, Path, None] = None) -> Tuple[RuleSet, bool]:
+    """
+    Reloads the rule files (by default from the directory of the active rule
+    set) and swaps the active rule set if their content changed.
+
+    Returns:
+        (active rule set, whether it was replaced)
+
+    Raises:
+        RulesError: If the new files are invalid — the active rule set is kept
+    """
+    global _RULE_SET
+    with _LOCK:
+        current = _RULE_SET
+        if rules_dir is not None:
+            directory = Path(rules_dir).resolve()
+        else:
+            directory = current.source if current is not None else Path(DOSAGE_RULES_DIR).resolve()
+
+        try:
+            contents, checksum = _read_rule_files(directory)
+            if current is not None and current.source == directory and current.checksum == checksum:
+                return current, False
+            rule_set = _build_rule_set(directory, contents, checksum)
+        except RulesError:
+            RULES_RELOADS.labels(outcome="error").inc()
+            raise
+
+        _RULE_SET = rule_set
+    RULES_RELOADS.labels(outcome="ok").inc()
+    logger.info("Dosage rules %s loaded from %s (%d rules)", rule_set.version, directory, len(rule_set))
+    return rule_set, True
+
+
+def _watch_loop(interval_s: float) -> None:
+    while not _STOP.wait(interval_s):
+        try:
+            reload_rules()
+        except RulesError as e:
+            logger.error("Dosage rules not reloaded, keeping the active version: %s", e)
+
+
+def start_rules_watcher(interval_s: float) -> Optional[threading.Thread]:
+    """
+    Starts a daemon thread that reloads the rule files every interval_s
+    seconds when their content changed (no-op if interval_s <= 0).
+    """
+    global _THREAD
+    if interval_s <= 0 or (_THREAD is not None and _THREAD.is_alive()):
+        return _THREAD
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_watch_loop, args=(interval_s,), name="rules-watcher", daemon=True)
+    _THREAD.start()
+    return _THREAD
+
+
+def stop_rules_watcher() -> None:
+    global _THREAD
+    _STOP.set()
+    if _THREAD is not None:
+        _THREAD.join(timeout=5)
+        _THREAD = None
+
+
+# ── Label resolution ───────────────────────────────────────────────────────────
+
+# Canonical labels resolve with a single dict lookup
+_LABEL_INDEX: Mapping[str, str] = MappingProxyType(dict(CNN_LABEL_ALIASES))
+
+
+@lru_cache(maxsize=1024)
+def _resolve_label_slow(raw_label: str) -> str:
+    return _normalize_cnn_label(raw_label)
+
+
+def resolve_label(raw_label: str) -> str:
+    """
+    O(1) equivalent of _normalize_cnn_label: canonical labels are looked up
+    directly, other spellings (case, '.md' suffix) are normalized once and memoized.
+    """
+    label = _LABEL_INDEX.get(raw_label)
+    if label is not None:
+        return label
+    if not raw_label or not isinstance(raw_label, str):
+        return _normalize_cnn_label(raw_label)
+    return _resolve_label_slow(raw_label)
+
+
+# ── Scalar dosage ──────────────────────────────────────────────────────────────
+
 def compute_dosage(
     cnn_label: str,
     mode: str,
     area_m2: float,
     severity: Optional[str] = None,
     safety_margin: float = 0.10,
+    region: Optional[str] = None,
+    stage: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Computes treatment volumes based on:
@@ -262,23 +512,20 @@ def compute_dosage(
     - area in m²
     - severity level (low, moderate, high)
     - safety margin (10% by default)
+    - region and growth stage (optional: most specific rule, then defaults)
+
+    Rule lookup, effective dose and product bullets come precomputed from
+    the active RuleSet; only the area-dependent volumes are computed per call.
 
     Returns a dictionary with dosage details and treatment product information.
     """
-    cnn_label_norm = _normalize_cnn_label(cnn_label)
-
-    if cnn_label_norm not in DOSAGE_RULES or mode not in DOSAGE_RULES.get(cnn_label_norm, {}):
+    rule_set = get_rule_set()
+    rule = rule_set.lookup(resolve_label(cnn_label), mode, region, stage)
+    if rule is None:
         return {}
 
-    rules = DOSAGE_RULES[cnn_label_norm][mode]
-    dose_l_ha = rules.get("dose_l_ha")
-    mult = SEVERITY_MULTIPLIER.get((severity or "").strip().lower(), 1.0)
-    dose_l_ha_eff = (dose_l_ha or 0.0) * mult
-    volume_bouillie_l_ha = float(rules.get("volume_bouillie_l_ha") or 0.0)
-    fraction_ha = area_m2 / 10_000.0
-
     # Healthy leaf — no treatment needed
-    if dose_l_ha == 0.0 and volume_bouillie_l_ha == 0.0:
+    if rule.kind == RULE_NO_TREATMENT:
         return {
             "area_m2": area_m2,
             "dose_l_ha": 0.0,
@@ -289,32 +536,216 @@ def compute_dosage(
             "note": "No treatment required for this disease/severity level.",
         }
 
+    fraction_ha = area_m2 / 10_000.0
+    bouillie_l  = rule.volume_bouillie_l_ha * fraction_ha * (1.0 + safety_margin)
+
     # Disease with no dose configured (e.g. Esca)
-    if dose_l_ha is None:
-        bouillie_l = volume_bouillie_l_ha * fraction_ha * (1.0 + safety_margin)
-        treatment_product = TREATMENT_PRODUCTS.get(cnn_label_norm, {}).get(mode)
+    if rule.kind == RULE_NO_DOSE:
         return {
             "area_m2": area_m2,
             "dose_l_ha": None,
-            "volume_bouillie_l_ha": volume_bouillie_l_ha,
+            "volume_bouillie_l_ha": rule.volume_bouillie_l_ha,
             "estimated_product_l_for_area": None,
             "estimated_volume_l_for_area": round(bouillie_l, 2),
-            "treatment_product": format_treatment_product(treatment_product),
+            "treatment_product": list(rule.bullets),
             "configured": False,
             "note": "No dose configured for this label/mode. See treatment product recommendations.",
         }
 
     # Standard case
-    produit_l = dose_l_ha_eff * fraction_ha * (1.0 + safety_margin)
-    bouillie_l = volume_bouillie_l_ha * fraction_ha * (1.0 + safety_margin)
-    treatment_product = TREATMENT_PRODUCTS.get(cnn_label_norm, {}).get(mode)
+    severity_key = rule_set.severity_key(severity)
+    produit_l = rule.effective_dose[severity_key] * fraction_ha * (1.0 + safety_margin)
 
     return {
         "area_m2": area_m2,
-        "dose_l_ha": round(dose_l_ha_eff, 2),
-        "volume_bouillie_l_ha": volume_bouillie_l_ha,
+        "dose_l_ha": rule.rounded_dose[severity_key],
+        "volume_bouillie_l_ha": rule.volume_bouillie_l_ha,
         "estimated_product_l_for_area": round(produit_l, 2),
         "estimated_volume_l_for_area": round(bouillie_l, 2),
-        "treatment_product": format_treatment_product(treatment_product),
+        "treatment_product": list(rule.bullets),
         "configured": True,
-    }
\ No newline at end of file
+    }
+
+
+# ── Batch dosage (columnar, vectorized) ────────────────────────────────────────
+
+def _batch_arrays(
+    rule_set: RuleSet,
+    cnn_labels: Sequence[str],
+    modes: Sequence[str],
+    areas_m2: Sequence[float],
+    severities: Optional[Sequence[Optional[str]]],
+    safety_margin: float,
+    regions: Optional[Sequence[Optional[str]]],
+    stages: Optional[Sequence[Optional[str]]],
+) -> Dict[str, "np.ndarray"]:
+    import numpy as np
+
+    compiled = rule_set.arrays()
+    n = len(areas_m2)
+    columns = (cnn_labels, modes, severities, regions, stages)
+    if any(column is not None and len(column) != n for column in columns):
+        raise ValueError("cnn_labels, modes, areas_m2, severities, regions and stages must have the same length.")
+
+    def resolve(values: Iterable[Any], lookup) -> Iterator[Any]:
+        """Applies lookup once per distinct value."""
+        cache: Dict[Any, Any] = {}
+        for v in values:
+            yield cache[v] if v in cache else cache.setdefault(v, lookup(v))
+
+    rule_ids = compiled["ids"]
+
+    def rule_id(key: Tuple[Any, ...]) -> int:
+        rule = rule_set.lookup(resolve_label(key[0]), *key[1:])
+        return -1 if rule is None else rule_ids[rule.key]
+
+    if regions is None and stages is None:
+        keys = zip(cnn_labels, modes)
+    else:
+        keys = zip(cnn_labels, modes, regions if regions is not None else repeat(None),
+                   stages if stages is not None else repeat(None))
+    rule = np.fromiter(resolve(keys, rule_id), dtype=np.int64, count=n)
+
+    if severities is None:
+        mult = np.ones(n)
+    else:
+        multipliers = rule_set.severity_multipliers
+        mult = np.fromiter(
+            resolve(severities, lambda s: multipliers.get((s or "").strip().lower(), 1.0)),
+            dtype=np.float64, count=n,
+        )
+
+    known  = rule >= 0
+    safe   = np.where(known, rule, 0)
+    area   = np.asarray(areas_m2, dtype=np.float64)
+    kind   = np.where(known, compiled["kind"][safe], RULE_UNKNOWN).astype(np.int8)
+
+    # Same operation order as compute_dosage: results are bit-identical
+    fraction_ha = area / 10_000.0
+    dose_eff    = np.where(known, compiled["dose"][safe], np.nan) * mult
+    volume_ha   = np.where(known, compiled["volume"][safe], np.nan)
+
+    return {
+        "rule":                 rule,
+        "kind":                 kind,
+        "dose_l_ha":            dose_eff,
+        "volume_bouillie_l_ha": volume_ha,
+        "product_l":            dose_eff * fraction_ha * (1.0 + safety_margin),
+        "volume_l":             volume_ha * fraction_ha * (1.0 + safety_margin),
+    }
+
+
+def compute_dosage_arrays(
+    cnn_labels: Sequence[str],
+    modes: Sequence[str],
+    areas_m2: Sequence[float],
+    severities: Optional[Sequence[Optional[str]]] = None,
+    safety_margin: float = 0.10,
+    regions: Optional[Sequence[Optional[str]]] = None,
+    stages: Optional[Sequence[Optional[str]]] = None,
+) -> Dict[str, "np.ndarray"]:
+    """
+    Vectorized dosage over columnar inputs of equal length.
+
+    Labels, modes, regions, stages and severities are resolved once per
+    distinct value (same normalization and rule fallback as compute_dosage),
+    then every plot is computed in one NumPy pass.
+
+    Returns:
+        Dict of arrays (unrounded; NaN where compute_dosage returns None
+        or the plot has no rule):
+        rule, kind, dose_l_ha (effective), volume_bouillie_l_ha,
+        product_l, volume_l
+
+    Raises:
+        ValueError: If the input columns differ in length
+    """
+    return _batch_arrays(get_rule_set(), cnn_labels, modes, areas_m2, severities, safety_margin, regions, stages)
+
+
+def _round2(values: "np.ndarray") -> "np.ndarray":
+    """
+    Python's round(x, 2) on every element, vectorized.
+
+    np.round scales by 100 before rounding, so an element whose scaled value
+    lies within float error of a .5 tie may round the other way: those rare
+    elements (and huge magnitudes) are re-rounded with round() itself.
+    """
+    import numpy as np
+
+    scaled  = values * 100.0
+    rounded = np.round(scaled) / 100.0
+    with np.errstate(invalid="ignore"):
+        tie_distance = np.abs(scaled - np.floor(scaled) - 0.5)
+        risky = (tie_distance < 1e-6 + np.abs(scaled) * 1e-12) | (np.abs(values) > 1e13)
+    for i in np.flatnonzero(risky & np.isfinite(values)):
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+
+def compute_dosage_batch(
+    cnn_labels: Sequence[str],
+    modes: Sequence[str],
+    areas_m2: Sequence[float],
+    severities: Optional[Sequence[Optional[str]]] = None,
+    safety_margin: float = 0.10,
+    regions: Optional[Sequence[Optional[str]]] = None,
+    stages: Optional[Sequence[Optional[str]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Batch version of compute_dosage: result i equals
+    compute_dosage(cnn_labels[i], modes[i], areas_m2[i], severity=severities[i],
+    region=regions[i], stage=stages[i]).
+
+    Usage:
+        plans = compute_dosage_batch(df["label"], df["mode"], df["area_m2"], df["severity"])
+    """
+    rule_set = get_rule_set()
+    arrays   = _batch_arrays(rule_set, cnn_labels, modes, areas_m2, severities, safety_margin, regions, stages)
+    bullets  = rule_set.arrays()["bullets"]
+    areas    = areas_m2.tolist() if hasattr(areas_m2, "tolist") else list(areas_m2)
+
+    results: List[Dict[str, Any]] = []
+    for area, rule, kind, dose, volume_ha, product_l, volume_l in zip(
+        areas,
+        arrays["rule"].tolist(),
+        arrays["kind"].tolist(),
+        _round2(arrays["dose_l_ha"]).tolist(),
+        arrays["volume_bouillie_l_ha"].tolist(),
+        _round2(arrays["product_l"]).tolist(),
+        _round2(arrays["volume_l"]).tolist(),
+    ):
+        if kind == RULE_UNKNOWN:
+            results.append({})
+        elif kind == RULE_NO_TREATMENT:
+            results.append({
+                "area_m2": area,
+                "dose_l_ha": 0.0,
+                "volume_bouillie_l_ha": 0.0,
+                "estimated_product_l_for_area": 0.0,
+                "estimated_volume_l_for_area": 0.0,
+                "configured": True,
+                "note": "No treatment required for this disease/severity level.",
+            })
+        elif kind == RULE_NO_DOSE:
+            results.append({
+                "area_m2": area,
+                "dose_l_ha": None,
+                "volume_bouillie_l_ha": volume_ha,
+                "estimated_product_l_for_area": None,
+                "estimated_volume_l_for_area": volume_l,
+                "treatment_product": list(bullets[rule]),
+                "configured": False,
+                "note": "No dose configured for this label/mode. See treatment product recommendations.",
+            })
+        else:
+            results.append({
+                "area_m2": area,
+                "dose_l_ha": dose,
+                "volume_bouillie_l_ha": volume_ha,
+                "estimated_product_l_for_area": product_l,
+                "estimated_volume_l_for_area": volume_l,
+                "treatment_product": list(bullets[rule]),
+                "configured": True,
+            })
+    return results
@@ -0,0 +1,233 @@
+"""
+embeddings.py — Sentence embedding backends, selectable at runtime.
+
+Backends (EMBEDDING_BACKEND):
+- "torch" : SentenceTransformer on PyTorch (default, reference vectors)
+- "onnx"  : the same model exported to ONNX and run by onnxruntime on CPU,
+            optionally int8-quantized. Torch is never imported at query time,
+            which cuts worker RSS and cold-start time.
+
+Both backends expose the same `encode(text_or_texts)` → numpy array interface.
+
+Export the ONNX model once (requires torch + sentence-transformers):
+    python -m app.embeddings export models/all-MiniLM-L6-v2-onnx --quantize
+"""
+
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_ID,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_ONNX_QUANTIZED,
+)
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE      = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+ONNX_CONFIG_FILE     = "embedder.json"
+
+
+# ── ONNX backend ───────────────────────────────────────────────────────────────
+
+class OnnxEmbedder:
+    """
+    CPU embedder running an exported transformer with onnxruntime.
+    Reproduces the SentenceTransformer pipeline: tokenization, mean pooling
+    over the attention mask, then L2 normalization (if the model uses it).
+    """
+
+    def __init__(self, model_dir: Path, quantized: bool = False):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "The 'onnx' embedding backend requires onnxruntime and tokenizers."
+            ) from e
+
+        model_dir = Path(model_dir)
+        with open(model_dir / ONNX_CONFIG_FILE, encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        self.model_id  = self.config["model_id"]
+        self.normalize = bool(self.config.get("normalize", True))
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=int(self.config.get("max_length", 256)))
+        self.tokenizer.enable_padding(
+            pad_id=int(self.config.get("pad_token_id", 0)),
+            pad_token=self.config.get("pad_token", "[PAD]"),
+        )
+
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_dir / model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences: Union[str, Sequence[str]], **_: Any) -> np.ndarray:
+        """
+        Embeds one text (→ 1-D array) or a list of texts (→ 2-D array).
+        Extra keyword arguments of SentenceTransformer.encode are ignored.
+        """
+        single = isinstance(sentences, str)
+        texts  = [sentences] if single else list(sentences)
+
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids      = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        mask       = attention_mask[..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+
+        embeddings = embeddings.astype(np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def export_onnx_model(
+    out_dir: Path,
+    model_id: str = EMBEDDING_MODEL_ID,
+    quantize: bool = True,
+) -> Path:
+    """
+    Exports the transformer of a SentenceTransformer model to ONNX
+    (plus an int8 dynamically-quantized copy if `quantize`).
+
+    Returns:
+        The output directory
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    model       = SentenceTransformer(model_id, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer   = model.tokenizer
+    tokenizer.save_pretrained(str(out_dir))
+
+    dummy = tokenizer(["Treatment of grapevine downy mildew."], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    class TokenEmbeddings(torch.nn.Module):
+        """Keyword-only wrapper: forward signatures differ across transformers versions."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+            )[0]
+
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(transformer),
+            tuple(dummy[name] for name in input_names),
+            str(out_dir / ONNX_MODEL_FILE),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            str(out_dir / ONNX_MODEL_FILE),
+            str(out_dir / ONNX_INT8_MODEL_FILE),
+            weight_type=QuantType.QInt8,
+        )
+
+    normalize = any(type(module).__name__ == "Normalize" for module in model)
+    with open(out_dir / ONNX_CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "model_id":     model_id,
+            "max_length":   int(model.max_seq_length),
+            "normalize":    normalize,
+            "pooling":      "mean",
+            "pad_token":    tokenizer.pad_token,
+            "pad_token_id": int(tokenizer.pad_token_id),
+        }, f, indent=2)
+
+    return out_dir
+
+
+# ── Backend selection ──────────────────────────────────────────────────────────
+
+def load_embedder(backend: str = EMBEDDING_BACKEND):
+    """
+    Instantiates the embedding backend.
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    if backend == "onnx":
+        return OnnxEmbedder(Path(EMBEDDING_ONNX_DIR), quantized=EMBEDDING_ONNX_QUANTIZED)
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(EMBEDDING_MODEL_ID)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}' (expected 'torch' or 'onnx').")
+
+
+_EMBEDDER: Optional[Any] = None
+
+
+def get_embedder():
+    """
+    Returns the configured embedder, loaded once and reused.
+    """
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        _EMBEDDER = load_embedder()
+        logger.info(f"Embedder loaded (backend={EMBEDDING_BACKEND}).")
+    return _EMBEDDER
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Embedding backend utilities.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the model to ONNX")
+    export_parser.add_argument("path", nargs="?", default=EMBEDDING_ONNX_DIR)
+    export_parser.add_argument("--quantize", action="store_true", help="Also write an int8 model")
+
+    args = parser.parse_args(argv)
+    out_dir = export_onnx_model(Path(args.path), quantize=args.quantize)
+    print(f"[EMBEDDINGS] ONNX model exported to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
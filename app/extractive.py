@@ -0,0 +1,297 @@
+"""
+extractive.py — Treatment plans assembled from the knowledge sheets, without LLM.
+
+Each level-1 section of a knowledge sheet feeds one field of the plan
+(see SECTION_FIELDS):
+- Description and symptoms           → diagnostic
+- Treatment strategies — <mode>      → treatment_actions (that mode only)
+- Preventive measures                → preventive_actions
+- Safety and precautions, watch points → warnings
+
+Ingestion tags every chunk with its plan field and mode (chunk properties
+plan_field / plan_mode) and writes the extractive index
+(EXTRACTIVE_INDEX_PATH): the items of every field, per label and mode,
+extracted once. The request path only merges precomputed lists:
+- strategy=extractive on /solutions answers without calling the LLM
+- with EXTRACTIVE_FALLBACK, a failed LLM call (error, timeout, rate limit)
+  is answered with the extractive plan instead of a generic message
+
+Items from the retrieved chunks come first (in retrieval order); the index
+completes the fields they do not fully cover.
+
+Usage:
+    python -m app.extractive build          # rewrite the index from data/knowledge
+"""
+
+import argparse
+import json
+import logging
+import re
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple
+
+from app.config import EXTRACTIVE_INDEX_PATH, KNOWLEDGE_DIR, SUPPORTED_MODES
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+PLAN_FIELDS = ("diagnostic", "treatment_actions", "preventive_actions", "warnings")
+
+# Items kept per list field, and sentences kept for the diagnostic
+MAX_ITEMS_PER_FIELD  = 8
+DIAGNOSTIC_SENTENCES = 2
+
+# Plan items valid for every farming mode
+ANY_MODE = "*"
+
+# Section title pattern → plan field, first match wins ("" = not used in plans)
+SECTION_FIELDS: Tuple[Tuple[Pattern, str], ...] = (
+    (re.compile(r"no treatment", re.IGNORECASE),                      ""),
+    (re.compile(r"treatment strateg", re.IGNORECASE),                 "treatment_actions"),
+    (re.compile(r"preventive measures", re.IGNORECASE),               "preventive_actions"),
+    (re.compile(r"safety|precaution|watch points", re.IGNORECASE),    "warnings"),
+    (re.compile(r"description", re.IGNORECASE),                       "diagnostic"),
+)
+
+_BULLET_PATTERN   = re.compile(r"^([-*•→]|\d+[.)])\s+")
+_EMPHASIS_PATTERN = re.compile(r"\*{1,2}([^*]+)\*{1,2}")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+# Bullets of at most this many words under an "Intro:" line are merged into
+# one item ("Final choice depends on: grape variety, plot history, ...")
+_SHORT_BULLET_WORDS = 4
+
+
+# ── Section → field index ──────────────────────────────────────────────────────
+
+@lru_cache(maxsize=256)
+def section_plan_field(section_title: str) -> Tuple[str, str]:
+    """
+    Returns:
+        (plan field, farming mode or ANY_MODE) fed by a section,
+        ("", "") if the section is not used in plans
+    """
+    title = (section_title or "").lower()
+    for pattern, field in SECTION_FIELDS:
+        if pattern.search(title):
+            if not field:
+                break
+            mode = next((m for m in SUPPORTED_MODES if m in title), ANY_MODE)
+            return field, mode
+    return "", ""
+
+
+# ── Item extraction ────────────────────────────────────────────────────────────
+
+def _clean(text: str) -> str:
+    """Markdown-free sentence: emphasis removed, capitalized, final period."""
+    text = _EMPHASIS_PATTERN.sub(r"\1", text)
+    text = " ".join(text.replace("→", "-").split()).strip(" -")
+    if not text:
+        return ""
+    text = text[0].upper() + text[1:]
+    return text if text[-1] in ".!?" else text + "."
+
+
+def _body(text: str, section_title: str) -> str:
+    """Chunk text without its heading paragraph (see ingestion.chunk_section)."""
+    if section_title and text.startswith(section_title):
+        _, _, rest = text.partition("\n\n")
+        return rest
+    return text
+
+
+def extract_list_items(text: str) -> List[str]:
+    """
+    Action items of a section body: one per bullet, or one per bullet group
+    when the bullets are short fragments completing an "Intro:" line.
+    """
+    items: List[str] = []
+    intro: Optional[str] = None
+    nested = False          # intro is itself a bullet ("- do not confuse:")
+    group: List[str] = []
+
+    def flush():
+        if not group:
+            return
+        if intro and (nested or all(len(b.split()) <= _SHORT_BULLET_WORDS for b in group)):
+            fragments = [_EMPHASIS_PATTERN.sub(r"\1", b).strip().rstrip(".") for b in group]
+            items.append(_clean(f"{intro} {', '.join(fragments)}"))
+        else:
+            items.extend(_clean(b) for b in group)
+        group.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        match = _BULLET_PATTERN.match(stripped)
+        if match and not stripped.endswith(":"):
+            group.append(stripped[match.end():])
+            continue
+        flush()
+        nested = bool(match)
+        intro  = (stripped[match.end():] if match else stripped) if stripped.endswith(":") else None
+    flush()
+    return [item for item in items if item]
+
+
+def extract_sentences(text: str) -> List[str]:
+    """Prose sentences of a section body (bullets, intros and bold labels skipped)."""
+    sentences: List[str] = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if (not stripped or _BULLET_PATTERN.match(stripped) or stripped.endswith(":")
+                or (stripped.startswith("**") and stripped.endswith("**"))):
+            continue
+        sentences.extend(_clean(s) for s in _SENTENCE_PATTERN.split(stripped) if s.strip())
+    return [s for s in sentences if s]
+
+
+def _extract(field: str, text: str) -> List[str]:
+    return extract_sentences(text) if field == "diagnostic" else extract_list_items(text)
+
+
+def _merge(*sources: Iterable[str], limit: Optional[int] = None) -> List[str]:
+    """Concatenates item lists in order, without duplicates, up to `limit` items."""
+    merged: List[str] = []
+    seen = set()
+    for source in sources:
+        for item in source:
+            key = item.lower()
+            if key not in seen:
+                seen.add(key)
+                merged.append(item)
+                if len(merged) == limit:
+                    return merged
+    return merged
+
+
+# ── Index (built at ingestion) ─────────────────────────────────────────────────
+
+def build_extractive_index(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Builds the extractive index from ingestion chunks (see
+    ingestion.build_chunk_objects): label → field → mode → items.
+    Overlapping sub-chunks of a section yield each item once.
+    """
+    labels: Dict[str, Dict[str, Any]] = {}
+    for chunk in chunks:
+        label = chunk.get("cnn_label")
+        field = chunk.get("plan_field")
+        if not label or not field:
+            continue
+        entry = labels.setdefault(label, {"disease_name": chunk.get("disease_name") or label})
+        items = entry.setdefault(field, {}).setdefault(chunk.get("plan_mode") or ANY_MODE, [])
+        body  = _body(chunk.get("text", ""), chunk.get("section", ""))
+        items[:] = _merge(items, _extract(field, body))
+    return {"format_version": INDEX_FORMAT_VERSION, "labels": labels}
+
+
+def build_index_from_knowledge(knowledge_dir: Path = Path(KNOWLEDGE_DIR)) -> Dict[str, Any]:
+    """Chunks the knowledge sheets like ingestion does, then builds the index."""
+    from app.ingestion import build_chunk_objects, load_markdown_files
+
+    return build_extractive_index(build_chunk_objects(load_markdown_files(Path(knowledge_dir))))
+
+
+def write_extractive_index(index: Dict[str, Any], path: Path = Path(EXTRACTIVE_INDEX_PATH)) -> Path:
+    path = Path(path).resolve()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(index, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    return path
+
+
+_INDEX: Optional[Dict[str, Any]] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_extractive_index() -> Dict[str, Any]:
+    """
+    The index written at ingestion (EXTRACTIVE_INDEX_PATH), loaded once.
+    If the file is missing or unreadable, it is rebuilt in memory from the
+    knowledge sheets.
+    """
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                try:
+                    index = json.loads(Path(EXTRACTIVE_INDEX_PATH).read_text(encoding="utf-8"))
+                    if index.get("format_version") != INDEX_FORMAT_VERSION:
+                        raise ValueError(f"format version {index.get('format_version')}")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Extractive index unavailable ({e}), rebuilding it from {KNOWLEDGE_DIR}")
+                    index = build_index_from_knowledge()
+                _INDEX = index
+    return _INDEX
+
+
+# ── Plan assembly (request path) ───────────────────────────────────────────────
+
+def build_extractive_plan(
+    cnn_label: str,
+    mode: str,
+    severity: str,
+    chunks: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Assembles a structured plan from the retrieved chunks and the index.
+
+    Args:
+        cnn_label: Disease label
+        mode:      Farming mode (mode-specific treatment sections only)
+        severity:  Severity level, reported in the diagnostic
+        chunks:    Retrieved chunks (optional), used first
+
+    Returns:
+        Dict with keys: diagnostic, treatment_actions, preventive_actions, warnings
+        (same shape as parse_llm_structured_response)
+    """
+    entry = get_extractive_index()["labels"].get(cnn_label, {})
+
+    retrieved: Dict[str, List[str]] = {field: [] for field in PLAN_FIELDS}
+    for chunk in chunks or []:
+        if chunk.get("cnn_label") not in (None, "", cnn_label):
+            continue
+        field, chunk_mode = chunk.get("plan_field"), chunk.get("plan_mode")
+        if field is None:
+            # Collections indexed before plan fields were stored
+            field, chunk_mode = section_plan_field(chunk.get("section", ""))
+        if field and chunk_mode in (mode, ANY_MODE):
+            retrieved[field].extend(_extract(field, _body(chunk.get("text", ""), chunk.get("section", ""))))
+
+    def items(field: str, limit: int) -> List[str]:
+        indexed = entry.get(field, {})
+        return _merge(retrieved[field], indexed.get(mode, []), indexed.get(ANY_MODE, []), limit=limit)
+
+    disease_name = entry.get("disease_name", cnn_label)
+    description  = " ".join(items("diagnostic", DIAGNOSTIC_SENTENCES))
+    return {
+        "diagnostic":        f"{disease_name} — reported severity: {severity}. {description}".strip(),
+        "treatment_actions":  items("treatment_actions", MAX_ITEMS_PER_FIELD),
+        "preventive_actions": items("preventive_actions", MAX_ITEMS_PER_FIELD),
+        "warnings":           items("warnings", MAX_ITEMS_PER_FIELD),
+    }
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build the extractive plan index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Rebuild the index from the knowledge sheets")
+    build_parser.add_argument("path", nargs="?", default=EXTRACTIVE_INDEX_PATH)
+
+    args  = parser.parse_args(argv)
+    index = build_index_from_knowledge()
+    path  = write_extractive_index(index, Path(args.path))
+    print(f"[EXTRACTIVE] Index of {len(index['labels'])} labels written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+health.py — Background component health monitor.
+
+A daemon thread probes the components every HEALTH_PROBE_INTERVAL_S seconds:
+- Weaviate : readiness call on the shared client (is_ready)
+- LLM      : GET on the router's /models endpoint (reachability + auth);
+             always ok for the in-process local / stub generation backends
+
+Results are cached with timestamps and a short latency history. The request
+path (rag_pipeline) and GET /health only read this cached state — O(1),
+no environment parsing, filesystem stat or network call per request.
+
+Statuses:
+- weaviate : unknown (not probed yet) | ok | down | fallback (not configured)
+- llm      : unknown | ok | unreachable | not_configured
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.config import (
+    GENERATION_BACKEND,
+    HEALTH_HISTORY_SIZE,
+    HEALTH_PROBE_TIMEOUT_S,
+    HF_API_URL,
+    HF_TOKEN,
+    LLM_BACKENDS,
+)
+
+logger = logging.getLogger(__name__)
+
+_STATE: Dict[str, Dict[str, Any]] = {
+    "weaviate": {"status": "unknown", "message": "Not probed yet", "checked_at": None, "latency_ms": None},
+    "llm":      {"status": "unknown", "message": "Not probed yet", "checked_at": None, "latency_ms": None},
+}
+_HISTORY: Dict[str, Deque[Dict[str, Any]]] = {
+    name: deque(maxlen=HEALTH_HISTORY_SIZE) for name in _STATE
+}
+_LOCK = threading.Lock()
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+
+
+# ── Static configuration checks (computed once) ────────────────────────────────
+
+@lru_cache(maxsize=1)
+def weaviate_configured() -> bool:
+    """
+    Whether Weaviate is configured for this deployment (see weaviate_available).
+    Environment and filesystem are only inspected once per process.
+    """
+    from app.weaviate_client import weaviate_available
+
+    return weaviate_available()
+
+
+def llm_configured() -> bool:
+    """In-process generation backends (local / stub) need no token."""
+    return GENERATION_BACKEND != "http" or bool(HF_TOKEN and HF_TOKEN.strip())
+
+
+# ── Probes ─────────────────────────────────────────────────────────────────────
+
+def probe_weaviate() -> Tuple[str, str]:
+    """
+    Checks that the Weaviate instance answers its readiness endpoint.
+
+    Returns:
+        Tuple (status, message)
+    """
+    if not weaviate_configured():
+        return "fallback", "Unavailable — using static responses"
+
+    from app.weaviate_client import get_shared_client
+
+    try:
+        if get_shared_client().is_ready():
+            return "ok", "Connected"
+        return "down", "Instance reachable but not ready"
+    except Exception as e:
+        return "down", f"Unreachable: {e}"
+
+
+def _llm_models_url() -> str:
+    """
+    OpenAI-compatible routers expose GET /models next to /chat/completions
+    (the first configured backend is probed, see app.llm_client).
+    """
+    url  = LLM_BACKENDS[0].partition("|")[0].strip() if LLM_BACKENDS else HF_API_URL
+    base = url.rsplit("/chat/completions", 1)[0]
+    return f"{base}/models"
+
+
+def probe_llm() -> Tuple[str, str]:
+    """
+    Checks that the LLM router is reachable and accepts the token.
+
+    Returns:
+        Tuple (status, message)
+    """
+    if not llm_configured():
+        return "not_configured", "HF_TOKEN missing"
+    if GENERATION_BACKEND != "http":
+        return "ok", f"In-process '{GENERATION_BACKEND}' generation backend"
+
+    import requests
+
+    try:
+        response = requests.get(
+            _llm_models_url(),
+            headers={"Authorization": f"Bearer {HF_TOKEN}"},
+            timeout=HEALTH_PROBE_TIMEOUT_S,
+        )
+    except Exception as e:
+        return "unreachable", f"Unreachable: {e}"
+
+    if response.status_code == 200:
+        return "ok", "Router reachable, HF_TOKEN accepted"
+    return "unreachable", f"Router answered HTTP {response.status_code}"
+
+
+PROBES = {
+    "weaviate": probe_weaviate,
+    "llm":      probe_llm,
+}
+
+
+def _record(name: str, status: str, message: str, latency_ms: float) -> None:
+    checked_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    with _LOCK:
+        _STATE[name] = {
+            "status":     status,
+            "message":    message,
+            "checked_at": checked_at,
+            "latency_ms": latency_ms,
+        }
+        _HISTORY[name].append({
+            "checked_at": checked_at,
+            "status":     status,
+            "latency_ms": latency_ms,
+        })
+
+
+def run_probes() -> Dict[str, Dict[str, Any]]:
+    """Probes every component once and caches the results."""
+    for name, probe in PROBES.items():
+        t0 = time.perf_counter()
+        try:
+            status, message = probe()
+        except Exception as e:
+            status, message = "down", f"Probe failed: {e}"
+        _record(name, status, message, round((time.perf_counter() - t0) * 1000, 1))
+    return get_component_health()
+
+
+# ── Background monitor ─────────────────────────────────────────────────────────
+
+def _monitor_loop(interval_s: float) -> None:
+    while not _STOP.is_set():
+        run_probes()
+        _STOP.wait(interval_s)
+
+
+def start_health_monitor(interval_s: float) -> Optional[threading.Thread]:
+    """
+    Starts the background probing thread (no-op if interval_s <= 0:
+    components then keep their configuration-based status).
+    """
+    global _THREAD
+    if interval_s <= 0 or (_THREAD is not None and _THREAD.is_alive()):
+        return _THREAD
+    _STOP.clear()
+    _THREAD = threading.Thread(
+        target=_monitor_loop, args=(interval_s,), name="health-monitor", daemon=True,
+    )
+    _THREAD.start()
+    return _THREAD
+
+
+def stop_health_monitor() -> None:
+    global _THREAD
+    _STOP.set()
+    if _THREAD is not None:
+        _THREAD.join(timeout=HEALTH_PROBE_TIMEOUT_S)
+        _THREAD = None
+
+
+# ── Cached reads (request path) ────────────────────────────────────────────────
+
+def weaviate_usable() -> bool:
+    """
+    O(1) check used by the request path: Weaviate is configured and the last
+    probe did not find it down. Before the first probe, it is assumed up.
+    """
+    return weaviate_configured() and _STATE["weaviate"]["status"] != "down"
+
+
+def get_component_health() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the cached state of every component, with its probe history.
+    Components never probed report their configuration-based status.
+    """
+    with _LOCK:
+        components = {
+            name: {**state, "history": list(_HISTORY[name])}
+            for name, state in _STATE.items()
+        }
+
+    weaviate = components["weaviate"]
+    if weaviate["status"] == "unknown" and not weaviate_configured():
+        weaviate.update(status="fallback", message="Unavailable — using static responses")
+
+    llm = components["llm"]
+    if llm["status"] == "unknown":
+        if GENERATION_BACKEND != "http":
+            llm.update(status="ok", message=f"In-process '{GENERATION_BACKEND}' generation backend")
+        elif llm_configured():
+            llm["message"] = "HF_TOKEN configured (not probed yet)"
+        else:
+            llm.update(status="not_configured", message="HF_TOKEN missing")
+
+    return components
@@ -1,20 +1,40 @@
 """
 ingestion.py — Loads markdown knowledge files and indexes them into Weaviate.
 Run this script once before starting the API to populate the knowledge base.
+
+Re-indexing is blue/green: chunks are written into a new versioned collection
+(VitiScanKnowledge_v{N}), validated, then the VitiScanKnowledge alias read by
+the API is atomically repointed to it. Older versions are garbage-collected.
 """
 
 import json
 import re
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Set
 
 import frontmatter
 import weaviate
 import weaviate.classes as wvc
 
+from app.config import (
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_PROPERTIES,
+    KNOWLEDGE_COLLECTION,
+    KNOWLEDGE_KEEP_VERSIONS,
+)
+from app.extractive import build_extractive_index, section_plan_field, write_extractive_index
+from app.tokens import count_tokens
 from app.weaviate_client import weaviate_client, get_embedder
 
-COLLECTION_NAME = "VitiScanKnowledge"
+COLLECTION_NAME = KNOWLEDGE_COLLECTION
+
+_VERSION_PATTERN = re.compile(rf"^{re.escape(COLLECTION_NAME)}_v(\d+)$")
+
+# ── Chunking patterns ──
+_SUBHEADING_PATTERN = re.compile(r"^#{2,3}\s+(.*)")
+_BULLET_PATTERN     = re.compile(r"^([-*•→]|\d+[.)])\s+")
+_RULE_PATTERN       = re.compile(r"^(-{3,}|\*{3,}|_{3,})$")
 
 
 def load_markdown_files(knowledge_dir: Path) -> List[Dict[str, Any]]:
@@ -74,65 +94,386 @@ def split_markdown_sections(content: str) -> List[Dict[str, str]]:
     return sections
 
 
-def ensure_collection(client: weaviate.WeaviateClient):
+def split_section_blocks(text: str) -> List[Dict[str, str]]:
+    """
+    Splits the body of a level-1 section into logical blocks:
+    - '## ' / '### ' subheadings open a new subsection
+    - bullet / numbered lines are kept together as one group,
+      with the introductory line written just above them
+    - other paragraphs are separated by blank lines
+    - horizontal rules ('---') are dropped
+
+    Returns:
+        List of dicts with keys: subsection, text
+    """
+    blocks: List[Dict[str, str]] = []
+    subsection = ""
+    current_lines: List[str] = []
+    in_list = False
+
+    def flush():
+        body = "\n".join(current_lines).strip()
+        if body:
+            blocks.append({"subsection": subsection, "text": body})
+        current_lines.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+
+        if not stripped or _RULE_PATTERN.match(stripped):
+            flush()
+            in_list = False
+            continue
+
+        heading_match = _SUBHEADING_PATTERN.match(stripped)
+        if heading_match:
+            flush()
+            in_list = False
+            subsection = heading_match.group(1).strip()
+            continue
+
+        is_bullet = bool(_BULLET_PATTERN.match(stripped))
+        # A plain line right after a bullet group closes that group
+        if in_list and not is_bullet and not line[:1].isspace():
+            flush()
+        in_list = is_bullet
+        current_lines.append(line.rstrip())
+
+    flush()
+    return blocks
+
+
+def _split_oversized_block(text: str, max_tokens: int, overlap_tokens: int) -> List[str]:
+    """
+    Splits a block larger than max_tokens into pieces that fit the window:
+    lines are grouped greedily (consecutive groups share their trailing lines),
+    and a single line longer than the window is cut into overlapping word windows.
+    """
+    pieces: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for line in text.splitlines():
+        line_tokens = count_tokens(line)
+
+        if line_tokens > max_tokens:
+            if current:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            words = line.split()
+            step  = max(1, max_tokens - overlap_tokens)
+            start = 0
+            while start < len(words):
+                window = words[start:start + max_tokens]
+                # Punctuation counts as tokens too: shrink until the window fits
+                while len(window) > 1 and count_tokens(" ".join(window)) > max_tokens:
+                    window = window[:-1]
+                pieces.append(" ".join(window))
+                if start + len(window) >= len(words):
+                    break
+                start += min(step, len(window))
+            continue
+
+        if current and current_tokens + line_tokens > max_tokens:
+            piece = "\n".join(current)
+            pieces.append(piece)
+            tail = _overlap_tail(piece, overlap_tokens)
+            tail_tokens = count_tokens(tail)
+            if tail and tail_tokens + line_tokens <= max_tokens:
+                current, current_tokens = [tail], tail_tokens
+            else:
+                current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _overlap_tail(text: str, overlap_tokens: int) -> str:
+    """
+    Returns the trailing lines of a window whose token count stays
+    within overlap_tokens (empty string if overlap is disabled).
+    """
+    if overlap_tokens <= 0:
+        return ""
+
+    tail: List[str] = []
+    tail_tokens = 0
+    for line in reversed([l for l in text.splitlines() if l.strip()]):
+        line_tokens = count_tokens(line)
+        if tail_tokens + line_tokens > overlap_tokens:
+            break
+        tail.insert(0, line)
+        tail_tokens += line_tokens
+    return "\n".join(tail)
+
+
+def chunk_section(
+    section_title: str,
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Dict[str, Any]]:
+    """
+    Splits one level-1 section into sub-chunks bounded by a token window.
+
+    - Subheadings ('## ', '### ') always start a new sub-chunk
+    - Blocks (paragraphs, bullet groups) are packed together up to max_tokens
+    - Consecutive sub-chunks of the same subsection share up to
+      overlap_tokens tokens (trailing lines of the previous window)
+
+    Args:
+        section_title:  Parent level-1 section title
+        text:           Section body (without the heading line)
+        max_tokens:     Token window per sub-chunk (heading included)
+        overlap_tokens: Tokens repeated between consecutive sub-chunks
+
+    Returns:
+        List of dicts with keys: section_title, subsection, text, token_count, chunk_index
+    """
+    # Group blocks by subsection, keeping document order
+    groups: List[Dict[str, Any]] = []
+    for block in split_section_blocks(text):
+        if not groups or groups[-1]["subsection"] != block["subsection"]:
+            groups.append({"subsection": block["subsection"], "blocks": []})
+        groups[-1]["blocks"].append(block["text"])
+
+    chunks: List[Dict[str, Any]] = []
+
+    for group in groups:
+        subsection = group["subsection"]
+        heading    = f"{section_title} — {subsection}" if subsection else section_title
+        budget     = max(1, max_tokens - count_tokens(heading))
+        overlap    = min(overlap_tokens, budget // 2)
+
+        pieces: List[str] = []
+        for block in group["blocks"]:
+            if count_tokens(block) > budget:
+                pieces.extend(_split_oversized_block(block, budget, overlap))
+            else:
+                pieces.append(block)
+
+        windows: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+
+        for piece in pieces:
+            piece_tokens = count_tokens(piece)
+            if current and current_tokens + piece_tokens > budget:
+                window = "\n\n".join(current)
+                windows.append(window)
+                tail = _overlap_tail(window, overlap)
+                tail_tokens = count_tokens(tail)
+                if tail and tail_tokens + piece_tokens <= budget:
+                    current, current_tokens = [tail], tail_tokens
+                else:
+                    current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+
+        if current:
+            windows.append("\n\n".join(current))
+
+        for window in windows:
+            full_text = f"{heading}\n\n{window}".strip()
+            chunks.append({
+                "section_title": section_title,
+                "subsection":    subsection,
+                "text":          full_text,
+                "token_count":   count_tokens(full_text),
+                "chunk_index":   len(chunks),
+            })
+
+    return chunks
+
+
+# ── Versioned collections ──────────────────────────────────────────────────────
+
+def versioned_collection_name(version: int) -> str:
+    """Returns the physical collection name for a knowledge base version."""
+    return f"{COLLECTION_NAME}_v{version}"
+
+
+def parse_collection_version(name: str) -> Optional[int]:
+    """
+    Extracts N from a 'VitiScanKnowledge_v{N}' collection name.
+
+    Returns:
+        Version number, or None if the name is not a versioned collection
     """
-    Creates the VitiScanKnowledge collection if it does not already exist.
+    match = _VERSION_PATTERN.match(name or "")
+    return int(match.group(1)) if match else None
+
+
+def list_collection_versions(client: weaviate.WeaviateClient) -> List[int]:
+    """Returns the sorted list of existing knowledge base versions."""
+    versions = []
+    for name in client.collections.list_all(simple=True):
+        version = parse_collection_version(name)
+        if version is not None:
+            versions.append(version)
+    return sorted(versions)
+
+
+def get_alias_target(client: weaviate.WeaviateClient) -> Optional[str]:
+    """Returns the collection currently served by the alias, or None."""
+    alias = client.alias.get(alias_name=COLLECTION_NAME)
+    return alias.collection if alias else None
+
+
+def versions_to_delete(versions: List[int], live_version: Optional[int], keep: int) -> List[int]:
+    """
+    Selects old versions to garbage-collect.
+    The newest `keep` versions and the live version are always preserved.
+    """
+    keep   = max(1, keep)
+    newest = set(sorted(versions)[-keep:])
+    return [v for v in sorted(versions) if v not in newest and v != live_version]
+
+
+def create_collection(client: weaviate.WeaviateClient, name: str):
+    """
+    Creates a knowledge collection with the VitiScanKnowledge schema.
     Vectors are self-provided (embeddings computed locally).
     """
-    collections = client.collections
-    try:
-        coll = collections.get(COLLECTION_NAME)
-        _ = coll.config.get()
-        return coll
-    except Exception:
-        coll = collections.create(
-            name=COLLECTION_NAME,
-            vector_config=wvc.config.Configure.Vectors.self_provided(),
-            properties=[
-                wvc.config.Property(
-                    name="text",
-                    data_type=wvc.config.DataType.TEXT,
-                ),
-                wvc.config.Property(
-                    name="section",
-                    data_type=wvc.config.DataType.TEXT,
-                ),
-                wvc.config.Property(
-                    name="disease_id",
-                    data_type=wvc.config.DataType.TEXT,
-                ),
-                wvc.config.Property(
-                    name="cnn_label",
-                    data_type=wvc.config.DataType.TEXT,
-                ),
-                wvc.config.Property(
-                    name="disease_name",
-                    data_type=wvc.config.DataType.TEXT,
-                ),
-                wvc.config.Property(
-                    name="type",
-                    data_type=wvc.config.DataType.TEXT,
-                ),
-                wvc.config.Property(
-                    name="category",
-                    data_type=wvc.config.DataType.TEXT,
-                ),
-                wvc.config.Property(
-                    name="farming_mode",
-                    data_type=wvc.config.DataType.TEXT,
-                ),
-            ],
+    return client.collections.create(
+        name=name,
+        vector_config=wvc.config.Configure.Vectors.self_provided(),
+        properties=[
+            wvc.config.Property(
+                name="text",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="section",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="disease_id",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="cnn_label",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="disease_name",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="type",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="category",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="farming_mode",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="subsection",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="chunk_index",
+                data_type=wvc.config.DataType.INT,
+            ),
+            wvc.config.Property(
+                name="token_count",
+                data_type=wvc.config.DataType.INT,
+            ),
+            wvc.config.Property(
+                name="plan_field",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+            wvc.config.Property(
+                name="plan_mode",
+                data_type=wvc.config.DataType.TEXT,
+            ),
+        ],
+    )
+
+
+def validate_collection(collection, expected_count: int, expected_labels: Set[str]) -> None:
+    """
+    Checks a freshly built collection before it goes live:
+    - object count matches the number of chunks sent
+    - every disease label that was sent is retrievable
+
+    Raises:
+        RuntimeError: If the collection is incomplete
+    """
+    total = collection.aggregate.over_all(total_count=True).total_count
+    if total != expected_count:
+        raise RuntimeError(
+            f"Collection {collection.name} holds {total} objects, expected {expected_count}."
+        )
+
+    for label in sorted(expected_labels):
+        response = collection.query.fetch_objects(
+            limit=1,
+            filters=wvc.query.Filter.by_property("cnn_label").equal(label),
         )
-        return coll
+        if not response.objects:
+            raise RuntimeError(f"Collection {collection.name} has no chunk for '{label}'.")
+
+
+def swap_alias(client: weaviate.WeaviateClient, target: str) -> None:
+    """
+    Atomically points the VitiScanKnowledge alias to `target`.
+
+    A pre-alias deployment has a real collection named VitiScanKnowledge:
+    it is dropped once, just before the alias is created in its place.
+    """
+    if client.alias.exists(alias_name=COLLECTION_NAME):
+        client.alias.update(alias_name=COLLECTION_NAME, new_target_collection=target)
+        return
+
+    if client.collections.exists(COLLECTION_NAME):
+        print(f"[INGESTION] Migrating legacy collection {COLLECTION_NAME} to an alias...")
+        client.collections.delete(COLLECTION_NAME)
+
+    client.alias.create(alias_name=COLLECTION_NAME, target_collection=target)
 
 
-def build_chunk_objects(fiches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def garbage_collect_versions(client: weaviate.WeaviateClient, keep: int = KNOWLEDGE_KEEP_VERSIONS) -> List[str]:
+    """
+    Deletes old versioned collections, keeping the `keep` newest ones
+    and whichever version the alias currently serves.
+
+    Returns:
+        Names of the deleted collections
+    """
+    live_version = parse_collection_version(get_alias_target(client) or "")
+    deleted = []
+    for version in versions_to_delete(list_collection_versions(client), live_version, keep):
+        name = versioned_collection_name(version)
+        client.collections.delete(name)
+        deleted.append(name)
+    return deleted
+
+
+def build_chunk_objects(
+    fiches: List[Dict[str, Any]],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Dict[str, Any]]:
     """
     Transforms markdown fiches into a list of chunks ready for indexing.
+    Each level-1 section is split into token-bounded sub-chunks (see chunk_section).
 
     Each chunk contains:
-    - text: full chunk text (section title + content)
-    - section: section name
+    - text: sub-chunk text (section title [— subsection] + content)
+    - section: parent level-1 section name
+    - subsection: '##' / '###' subheading the sub-chunk belongs to ('' if none)
+    - chunk_index: position of the sub-chunk inside its parent section
+    - token_count: approximate token count of text (precomputed at ingestion)
+    - plan_field, plan_mode: plan field fed by the section and its farming
+      mode ('' if unused), for extractive plans (see app.extractive)
     - disease_id, cnn_label, disease_name, type, category, farming_mode: from frontmatter
     """
     all_chunks: List[Dict[str, Any]] = []
@@ -153,59 +494,99 @@ def build_chunk_objects(fiches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         farming_mode_str = ", ".join(farming_mode)
 
         for section in sections:
-            full_text = f"{section['section_title']}\n\n{section['text']}".strip()
-
-            all_chunks.append({
-                "text":         full_text,
-                "section":      section["section_title"],
-                "disease_id":   disease_id,
-                "cnn_label":    cnn_label,
-                "disease_name": disease_name,
-                "type":         disease_type,
-                "category":     category,
-                "farming_mode": farming_mode_str,
-            })
+            plan_field, plan_mode = section_plan_field(section["section_title"])
+            sub_chunks = chunk_section(
+                section["section_title"],
+                section["text"],
+                max_tokens=max_tokens,
+                overlap_tokens=overlap_tokens,
+            )
+
+            for sub_chunk in sub_chunks:
+                all_chunks.append({
+                    "text":         sub_chunk["text"],
+                    "section":      section["section_title"],
+                    "subsection":   sub_chunk["subsection"],
+                    "chunk_index":  sub_chunk["chunk_index"],
+                    "token_count":  sub_chunk["token_count"],
+                    "disease_id":   disease_id,
+                    "cnn_label":    cnn_label,
+                    "disease_name": disease_name,
+                    "type":         disease_type,
+                    "category":     category,
+                    "farming_mode": farming_mode_str,
+                    "plan_field":   plan_field,
+                    "plan_mode":    plan_mode,
+                })
 
     return all_chunks
 
 
-def ingest_chunks_into_weaviate(chunks: List[Dict[str, Any]]):
+def ingest_chunks_into_weaviate(
+    chunks: List[Dict[str, Any]],
+    vectors: Optional[Sequence[Sequence[float]]] = None,
+) -> str:
     """
-    Sends all chunks into Weaviate with SentenceTransformer embeddings.
+    Sends all chunks into a new versioned collection with SentenceTransformer
+    embeddings, validates it, then repoints the alias read by the API.
     Uses the weaviate_client() context manager to open/close the connection.
+
+    If `vectors` is given (e.g. loaded from a snapshot, see app.snapshot),
+    they are used as-is and the embedder is never loaded.
+
+    The live collection is never written to: if the import or the validation
+    fails, the new version is dropped and the alias keeps serving the old one.
+
+    Returns:
+        Name of the collection now served by the alias
     """
     with weaviate_client() as client:
-        collection = ensure_collection(client)
-        embedder   = get_embedder()
-
-        print(f"[INGESTION] Indexing {len(chunks)} chunks...")
-
-        with collection.batch.dynamic() as batch:
-            for idx, chunk in enumerate(chunks, start=1):
-                vector = embedder.encode(chunk["text"]).tolist()
-
-                batch.add_object(
-                    properties={
-                        "text":         chunk["text"],
-                        "section":      chunk["section"],
-                        "disease_id":   chunk["disease_id"],
-                        "cnn_label":    chunk["cnn_label"],
-                        "disease_name": chunk["disease_name"],
-                        "type":         chunk["type"],
-                        "category":     chunk["category"],
-                        "farming_mode": chunk["farming_mode"],
-                    },
-                    vector=vector,
-                )
-
-                if idx % 20 == 0:
-                    print(f"[INGESTION] {idx} chunks sent...")
+        versions = list_collection_versions(client)
+        target   = versioned_collection_name((versions[-1] if versions else 0) + 1)
+        collection = create_collection(client, target)
+        embedder   = get_embedder() if vectors is None else None
+
+        print(f"[INGESTION] Indexing {len(chunks)} chunks into {target}...")
+
+        try:
+            with collection.batch.dynamic() as batch:
+                for idx, chunk in enumerate(chunks, start=1):
+                    if vectors is None:
+                        vector = embedder.encode(chunk["text"]).tolist()
+                    else:
+                        vector = [float(x) for x in vectors[idx - 1]]
+
+                    batch.add_object(
+                        properties={name: chunk.get(name) for name in CHUNK_PROPERTIES},
+                        vector=vector,
+                    )
+
+                    if idx % 20 == 0:
+                        print(f"[INGESTION] {idx} chunks sent...")
 
             if batch.number_errors > 0:
-                print(f"[INGESTION] Errors during import: {batch.number_errors}")
                 print(batch.failed_objects)
+                raise RuntimeError(f"{batch.number_errors} errors during import.")
+
+            validate_collection(
+                collection,
+                expected_count=len(chunks),
+                expected_labels={c["cnn_label"] for c in chunks if c["cnn_label"]},
+            )
+
+        except Exception:
+            print(f"[INGESTION] Import into {target} failed — dropping it, alias unchanged.")
+            client.collections.delete(target)
+            raise
+
+        swap_alias(client, target)
+        print(f"[INGESTION] Alias {COLLECTION_NAME} now points to {target}.")
+
+        for name in garbage_collect_versions(client):
+            print(f"[INGESTION] Deleted old version {name}.")
 
         print("[INGESTION] Import complete.")
+        return target
 
 
 def main():
@@ -223,6 +604,9 @@ def main():
     if chunks:
         print(json.dumps(chunks[0], indent=2, ensure_ascii=False))
 
+    index_path = write_extractive_index(build_extractive_index(chunks))
+    print(f"[INGESTION] Extractive plan index written to {index_path}")
+
     ingest_chunks_into_weaviate(chunks)
 
 
@@ -1,13 +1,86 @@
 """
-llm_client.py — LLM client for HuggingFace Inference API (OpenAI-compatible router).
+llm_client.py — LLM client: text generation behind one call_llm() entry point.
+
+Generation backends (GENERATION_BACKEND):
+- "http"  : OpenAI-compatible chat-completions endpoints (HuggingFace router
+            by default), with routing and hedging (below)
+- "local" : a small causal LM run in process on CPU with transformers, for
+            on-premise / air-gapped installs (no per-request network hop)
+- "stub"  : deterministic stand-in returning a canned valid plan after
+            STUB_LLM_DELAY_S, so load tests and benchmarks run the full
+            generate_treatment_advice path without any outside service
+
+All backends expose the same `generate(prompt, ...)` → LLMResult interface.
+
+Several HTTP backends can be configured (LLM_BACKENDS: other providers, or other
+models of the same router). Each call is routed by the latency and error
+rate observed so far:
+- every backend keeps an EWMA of its successful call latency, an EWMA of
+  its error rate and a window of recent latencies (for its p95)
+- a call goes to the best score (latency / success rate); backends never
+  measured are tried first, in configured order; retries move down the ranking
+- with LLM_HEDGE, if the chosen backend has not answered by its p95, the
+  same request is sent to the next backend and the first valid answer wins.
+  The losing request's answer is discarded (an HTTP call in flight cannot be
+  interrupted). At most LLM_HEDGE_MAX_INFLIGHT calls are hedged at once;
+  beyond that, calls run unhedged on the caller's thread.
 """
 
+import contextvars
+import json
+import logging
+import threading
 import time
-from typing import Optional
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
 
 import requests
 
-from app.config import HF_TOKEN, HF_API_URL, HF_MODEL_ID
+from app.config import (
+    GENERATION_BACKEND,
+    GENERATION_LOAD_RETRY_S,
+    HF_API_URL,
+    HF_MODEL_ID,
+    HF_TOKEN,
+    LLM_BACKENDS,
+    LLM_EWMA_ALPHA,
+    LLM_HEDGE,
+    LLM_HEDGE_DELAY_S,
+    LLM_HEDGE_MAX_INFLIGHT,
+    LOCAL_LLM_MODEL_ID,
+    LOCAL_LLM_THREADS,
+    STUB_LLM_DELAY_S,
+)
+from app.metrics import (
+    LLM_ATTEMPTS,
+    LLM_BACKEND_REQUESTS,
+    LLM_HEDGES,
+    LLM_RETRIES,
+    record_llm_usage,
+    stage,
+)
+from app.tracing import annotate, current_traceparent
+
+logger = logging.getLogger(__name__)
+
+# Successful calls needed before a backend's p95 replaces LLM_HEDGE_DELAY_S,
+# and latencies kept per backend for the p95
+HEDGE_MIN_SAMPLES = 10
+LATENCY_WINDOW    = 100
+
+# Score floor of the success rate: a failing backend stays comparable
+MIN_SUCCESS_RATE = 0.05
+
+GENERATION_BACKENDS = ("http", "local", "stub")
+
+# Fail at startup on a typo rather than on the first LLM call
+if GENERATION_BACKEND not in GENERATION_BACKENDS:
+    raise ValueError(
+        f"Unknown GENERATION_BACKEND '{GENERATION_BACKEND}' (expected one of {', '.join(GENERATION_BACKENDS)})."
+    )
 
 
 # ── Custom exception ───────────────────────────────────────────────────────────
@@ -17,6 +90,37 @@ class LLMError(Exception):
     pass
 
 
+# ── Result ─────────────────────────────────────────────────────────────────────
+
+@dataclass
+class LLMResult:
+    """
+    Generated text plus the accounting returned by the router.
+    Token counts are None when the provider omits the `usage` block.
+    """
+    text: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    finish_reason: Optional[str] = None
+    latency_s: float = 0.0         # successful attempt only
+    attempts: int = 1
+    model: Optional[str] = None
+    backend: Optional[str] = None  # LLMBackend.name that answered
+    hedged: bool = False           # a hedge request was sent for the winning attempt
+
+    @property
+    def truncated(self) -> bool:
+        """True if generation stopped on max_new_tokens (output likely cut mid-JSON)."""
+        return self.finish_reason == "length"
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if not self.completion_tokens or self.latency_s <= 0:
+            return None
+        return self.completion_tokens / self.latency_s
+
+
 # ── Helper functions ───────────────────────────────────────────────────────────
 
 def _build_headers() -> dict:
@@ -35,64 +139,319 @@ def _build_headers() -> dict:
     }
 
 
-# ── Main LLM call ──────────────────────────────────────────────────────────────
+# ── Backends and routing ───────────────────────────────────────────────────────
 
-def call_llm(
-    prompt: str,
-    max_new_tokens: int = 256,
-    temperature: float = 0.4,
-    top_p: float = 0.95,
-    max_retries: int = 2,
-    timeout: int = 30,
-) -> str:
-    """
-    Calls the LLM via the HuggingFace router (OpenAI-compatible API)
-    and returns the generated text.
+@dataclass(frozen=True)
+class LLMBackend:
+    """One OpenAI-compatible chat-completions endpoint and the model it is asked for."""
+    url: str
+    model: str
 
-    Args:
-        prompt: Input prompt string
-        max_new_tokens: Maximum number of tokens to generate
-        temperature: Sampling temperature (lower = more deterministic)
-        top_p: Nucleus sampling probability
-        max_retries: Number of retry attempts on failure
-        timeout: Request timeout in seconds
+    @property
+    def name(self) -> str:
+        """Metric / trace label: host and model."""
+        return f"{urlparse(self.url).netloc or self.url}/{self.model}"
 
-    Returns:
-        Generated text string
+
+def parse_backends(entries: Sequence[str]) -> List[LLMBackend]:
+    """
+    Parses LLM_BACKENDS entries ("url|model", model optional).
 
     Raises:
-        ValueError: If prompt is empty
-        LLMError: If all retry attempts fail
+        ValueError: If an entry has no URL
     """
-    if not prompt or not prompt.strip():
-        raise ValueError("Empty or invalid prompt passed to call_llm().")
+    backends = []
+    for entry in entries:
+        url, _, model = entry.partition("|")
+        if not url.strip():
+            raise ValueError(f"LLM backend without URL: {entry!r}")
+        backends.append(LLMBackend(url=url.strip(), model=model.strip() or HF_MODEL_ID))
+    return backends
 
-    headers = _build_headers()
-    payload = {
-        "model": HF_MODEL_ID,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": max_new_tokens,
-        "temperature": temperature,
-        "top_p": top_p,
-        "stream": False,
-    }
 
-    last_error: Optional[Exception] = None
+def configured_backends() -> List[LLMBackend]:
+    """LLM_BACKENDS, or the single HF_API_URL / HF_MODEL_ID backend."""
+    return parse_backends(LLM_BACKENDS) or [LLMBackend(url=HF_API_URL, model=HF_MODEL_ID)]
+
+
+def backends_for_model(backends: Sequence[LLMBackend], model: Optional[str]) -> List[LLMBackend]:
+    """
+    Backends serving `model`: those configured with it, otherwise every
+    backend URL asked for that model. No model: the backends unchanged.
+    """
+    if not model:
+        return list(backends)
+    matching = [b for b in backends if b.model == model]
+    if matching:
+        return matching
+    urls = dict.fromkeys(b.url for b in backends)
+    return [LLMBackend(url=url, model=model) for url in urls]
+
+
+class BackendStats:
+    """Latency and error-rate moving averages of one backend (thread-safe)."""
+
+    def __init__(self, alpha: float = LLM_EWMA_ALPHA):
+        self.alpha = alpha
+        self.latency_ewma: Optional[float] = None   # successful calls only
+        self.error_ewma = 0.0
+        self.calls = 0
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, latency_s: float, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.error_ewma += self.alpha * ((0.0 if ok else 1.0) - self.error_ewma)
+            if ok:
+                self._latencies.append(latency_s)
+                self.latency_ewma = (
+                    latency_s if self.latency_ewma is None
+                    else self.latency_ewma + self.alpha * (latency_s - self.latency_ewma)
+                )
 
-    for attempt in range(1, max_retries + 1):
+    @property
+    def measured(self) -> bool:
+        return self.calls > 0
+
+    def score(self) -> float:
+        """Expected cost of a call (lower is better): latency / success rate."""
+        with self._lock:
+            if self.latency_ewma is None:
+                return float("inf")
+            return self.latency_ewma / max(1.0 - self.error_ewma, MIN_SUCCESS_RATE)
+
+    def p95(self) -> Optional[float]:
+        """p95 of the recent successful latencies, None below HEDGE_MIN_SAMPLES."""
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        return {
+            "calls":        self.calls,
+            "latency_ewma": self.latency_ewma,
+            "error_ewma":   round(self.error_ewma, 4),
+            "p95":          self.p95(),
+        }
+
+
+_STATS: Dict[LLMBackend, BackendStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def backend_stats(backend: LLMBackend) -> BackendStats:
+    with _STATS_LOCK:
+        if backend not in _STATS:
+            _STATS[backend] = BackendStats()
+        return _STATS[backend]
+
+
+def reset_backend_stats() -> None:
+    """Forgets every observed latency and error (tests, configuration changes)."""
+    with _STATS_LOCK:
+        _STATS.clear()
+
+
+def rank_backends(backends: Sequence[LLMBackend]) -> List[LLMBackend]:
+    """
+    Orders backends for the next call: unmeasured ones first (configured
+    order), then by score. The sort is stable: ties keep the configured order.
+    """
+    return sorted(
+        backends,
+        key=lambda b: (backend_stats(b).measured, backend_stats(b).score()),
+    )
+
+
+def hedge_delay(backend: LLMBackend) -> float:
+    """Seconds to wait for `backend` before hedging: its p95, or LLM_HEDGE_DELAY_S."""
+    p95 = backend_stats(backend).p95()
+    return LLM_HEDGE_DELAY_S if p95 is None else p95
+
+
+# One slot per hedged call in flight, held from the primary's send until the
+# primary answers in time or the hedge request returns. The hedge pool has one
+# worker per slot, so a hedge is never queued behind another one.
+_HEDGE_SLOTS = threading.BoundedSemaphore(LLM_HEDGE_MAX_INFLIGHT)
+
+_HEDGE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_HEDGE_EXECUTOR_LOCK = threading.Lock()
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    global _HEDGE_EXECUTOR
+    if _HEDGE_EXECUTOR is None:
+        with _HEDGE_EXECUTOR_LOCK:
+            if _HEDGE_EXECUTOR is None:
+                _HEDGE_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=LLM_HEDGE_MAX_INFLIGHT, thread_name_prefix="llm-hedge",
+                )
+    return _HEDGE_EXECUTOR
+
+
+def _start_primary(send: Callable[[LLMBackend], LLMResult], backend: LLMBackend) -> Future:
+    """
+    Sends to `backend` on a thread of its own, started right away: the hedge
+    delay runs from the actual send, never from a wait in a pool queue.
+    """
+    future: Future = Future()
+    # The copied context keeps the request's trace: the attempt span has the right parent
+    context = contextvars.copy_context()
+
+    def run() -> None:
         try:
+            future.set_result(context.run(send, backend))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="llm-primary", daemon=True).start()
+    return future
+
+
+def _hedged_send(
+    send: Callable[[LLMBackend], LLMResult],
+    primary: LLMBackend,
+    secondary: LLMBackend,
+) -> LLMResult:
+    """
+    Sends to `primary`; if it has not answered within its hedge delay, sends
+    the same request to `secondary` and returns the first valid answer.
+    With every hedge slot taken (LLM_HEDGE_MAX_INFLIGHT), sends to `primary`
+    only, on the caller's thread.
+
+    Raises:
+        Exception: The primary's error if it fails before the delay, otherwise
+            the last error once both requests have failed
+    """
+    if not _HEDGE_SLOTS.acquire(blocking=False):
+        LLM_HEDGES.labels(winner="skipped").inc()
+        return send(primary)
+
+    first = _start_primary(send, primary)
+    done, _ = wait([first], timeout=hedge_delay(primary))
+    if done:
+        _HEDGE_SLOTS.release()
+        return first.result()
+
+    second = _hedge_executor().submit(contextvars.copy_context().run, send, secondary)
+    second.add_done_callback(lambda _: _HEDGE_SLOTS.release())
+    pending = {first, second}
+    last_error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                last_error = error
+                continue
+            # The other request is in flight and cannot be interrupted: its answer is discarded
+            LLM_HEDGES.labels(winner="primary" if future is first else "hedge").inc()
+            result = future.result()
+            result.hedged = True
+            return result
+    LLM_HEDGES.labels(winner="none").inc()
+    raise last_error
+
+
+# ── HTTP backend ───────────────────────────────────────────────────────────────
+
+class HTTPGenerator:
+    """
+    Chat-completions calls over HTTP, routed across `backends` (default:
+    configured_backends(), read at call time) and optionally hedged.
+    """
+
+    name = "http"
+
+    def __init__(self, backends: Optional[Sequence[LLMBackend]] = None, hedge: Optional[bool] = None):
+        self.backends = list(backends) if backends else None
+        self.hedge    = hedge
+
+    def generate(
+        self,
+        prompt: str,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        max_retries: int,
+        timeout: int,
+        model: Optional[str] = None,
+    ) -> LLMResult:
+        """
+        Raises:
+            LLMError: If HF_TOKEN is missing or all retry attempts fail
+        """
+        headers  = _build_headers()
+        backends = backends_for_model(self.backends or configured_backends(), model)
+        hedge    = LLM_HEDGE if self.hedge is None else self.hedge
+        body = {
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_new_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "stream": False,
+        }
+
+        last_error: Optional[Exception] = None
+        failed: set = set()
+
+        for attempt in range(1, max_retries + 1):
+            if attempt > 1:
+                LLM_RETRIES.inc()
+
+            def send(backend: LLMBackend, attempt: int = attempt) -> LLMResult:
+                return _send(backend, headers, body, timeout, attempt)
+
+            # Ranked again on every attempt; retries go to the backends that
+            # have not failed this call yet (all of them again once each has failed)
+            ranked     = rank_backends(backends)
+            candidates = [b for b in ranked if b not in failed] + [b for b in ranked if b in failed]
+            attempted  = candidates[:2] if hedge and len(candidates) > 1 else candidates[:1]
+            try:
+                if len(attempted) > 1:
+                    return _hedged_send(send, *attempted)
+                return send(attempted[0])
+
+            except Exception as e:
+                print(f"[LLM] Attempt {attempt}/{max_retries} failed: {e}")
+                failed.update(attempted)
+                last_error = e
+                # No pause when another backend can take the retry right away
+                if failed.issuperset(backends):
+                    time.sleep(1)
+
+        raise LLMError(f"LLM call failed after {max_retries} attempts: {last_error}")
+
+
+def _send(backend: LLMBackend, headers: dict, body: dict, timeout: int, attempt: int) -> LLMResult:
+    """
+    One HTTP request to one backend, recorded in its stats and the metrics.
+
+    Raises:
+        LLMError: On an HTTP error or an empty answer (requests errors pass through)
+    """
+    t0 = time.perf_counter()
+    try:
+        # Each attempt is its own stage/span: retries and hedges show up in the trace
+        with stage("llm_attempt", attempt=attempt, backend=backend.name):
+            # Propagates the trace to the router (W3C trace context)
+            traceparent = current_traceparent()
             response = requests.post(
-                HF_API_URL,
-                headers=headers,
-                json=payload,
+                backend.url,
+                headers={**headers, "traceparent": traceparent} if traceparent else headers,
+                json={"model": backend.model, **body},
                 timeout=timeout,
             )
+            annotate(status_code=response.status_code)
 
             if response.status_code != 200:
                 raise LLMError(
-                    f"HuggingFace API error (status {response.status_code}): {response.text}"
+                    f"LLM API error from {backend.name} (status {response.status_code}): {response.text}"
                 )
 
             data    = response.json()
@@ -101,16 +460,335 @@ def call_llm(
             if not choices:
                 raise LLMError("LLM response contains no 'choices'.")
 
-            text = choices[0].get("message", {}).get("content", "").strip()
+            text = (choices[0].get("message") or {}).get("content", "").strip()
 
             if not text:
                 raise LLMError("LLM returned an empty response.")
 
-            return text
+            usage  = data.get("usage") or {}
+            result = LLMResult(
+                text=text,
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+                total_tokens=usage.get("total_tokens"),
+                finish_reason=choices[0].get("finish_reason"),
+                latency_s=time.perf_counter() - t0,
+                attempts=attempt,
+                model=data.get("model") or backend.model,
+                backend=backend.name,
+            )
+            annotate(
+                prompt_tokens=result.prompt_tokens,
+                completion_tokens=result.completion_tokens,
+                finish_reason=result.finish_reason,
+            )
+    except Exception:
+        backend_stats(backend).record(time.perf_counter() - t0, ok=False)
+        LLM_ATTEMPTS.labels(outcome="error").inc()
+        LLM_BACKEND_REQUESTS.labels(backend=backend.name, outcome="error").inc()
+        raise
+
+    backend_stats(backend).record(result.latency_s, ok=True)
+    LLM_ATTEMPTS.labels(outcome="ok").inc()
+    LLM_BACKEND_REQUESTS.labels(backend=backend.name, outcome="ok").inc()
+    return result
+
 
+# ── In-process backends ────────────────────────────────────────────────────────
+
+class LocalGenerator:
+    """
+    Small causal LM (LOCAL_LLM_MODEL_ID) run in process on CPU with
+    transformers: no network hop, no token billing. Generation is serialized
+    (one prompt at a time uses every CPU thread) and cannot be interrupted,
+    so `timeout` is not enforced; in-process errors are not transient, so
+    there is a single attempt.
+    """
+
+    name = "local"
+
+    def __init__(self, model_id: str = LOCAL_LLM_MODEL_ID, threads: int = LOCAL_LLM_THREADS):
+        try:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "The 'local' generation backend requires torch and transformers."
+            ) from e
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self._torch   = torch
+        self.model_id = model_id
+        try:
+            self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+            self.model     = AutoModelForCausalLM.from_pretrained(model_id, dtype=torch.float32)
+            self.model.eval()
         except Exception as e:
-            print(f"[LLM] Attempt {attempt}/{max_retries} failed: {e}")
-            last_error = e
-            time.sleep(1)
+            # Bad config, unsupported architecture, missing weights...: the
+            # backend is unavailable, not a request error
+            raise RuntimeError(f"Cannot load local model '{model_id}': {e}") from e
+        self._lock = threading.Lock()
+
+    def _encode(self, prompt: str):
+        """Returns the (input_ids, attention_mask) tensors of the prompt."""
+        if getattr(self.tokenizer, "chat_template", None):
+            enc = self.tokenizer.apply_chat_template(
+                [{"role": "user", "content": prompt}],
+                add_generation_prompt=True,
+                return_tensors="pt",
+                return_dict=True,
+            )
+        else:
+            enc = self.tokenizer(prompt, return_tensors="pt")
+        return enc["input_ids"], enc["attention_mask"]
+
+    def _pad_token_id(self) -> Optional[int]:
+        pad_id = self.tokenizer.pad_token_id
+        return self.tokenizer.eos_token_id if pad_id is None else pad_id
+
+    def generate(
+        self,
+        prompt: str,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        max_retries: int = 1,
+        timeout: Optional[int] = None,
+        model: Optional[str] = None,
+    ) -> LLMResult:
+        """
+        Raises:
+            LLMError: If generation fails or produces no text
+        """
+        backend = f"local/{self.model_id}"
+        t0 = time.perf_counter()
+        try:
+            with stage("llm_attempt", attempt=1, backend=backend):
+                input_ids, attention_mask = self._encode(prompt)
+                sampling = {"do_sample": True, "temperature": temperature, "top_p": top_p} if temperature > 0 else {}
+                with self._lock, self._torch.inference_mode():
+                    output = self.model.generate(
+                        input_ids,
+                        attention_mask=attention_mask,
+                        max_new_tokens=max_new_tokens,
+                        pad_token_id=self._pad_token_id(),
+                        **sampling,
+                    )
+                completion = output[0, input_ids.shape[1]:]
+                text = self.tokenizer.decode(completion, skip_special_tokens=True).strip()
+                if not text:
+                    raise LLMError("Local model returned an empty response.")
+
+                prompt_tokens, completion_tokens = int(input_ids.shape[1]), int(completion.shape[0])
+                result = LLMResult(
+                    text=text,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    total_tokens=prompt_tokens + completion_tokens,
+                    finish_reason="length" if completion_tokens >= max_new_tokens else "stop",
+                    latency_s=time.perf_counter() - t0,
+                    model=self.model_id,
+                    backend=backend,
+                )
+                annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        except Exception as e:
+            LLM_ATTEMPTS.labels(outcome="error").inc()
+            LLM_BACKEND_REQUESTS.labels(backend=backend, outcome="error").inc()
+            if isinstance(e, LLMError):
+                raise
+            raise LLMError(f"Local generation failed: {e}") from e
+
+        LLM_ATTEMPTS.labels(outcome="ok").inc()
+        LLM_BACKEND_REQUESTS.labels(backend=backend, outcome="ok").inc()
+        return result
+
+
+# Canned answer of the stub backend: a plan that passes plan validation
+# (see app.plan_store.validate_plan)
+STUB_PLAN = {
+    "diagnostic": "Symptoms are consistent with the detected disease; the infection is active on young leaves.",
+    "treatment_actions": [
+        "Apply an authorized fungicide adapted to the farming mode within 48 hours.",
+        "Renew the application after significant rainfall, respecting the label interval.",
+        "Remove and destroy the most infected leaves and bunches.",
+    ],
+    "preventive_actions": [
+        "Open the canopy to reduce humidity around the bunches.",
+        "Monitor weather forecasts and treat before rain periods.",
+    ],
+    "warnings": [
+        "Respect the pre-harvest interval of every applied product.",
+        "Wear personal protective equipment during application.",
+    ],
+}
+STUB_PLAN_TEXT = json.dumps(STUB_PLAN, ensure_ascii=False)
+
+
+class StubGenerator:
+    """
+    Deterministic stand-in: STUB_PLAN_TEXT after `delay_s`, whatever the
+    prompt. Token counts are estimated (4 characters per token) so the
+    usage metrics stay populated.
+    """
+
+    name = "stub"
+
+    def __init__(self, delay_s: float = STUB_LLM_DELAY_S):
+        self.delay_s = delay_s
+
+    def generate(
+        self,
+        prompt: str,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        max_retries: int = 1,
+        timeout: Optional[int] = None,
+        model: Optional[str] = None,
+    ) -> LLMResult:
+        t0 = time.perf_counter()
+        with stage("llm_attempt", attempt=1, backend=self.name):
+            if self.delay_s > 0:
+                time.sleep(self.delay_s)
+            prompt_tokens     = max(1, len(prompt) // 4)
+            completion_tokens = max(1, len(STUB_PLAN_TEXT) // 4)
+            result = LLMResult(
+                text=STUB_PLAN_TEXT,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+                finish_reason="stop",
+                latency_s=time.perf_counter() - t0,
+                model=self.name,
+                backend=self.name,
+            )
+        LLM_ATTEMPTS.labels(outcome="ok").inc()
+        LLM_BACKEND_REQUESTS.labels(backend=self.name, outcome="ok").inc()
+        return result
+
+
+# ── Backend selection ──────────────────────────────────────────────────────────
+
+def load_generator(backend: str = GENERATION_BACKEND):
+    """
+    Instantiates the generation backend.
+
+    Raises:
+        ValueError: If the backend name is unknown
+        RuntimeError: If the local backend's dependencies are missing
+    """
+    if backend == "http":
+        return HTTPGenerator()
+    if backend == "local":
+        return LocalGenerator()
+    if backend == "stub":
+        return StubGenerator()
+    raise ValueError(f"Unknown GENERATION_BACKEND '{backend}' (expected one of {', '.join(GENERATION_BACKENDS)}).")
+
+
+_GENERATOR: Optional[Any] = None
+_GENERATOR_LOCK = threading.Lock()
+# (monotonic time, error) of the last failed load
+_GENERATOR_FAILURE: Optional[Tuple[float, Exception]] = None
+
+
+def _raise_recent_failure() -> None:
+    failure = _GENERATOR_FAILURE
+    if failure is not None and time.monotonic() - failure[0] < GENERATION_LOAD_RETRY_S:
+        raise RuntimeError(f"{failure[1]} (load retried after {GENERATION_LOAD_RETRY_S:.0f}s)") from failure[1]
+
+
+def get_generator():
+    """
+    Returns the configured generation backend, loaded once and reused
+    (the local backend loads its model weights here). A failed load is
+    remembered: calls fail fast, without the lock, for GENERATION_LOAD_RETRY_S
+    (or until reload_generator()) instead of each retrying the load.
+
+    Raises:
+        RuntimeError / OSError: If the backend cannot be loaded
+    """
+    global _GENERATOR, _GENERATOR_FAILURE
+    if _GENERATOR is None:
+        _raise_recent_failure()
+        with _GENERATOR_LOCK:
+            if _GENERATOR is None:
+                _raise_recent_failure()     # another thread failed meanwhile
+                try:
+                    _GENERATOR = load_generator()
+                except (RuntimeError, OSError) as e:
+                    _GENERATOR_FAILURE = (time.monotonic(), e)
+                    logger.error(f"Generation backend '{GENERATION_BACKEND}' failed to load: {e}")
+                    raise
+                _GENERATOR_FAILURE = None
+                logger.info(f"Generation backend loaded ({GENERATION_BACKEND}).")
+    return _GENERATOR
+
+
+def reload_generator() -> None:
+    """Drops the loaded backend and any remembered load failure: the next call loads it again."""
+    global _GENERATOR, _GENERATOR_FAILURE
+    with _GENERATOR_LOCK:
+        _GENERATOR, _GENERATOR_FAILURE = None, None
+
+
+# ── Main LLM call ──────────────────────────────────────────────────────────────
+
+def call_llm(
+    prompt: str,
+    max_new_tokens: int = 256,
+    temperature: float = 0.4,
+    top_p: float = 0.95,
+    max_retries: int = 2,
+    timeout: int = 30,
+    backends: Optional[Sequence[LLMBackend]] = None,
+    hedge: Optional[bool] = None,
+    model: Optional[str] = None,
+) -> LLMResult:
+    """
+    Generates text with the configured backend (GENERATION_BACKEND) and
+    returns it with its token usage, latency and finish reason (also
+    aggregated in app.metrics).
+
+    Args:
+        prompt: Input prompt string
+        max_new_tokens: Maximum number of tokens to generate
+        temperature: Sampling temperature (lower = more deterministic)
+        top_p: Nucleus sampling probability
+        max_retries: Number of retry attempts on failure (HTTP backend)
+        timeout: Request timeout in seconds (HTTP backend)
+        backends: HTTP backends to route across (forces the HTTP backend)
+        hedge: Hedge slow HTTP requests on the next backend (default: LLM_HEDGE)
+        model: Model asked from the HTTP backends (default: their configured
+               models); the local and stub backends always use their own
+
+    Returns:
+        LLMResult (generated text in `.text`)
+
+    Raises:
+        ValueError: If prompt is empty
+        LLMError: If the backend cannot be loaded or all retry attempts fail
+    """
+    if not prompt or not prompt.strip():
+        raise ValueError("Empty or invalid prompt passed to call_llm().")
+
+    if backends or hedge is not None:
+        generator = HTTPGenerator(backends, hedge)
+    else:
+        try:
+            generator = get_generator()
+        except (RuntimeError, OSError) as e:
+            raise LLMError(f"Generation backend '{GENERATION_BACKEND}' unavailable: {e}") from e
 
-    raise LLMError(f"LLM call failed after {max_retries} attempts: {last_error}")
\ No newline at end of file
+    result = generator.generate(
+        prompt,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        max_retries=max_retries,
+        timeout=timeout,
+        model=model,
+    )
+    record_llm_usage(result)
+    return result
@@ -4,12 +4,72 @@ Receives a disease prediction and returns a structured treatment plan via RAG pi
 """
 
 
-from fastapi import FastAPI, Query
+import hmac
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+
+from app.dosage_rules import RulesError, reload_rules, start_rules_watcher, stop_rules_watcher
+from app.rag_pipeline import GENERATION_STRATEGIES, QUALITIES, generate_treatment_advice
+from app.schemas import (
+    DetailedHealthResponse,
+    HealthResponse,
+    ReadinessResponse,
+    RulesReloadResponse,
+    SolutionRequest,
+    SolutionResponse,
+)
+from app.health import (
+    get_component_health,
+    start_health_monitor,
+    stop_health_monitor,
+    weaviate_usable,
+)
+from app.metrics import render_metrics
+from app.profiling import PROFILE_MODES, profiled
+from app.tracing import (
+    current_span,
+    format_server_timing,
+    format_traceparent,
+    start_trace,
+    summarize_stages,
+)
+from app.warmup import get_warmup_state, is_ready, mark_ready, start_warmup
+from app.weaviate_client import close_shared_client
+from app.config import (
+    ADMIN_TOKEN,
+    DOSAGE_RULES_RELOAD_INTERVAL_S,
+    HEALTH_PROBE_INTERVAL_S,
+    PROFILE_MODE,
+    WARMUP_ON_STARTUP,
+)
+
+
+# ── Lifespan (startup warm-up / shutdown) ──────────────────────────────────────
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup: warms up the embedder, Weaviate connection and caches in the
+    background (see app.warmup) — GET /ready turns 200 once it is done —
+    and starts the background health monitor (see app.health) and the
+    dosage rule file watcher (see app.dosage_rules).
+    Shutdown: stops both threads and closes the shared Weaviate connection.
+    """
+    if WARMUP_ON_STARTUP:
+        start_warmup()
+    else:
+        mark_ready()
+    start_health_monitor(HEALTH_PROBE_INTERVAL_S)
+    start_rules_watcher(DOSAGE_RULES_RELOAD_INTERVAL_S)
+    yield
+    stop_rules_watcher()
+    stop_health_monitor()
+    close_shared_client()
 
-from app.rag_pipeline import generate_treatment_advice
-from app.schemas import HealthResponse, SolutionRequest, SolutionResponse, DetailedHealthResponse
-from app.weaviate_client import weaviate_available
-from app.config import HF_TOKEN
 
 # ── FastAPI application ────────────────────────────────────────────────────────
 
@@ -20,42 +80,106 @@ app = FastAPI(
         "Combines a Weaviate knowledge base with an LLM to generate structured treatment plans."
     ),
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
+# ── Tracing middleware ─────────────────────────────────────────────────────────
+
+# Probes and scrapes are frequent and uninteresting: not traced
+UNTRACED_PATHS = {"/", "/health", "/ready", "/metrics"}
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Opens the root span of each request (see app.tracing), continuing the
+    caller's `traceparent` and returning ours so clients can find the trace.
+
+    Every response carries a `Server-Timing` header: per-stage durations
+    (retrieval, embedding, LLM, parse, dosage...) for traced requests,
+    the total only for probes.
+    """
+    if request.url.path in UNTRACED_PATHS:
+        t0 = time.perf_counter()
+        response = await call_next(request)
+        response.headers["Server-Timing"] = format_server_timing(
+            {}, total_ms=(time.perf_counter() - t0) * 1000,
+        )
+        return response
+
+    with start_trace(
+        f"{request.method} {request.url.path}",
+        traceparent=request.headers.get("traceparent"),
+    ) as root:
+        response = await call_next(request)
+        root.set_attribute("status_code", response.status_code)
+
+    response.headers["traceparent"] = format_traceparent(root)
+    response.headers["Server-Timing"] = format_server_timing(
+        summarize_stages(root.spans), total_ms=root.duration_ms,
+    )
+    return response
+
+
+# ── Admin gate ─────────────────────────────────────────────────────────────────
+
+def _require_admin(token: Optional[str]) -> None:
+    """
+    Raises:
+        HTTPException 403: If ADMIN_TOKEN is unset or the token does not match
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required for this option.")
+
+
 # ── Endpoints ──────────────────────────────────────────────────────────────────
 
 @app.get("/", response_model=HealthResponse)
 def root():
-    """Health check — confirms the API is running."""
+    """Health check — confirms the API is running (liveness probe)."""
     return {"message": "Vitiscan Treatment Plan API is running", "status": "ok"}
 
 
+@app.get(
+    "/ready",
+    response_model=ReadinessResponse,
+    responses={503: {"model": ReadinessResponse, "description": "Warm-up in progress"}},
+)
+def readiness_check():
+    """
+    Readiness probe — 200 once the startup warm-up has finished
+    (embedder loaded, Weaviate connected, caches primed), 503 before.
+    """
+    state = get_warmup_state()
+    body  = {
+        "status":      "ready" if is_ready() else "warming_up",
+        "started_at":  state["started_at"],
+        "finished_at": state["finished_at"],
+        "steps":       state["steps"],
+    }
+    if not is_ready():
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
 @app.get("/health", response_model=DetailedHealthResponse)
 def health_check():
     """
     Detailed health check endpoint.
     
-    Checks:
-    - Weaviate availability (cloud or local)
-    - HuggingFace token configuration
+    Reads the component state cached by the background health monitor
+    (no probing on the request path):
+    - Weaviate readiness (cloud or local)
+    - LLM router reachability and HuggingFace token
     
+    Each component reports its last probe time, latency and probe history.
     Returns 'ok' if all components are available,
-    'degraded' if running in fallback mode.
+    'degraded' if running in fallback mode or a probe failed.
     """
-    weaviate_ok = weaviate_available()
-    llm_ok = bool(HF_TOKEN and HF_TOKEN.strip())
-    
-    components = {
-        "weaviate": {
-            "status": "ok" if weaviate_ok else "fallback",
-            "message": "Connected" if weaviate_ok else "Unavailable — using static responses",
-        },
-        "llm": {
-            "status": "ok" if llm_ok else "not_configured",
-            "message": "HF_TOKEN configured" if llm_ok else "HF_TOKEN missing",
-        },
-    }
+    components = get_component_health()
+    weaviate_ok = weaviate_usable()
+    llm_ok = components["llm"]["status"] in ("ok", "unknown")
     
     # Overall status: ok if both are good, degraded otherwise
     overall = "ok" if (weaviate_ok and llm_ok) else "degraded"
@@ -66,6 +190,16 @@ def health_check():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, LLM retries,
+    fallbacks, parse paths and cache hit/miss counters (see app.metrics).
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.post("/solutions", response_model=SolutionResponse)
 def get_solutions(
     request: SolutionRequest,
@@ -73,6 +207,31 @@ def get_solutions(
         False,
         description="If true, includes raw LLM output in the response"
     ),
+    timings: bool = Query(
+        False,
+        description="If true, includes the per-stage timing breakdown in the response"
+    ),
+    profile: bool = Query(
+        False,
+        description="Admin only: profiles the request and includes the profile summary"
+    ),
+    profile_mode: str = Query(
+        PROFILE_MODE,
+        description=f"Profiler used with profile=true: {' or '.join(PROFILE_MODES)}"
+    ),
+    refresh: bool = Query(
+        False,
+        description="Admin only: regenerates the plan and updates the plan store"
+    ),
+    strategy: Optional[str] = Query(
+        None,
+        description=f"Plan generation: {' or '.join(GENERATION_STRATEGIES)} (default: GENERATION_STRATEGY)"
+    ),
+    quality: Optional[str] = Query(
+        None,
+        description=f"QoS tier: {', '.join(QUALITIES)} (default: DEFAULT_QUALITY)"
+    ),
+    x_admin_token: Optional[str] = Header(None),
 ):
     """
     Main endpoint: receives a disease prediction + context
@@ -82,11 +241,73 @@ def get_solutions(
     - Builds a RAG prompt and calls the LLM
     - Computes dosage based on disease rules
     - Returns diagnosis, treatment actions, preventive measures and warnings
+
+    With timings=true, data.timings holds the per-stage breakdown that is
+    also sent in the Server-Timing header.
+
+    With profile=true (X-Admin-Token required), the pipeline runs under a
+    profiler (see app.profiling): the profile is saved to disk and
+    data.profile holds its path and the top functions.
+
+    With refresh=true (X-Admin-Token required), the precomputed and cached
+    plans are bypassed: the plan is regenerated and replaces the plan store
+    entry (see app.plan_store). Labels with the "template" policy have their
+    template plans rebuilt from the extractive index, still without LLM call.
+
+    With strategy=extractive, the plan is assembled from the knowledge sheets
+    without calling the LLM (see app.extractive); data.strategy tells which
+    strategy served the request.
+
+    With quality=fast|balanced|full, the QoS tier sets retrieval depth,
+    context budget, model and completion cap (see QUALITY_TIERS): fast
+    answers from the plan store or an extractive plan, without LLM call.
     """
+    if profile:
+        _require_admin(x_admin_token)
+        if profile_mode not in PROFILE_MODES:
+            raise HTTPException(status_code=422, detail=f"profile_mode must be one of {PROFILE_MODES}.")
+    if refresh:
+        _require_admin(x_admin_token)
+    if strategy is not None and strategy not in GENERATION_STRATEGIES:
+        raise HTTPException(status_code=422, detail=f"strategy must be one of {GENERATION_STRATEGIES}.")
+    if quality is not None and quality not in QUALITIES:
+        raise HTTPException(status_code=422, detail=f"quality must be one of {QUALITIES}.")
+
     payload = request.model_dump()
-    advice  = generate_treatment_advice(payload)
+    with (profiled(profile_mode, label="solutions") if profile else nullcontext()) as session:
+        advice = generate_treatment_advice(payload, strategy=strategy, refresh=refresh, quality=quality)
 
     if not debug:
         advice.pop("raw_llm_output", None)
 
-    return {"data": advice}
\ No newline at end of file
+    root = current_span()
+    if timings and root is not None:
+        advice["timings"] = summarize_stages(root.spans)
+
+    if profile:
+        advice["profile"] = session.report
+
+    return {"data": advice}
+
+
+@app.post("/admin/rules/reload", response_model=RulesReloadResponse)
+def reload_dosage_rules(x_admin_token: Optional[str] = Header(None)):
+    """
+    Admin only (X-Admin-Token): re-reads the dosage rule files now instead of
+    waiting for the watcher (see app.dosage_rules). The new rule set replaces
+    the active one atomically; invalid files are rejected with a 422 and the
+    active rules are kept.
+    """
+    _require_admin(x_admin_token)
+    try:
+        rule_set, changed = reload_rules()
+    except RulesError as e:
+        raise HTTPException(status_code=422, detail=f"Rules rejected, active version kept: {e}")
+
+    return {
+        "version":   rule_set.version,
+        "checksum":  rule_set.checksum,
+        "rules":     len(rule_set),
+        "loaded_at": rule_set.loaded_at,
+        "changed":   changed,
+    }
@@ -0,0 +1,218 @@
+"""
+metrics.py — Prometheus metrics for the treatment plan pipeline.
+
+Exposed by GET /metrics (Prometheus text format):
+- vitiscan_stage_duration_seconds{stage}      : latency histogram per pipeline stage
+- vitiscan_llm_attempts_total{outcome}        : LLM calls per attempt (ok / error)
+- vitiscan_llm_retries_total                  : attempts beyond the first one
+- vitiscan_llm_backend_requests_total{backend,outcome} : requests per LLM backend
+- vitiscan_llm_hedges_total{winner}           : hedged requests (primary / hedge / none / skipped)
+- vitiscan_llm_tokens_total{kind}             : prompt / completion tokens billed
+- vitiscan_llm_prompt_tokens                  : prompt size distribution
+- vitiscan_llm_completion_tokens              : completion size distribution
+- vitiscan_llm_tokens_per_second              : generation throughput
+- vitiscan_llm_finish_total{reason}           : finish reasons (length = truncated)
+- vitiscan_fallbacks_total{reason}            : degraded answers, by cause
+- vitiscan_llm_parse_total{path}              : how LLM outputs were parsed
+- vitiscan_cache_requests_total{cache,result} : cache hits / misses
+- vitiscan_rules_reloads_total{outcome}       : dosage rule reloads (ok / error)
+- vitiscan_plan_policy_total{policy}          : plans served per policy
+- vitiscan_plan_cache_stale_total             : stale plans served while revalidating
+- vitiscan_plan_refresh_seconds{outcome}      : background plan regeneration latency
+
+Stages: season, retrieval, weaviate_connect, embed, near_vector,
+snapshot_search, prompt, llm, llm_attempt, parse, dosage, extractive,
+template, plan_store, pipeline.
+Each stage is also a span of the current request trace (see app.tracing).
+Quantiles (p50/p95/p99) are computed on the Prometheus side with
+histogram_quantile() over the stage histogram.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from prometheus_client.core import REGISTRY, CounterMetricFamily
+
+from app.tracing import annotate, span
+
+# Sub-millisecond cache-warm stages up to multi-second LLM calls
+STAGE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+STAGE_LATENCY = Histogram(
+    "vitiscan_stage_duration_seconds",
+    "Duration of each treatment pipeline stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_ATTEMPTS = Counter(
+    "vitiscan_llm_attempts_total",
+    "LLM HTTP attempts, by outcome.",
+    ["outcome"],
+)
+LLM_RETRIES = Counter(
+    "vitiscan_llm_retries_total",
+    "LLM attempts made after a failed first attempt.",
+)
+LLM_BACKEND_REQUESTS = Counter(
+    "vitiscan_llm_backend_requests_total",
+    "LLM HTTP requests per backend, by outcome (ok / error).",
+    ["backend", "outcome"],
+)
+LLM_HEDGES = Counter(
+    "vitiscan_llm_hedges_total",
+    "Hedged LLM requests, by winner (primary / hedge / none = both failed / skipped = hedge slots full).",
+    ["winner"],
+)
+FALLBACKS = Counter(
+    "vitiscan_fallbacks_total",
+    "Degraded answers: static fallback, no retrieved chunk, or LLM failure.",
+    ["reason"],
+)
+PARSE_OUTCOMES = Counter(
+    "vitiscan_llm_parse_total",
+    "LLM outputs by parsing path (json, heuristic, raw_text, empty).",
+    ["path"],
+)
+LLM_TOKENS = Counter(
+    "vitiscan_llm_tokens_total",
+    "Tokens billed by the LLM router, by kind (prompt / completion).",
+    ["kind"],
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "vitiscan_llm_prompt_tokens",
+    "Prompt size per successful LLM call, in tokens.",
+    buckets=(128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192),
+)
+LLM_COMPLETION_TOKENS = Histogram(
+    "vitiscan_llm_completion_tokens",
+    "Generated tokens per successful LLM call.",
+    buckets=(16, 32, 64, 128, 256, 384, 512, 700, 1024),
+)
+LLM_THROUGHPUT = Histogram(
+    "vitiscan_llm_tokens_per_second",
+    "Generation throughput per successful LLM call (completion tokens / latency).",
+    buckets=(5, 10, 20, 30, 50, 75, 100, 150, 200, 400),
+)
+LLM_FINISH_REASONS = Counter(
+    "vitiscan_llm_finish_total",
+    "Successful LLM calls by finish_reason ('length' = truncated by max_new_tokens).",
+    ["reason"],
+)
+CACHE_REQUESTS = Counter(
+    "vitiscan_cache_requests_total",
+    "Cache lookups, by cache and result (hit / miss).",
+    ["cache", "result"],
+)
+PLAN_POLICIES = Counter(
+    "vitiscan_plan_policy_total",
+    "Treatment plans served, by policy (template / precomputed / cached / llm).",
+    ["policy"],
+)
+PLAN_CACHE_STALE = Counter(
+    "vitiscan_plan_cache_stale_total",
+    "Cached plans served past their soft TTL while a background regeneration runs.",
+)
+PLAN_REFRESH_LATENCY = Histogram(
+    "vitiscan_plan_refresh_seconds",
+    "Background plan regenerations (stale-while-revalidate), by outcome (ok / error).",
+    ["outcome"],
+    buckets=STAGE_BUCKETS,
+)
+RULES_RELOADS = Counter(
+    "vitiscan_rules_reloads_total",
+    "Dosage rule set loads and reloads, by outcome (ok / error = rejected, previous rules kept).",
+    ["outcome"],
+)
+
+
+@contextmanager
+def stage(name: str, **attributes: Any) -> Iterator[None]:
+    """
+    Times the enclosed block into the stage histogram (also on exceptions)
+    and records it as a span of the current trace (see app.tracing).
+
+    Usage:
+        with stage("near_vector", with_mode=True):
+            response = collection.query.near_vector(...)
+    """
+    t0 = time.perf_counter()
+    try:
+        with span(name, **attributes):
+            yield
+    finally:
+        STAGE_LATENCY.labels(stage=name).observe(time.perf_counter() - t0)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Counts a cache lookup and tags the current span with its result."""
+    result = "hit" if hit else "miss"
+    CACHE_REQUESTS.labels(cache=cache, result=result).inc()
+    annotate(cache=result)
+
+
+def record_llm_usage(result: Any) -> None:
+    """
+    Aggregates the accounting of a successful LLM call (an llm_client.LLMResult).
+    Truncation rate = vitiscan_llm_finish_total{reason="length"} / all reasons.
+    """
+    if result.prompt_tokens is not None:
+        LLM_TOKENS.labels(kind="prompt").inc(result.prompt_tokens)
+        LLM_PROMPT_TOKENS.observe(result.prompt_tokens)
+    if result.completion_tokens is not None:
+        LLM_TOKENS.labels(kind="completion").inc(result.completion_tokens)
+        LLM_COMPLETION_TOKENS.observe(result.completion_tokens)
+    if result.tokens_per_second is not None:
+        LLM_THROUGHPUT.observe(result.tokens_per_second)
+    LLM_FINISH_REASONS.labels(reason=result.finish_reason or "unknown").inc()
+
+
+def record_parse(path: str) -> None:
+    """Counts an LLM output parsing path and tags the current span with it."""
+    PARSE_OUTCOMES.labels(path=path).inc()
+    annotate(path=path)
+
+
+# ── Query-vector cache (functools.lru_cache) ───────────────────────────────────
+
+class _QueryVectorCacheCollector:
+    """
+    Reports the embed_query lru_cache statistics at scrape time, so the
+    memoized hot path carries no instrumentation at all.
+    """
+
+    @staticmethod
+    def _family() -> CounterMetricFamily:
+        return CounterMetricFamily(
+            "vitiscan_query_vector_cache_requests",
+            "Query-vector cache lookups, by result (hit / miss).",
+            labels=["result"],
+        )
+
+    def describe(self):
+        # Lets the registry check metric names without importing weaviate_client
+        yield self._family()
+
+    def collect(self):
+        from app.weaviate_client import embed_query
+
+        info   = embed_query.cache_info()
+        family = self._family()
+        family.add_metric(["hit"], info.hits)
+        family.add_metric(["miss"], info.misses)
+        yield family
+
+
+REGISTRY.register(_QueryVectorCacheCollector())
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Returns:
+        Tuple (body, content_type) for the /metrics endpoint
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
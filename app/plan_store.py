@@ -0,0 +1,465 @@
+"""
+plan_store.py — Precomputed treatment plans in a versioned local store.
+
+The categorical inputs of /solutions form a small grid: every label × mode ×
+severity × season (7 × 2 × 3 × 5 = 210 plans, see plan_grid; labels with the
+"template" policy are left out, as they never reach the store). A nightly job
+runs the full pipeline over the grid with bounded parallelism, validates each
+plan and writes them into a SQLite file (PLAN_STORE_PATH) as a new version:
+
+- runs  : one row per build (version, status, strategy, model, rules version,
+          corpus hash, plan / failure counts)
+- plans : one row per (version, label, mode, severity, season), plan as JSON
+
+A build goes live only when at most --max-failures plans failed validation;
+otherwise it is kept as "rejected" and the previous live version keeps being
+served. Old versions are garbage-collected (PLAN_STORE_KEEP_VERSIONS).
+
+The API loads the live version in memory and re-checks the file every
+PLAN_STORE_CHECK_INTERVAL_S, so a build from another process is picked up
+without restart. A stored plan is served with the dosage of the requested
+area in well under a millisecond; the LLM is only called on a miss or a
+forced refresh (?refresh=true, which also updates the live version).
+
+Usage:
+    python -m app.plan_store build --workers 4     # nightly (cron / CI schedule)
+    python -m app.plan_store status
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import (
+    DISEASE_NAMES,
+    LABEL_POLICIES,
+    PLAN_PRECOMPUTE_AREA_M2,
+    PLAN_PRECOMPUTE_WORKERS,
+    PLAN_STORE_CHECK_INTERVAL_S,
+    PLAN_STORE_KEEP_VERSIONS,
+    PLAN_STORE_PATH,
+    SEASONS,
+    SUPPORTED_MODES,
+    SUPPORTED_SEVERITIES,
+)
+
+logger = logging.getLogger(__name__)
+
+# (cnn_label, mode, severity, season)
+PlanKey = Tuple[str, str, str, str]
+
+# Representative date of each season, sent as date_iso when precomputing
+SEASON_DATES = {
+    "winter": "2024-01-15",
+    "spring": "2024-04-15",
+    "summer": "2024-07-15",
+    "autumn": "2024-10-15",
+    "unknown": "",
+}
+
+# Result fields that depend on the request, not on the plan key
+_REQUEST_FIELDS = ("area_m2", "treatment_plan", "policy", "timings", "profile")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    version      INTEGER PRIMARY KEY AUTOINCREMENT,
+    status       TEXT NOT NULL,            -- building, live, rejected, retired
+    strategy     TEXT NOT NULL,
+    created_at   TEXT NOT NULL,
+    finished_at  TEXT,
+    model        TEXT,
+    rules        TEXT,
+    corpus_hash  TEXT,
+    plans        INTEGER NOT NULL DEFAULT 0,
+    failed       INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS plans (
+    version      INTEGER NOT NULL REFERENCES runs(version),
+    cnn_label    TEXT NOT NULL,
+    mode         TEXT NOT NULL,
+    severity     TEXT NOT NULL,
+    season       TEXT NOT NULL,
+    plan         TEXT NOT NULL,
+    generated_at TEXT NOT NULL,
+    PRIMARY KEY (version, cnn_label, mode, severity, season)
+);
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ── Grid and validation ────────────────────────────────────────────────────────
+
+def plan_grid() -> List[PlanKey]:
+    """
+    Every (label, mode, severity, season) combination the store can serve.
+    Labels with the "template" policy (LABEL_POLICIES) are answered before the
+    store is looked up, so generating their plans would be wasted LLM calls.
+    """
+    return [
+        (cnn_label, mode, severity, season)
+        for cnn_label in DISEASE_NAMES
+        if LABEL_POLICIES.get(cnn_label) != "template"
+        for mode in SUPPORTED_MODES
+        for severity in SUPPORTED_SEVERITIES
+        for season in SEASONS
+    ]
+
+
+def validate_plan(result: Dict[str, Any], strategy: str = "rag") -> List[str]:
+    """
+    Checks a pipeline result before it is stored.
+
+    Returns:
+        List of problems (empty if the plan can be served)
+    """
+    problems = []
+    if result.get("strategy") != strategy:
+        problems.append(f"produced by '{result.get('strategy')}' instead of '{strategy}'")
+    if len(str(result.get("diagnostic") or "").strip()) < 20:
+        problems.append("diagnostic missing or too short")
+    for field in ("treatment_actions", "preventive_actions", "warnings"):
+        items = result.get(field)
+        if not isinstance(items, list) or not all(isinstance(i, str) and i.strip() for i in items):
+            problems.append(f"{field} is not a list of non-empty strings")
+        elif any(i.lstrip().startswith(("{", "[", "```")) for i in items):
+            problems.append(f"{field} contains unparsed JSON or markdown")
+    if not (result.get("treatment_actions") or result.get("preventive_actions")):
+        problems.append("no treatment or preventive action")
+    return problems
+
+
+# ── Store ──────────────────────────────────────────────────────────────────────
+
+class PlanStore:
+    """
+    SQLite plan store. Each method opens its own short-lived connection, so
+    one instance can be shared by threads and processes.
+    """
+
+    def __init__(self, path: Path = Path(PLAN_STORE_PATH)):
+        self.path = Path(path)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection committed on success, rolled back on error, always closed."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.executescript(_SCHEMA)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create_run(self, strategy: str, **provenance: Optional[str]) -> int:
+        """Opens a new version in "building" status and returns its number."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (status, strategy, created_at, model, rules, corpus_hash) "
+                "VALUES ('building', ?, ?, ?, ?, ?)",
+                (strategy, _now(), provenance.get("model"), provenance.get("rules"), provenance.get("corpus_hash")),
+            )
+            return cursor.lastrowid
+
+    def put(self, version: int, key: PlanKey, result: Dict[str, Any]) -> None:
+        plan = {k: v for k, v in result.items() if k not in _REQUEST_FIELDS}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO plans VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (version, *key, json.dumps(plan, ensure_ascii=False), _now()),
+            )
+
+    def finish_run(self, version: int, failed: int, live: bool) -> None:
+        """Closes a build; a live build retires the previous live version."""
+        with self._connect() as conn:
+            if live:
+                conn.execute("UPDATE runs SET status = 'retired' WHERE status = 'live'")
+            conn.execute(
+                "UPDATE runs SET status = ?, finished_at = ?, failed = ?, "
+                "plans = (SELECT COUNT(*) FROM plans WHERE version = ?) WHERE version = ?",
+                ("live" if live else "rejected", _now(), failed, version, version),
+            )
+
+    def live_run(self) -> Optional[Dict[str, Any]]:
+        if not self.path.exists():
+            return None
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM runs WHERE status = 'live' ORDER BY version DESC LIMIT 1").fetchone()
+        return dict(row) if row else None
+
+    def runs(self) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute("SELECT * FROM runs ORDER BY version")]
+
+    def load(self, version: int) -> Dict[PlanKey, Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT cnn_label, mode, severity, season, plan FROM plans WHERE version = ?", (version,),
+            ).fetchall()
+        return {(r["cnn_label"], r["mode"], r["severity"], r["season"]): json.loads(r["plan"]) for r in rows}
+
+    def garbage_collect(self, keep: int = PLAN_STORE_KEEP_VERSIONS) -> List[int]:
+        """Deletes all but the `keep` newest versions (never the live one)."""
+        with self._connect() as conn:
+            versions = [r["version"] for r in conn.execute(
+                "SELECT version FROM runs WHERE status != 'live' AND status != 'building' ORDER BY version DESC"
+            )]
+            stale = versions[max(keep - 1, 0):]
+            for version in stale:
+                conn.execute("DELETE FROM plans WHERE version = ?", (version,))
+                conn.execute("DELETE FROM runs WHERE version = ?", (version,))
+        return stale
+
+
+# ── Serving (request path) ─────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class _LiveVersion:
+    """
+    Live version served from memory. Never mutated: a reload or refresh swaps
+    in a new snapshot under _LIVE_LOCK, so a reader that took `_LIVE` once
+    always sees a version, strategy and plans that belong together.
+    """
+
+    version:    Optional[int] = None
+    strategy:   Optional[str] = None
+    plans:      Dict[PlanKey, Dict[str, Any]] = field(default_factory=dict)
+    checked_at: Optional[float] = None
+
+
+_LIVE = _LiveVersion()
+_LIVE_LOCK = threading.Lock()
+
+
+def reload_plan_store() -> None:
+    """Forces the next lookup to re-read the live version (e.g. after a build or a new PLAN_STORE_PATH)."""
+    global _LIVE
+    with _LIVE_LOCK:
+        _LIVE = _LiveVersion()
+
+
+def _live_plans() -> _LiveVersion:
+    global _LIVE
+    live = _LIVE
+    if live.checked_at is not None and time.monotonic() - live.checked_at < PLAN_STORE_CHECK_INTERVAL_S:
+        return live
+    with _LIVE_LOCK:
+        if _LIVE is live:                           # not refreshed by another thread meanwhile
+            store = PlanStore(Path(PLAN_STORE_PATH))
+            try:
+                run = store.live_run()
+                if run is None:
+                    live = _LiveVersion()
+                elif run["version"] != live.version:
+                    live = _LiveVersion(run["version"], run["strategy"], store.load(run["version"]))
+                    logger.info(f"Plan store version {live.version} loaded ({len(live.plans)} plans)")
+            except sqlite3.Error as e:
+                logger.warning(f"Plan store unreadable ({e}), keeping version {live.version}")
+            _LIVE = replace(live, checked_at=time.monotonic())
+        return _LIVE
+
+
+def load_live_version() -> Tuple[Optional[int], int]:
+    """
+    Loads the live version in memory now (startup warm-up) instead of on the
+    first lookup.
+
+    Returns:
+        Tuple (version, plan count); version is None if there is no live version
+    """
+    live = _live_plans()
+    return live.version, len(live.plans)
+
+
+def lookup_plan(key: PlanKey, strategy: str = "rag") -> Optional[Dict[str, Any]]:
+    """
+    Returns:
+        A copy of the stored plan (with its `plan_version`), or None if the
+        live version has no plan for this key / strategy (or PLAN_STORE_PATH
+        is empty: store disabled)
+    """
+    if not PLAN_STORE_PATH:
+        return None
+    live = _live_plans()
+    plan = live.plans.get(key) if live.strategy == strategy else None
+    if plan is None:
+        return None
+    copy = {k: list(v) if isinstance(v, list) else v for k, v in plan.items()}
+    copy["plan_version"] = live.version
+    return copy
+
+
+def refresh_plan(key: PlanKey, result: Dict[str, Any], strategy: str = "rag") -> bool:
+    """
+    Writes a freshly generated plan into the live version (forced refresh).
+
+    Returns:
+        True if stored, False if there is no live version for this strategy
+        or the plan failed validation
+    """
+    global _LIVE
+    if not PLAN_STORE_PATH:
+        return False
+    live = _live_plans()
+    if live.version is None or live.strategy != strategy or validate_plan(result, strategy):
+        return False
+    PlanStore(Path(PLAN_STORE_PATH)).put(live.version, key, result)
+    plan = {k: v for k, v in result.items() if k not in _REQUEST_FIELDS}
+    with _LIVE_LOCK:
+        if _LIVE.version == live.version:
+            _LIVE = replace(_LIVE, plans={**_LIVE.plans, key: plan})
+    return True
+
+
+# ── Precomputation (nightly job) ───────────────────────────────────────────────
+
+Generator = Callable[[Dict[str, Any], str], Dict[str, Any]]
+
+
+def _generate_one(generate: Generator, key: PlanKey, strategy: str, retries: int) -> Tuple[PlanKey, Dict[str, Any], List[str]]:
+    cnn_label, mode, severity, season = key
+    payload = {
+        "cnn_label": cnn_label,
+        "mode":      mode,
+        "severity":  severity,
+        "area_m2":   PLAN_PRECOMPUTE_AREA_M2,
+        "date_iso":  SEASON_DATES[season],
+    }
+    result: Dict[str, Any] = {}
+    problems = ["not generated"]
+    for _ in range(retries + 1):
+        try:
+            result = generate(payload, strategy)
+            problems = validate_plan(result, strategy)
+        except Exception as e:          # one failed plan must not stop the build
+            problems = [f"{type(e).__name__}: {e}"]
+        if not problems:
+            break
+    return key, result, problems
+
+
+def precompute_plans(
+    store: PlanStore,
+    workers: int = PLAN_PRECOMPUTE_WORKERS,
+    strategy: str = "rag",
+    retries: int = 1,
+    max_failures: int = 0,
+    generate: Optional[Generator] = None,
+    keys: Optional[List[PlanKey]] = None,
+) -> Dict[str, Any]:
+    """
+    Generates and validates the plan of every grid key into a new version.
+
+    At most `workers` pipeline runs are in flight (LLM calls are I/O bound);
+    an invalid plan is retried `retries` times, then left out of the version
+    (served live at request time).
+
+    Args:
+        store:        Target plan store
+        workers:      Maximum concurrent pipeline runs
+        strategy:     Generation strategy ("rag" or "extractive")
+        retries:      Extra attempts per invalid plan
+        max_failures: Failed plans tolerated for the version to go live
+        generate:     fn(payload, strategy) → result; defaults to the full
+                      pipeline without label policies or plan store
+        keys:         Grid subset (defaults to plan_grid())
+
+    Returns:
+        Build summary: version, status, plans, failed, failures, duration_s
+    """
+    if generate is None:
+        from app.rag_pipeline import _generate_treatment_advice as generate
+    keys = plan_grid() if keys is None else keys
+
+    version = store.create_run(strategy, **_provenance())
+    t0 = time.perf_counter()
+    failures: Dict[str, List[str]] = {}
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = [pool.submit(_generate_one, generate, key, strategy, retries) for key in keys]
+        for done, future in enumerate(as_completed(futures), start=1):
+            key, result, problems = future.result()
+            if problems:
+                failures["/".join(key)] = problems
+            else:
+                store.put(version, key, result)
+            if done % 25 == 0 or done == len(keys):
+                logger.info(f"Plan store v{version}: {done}/{len(keys)} plans ({len(failures)} failed)")
+
+    live = len(failures) <= max_failures
+    store.finish_run(version, failed=len(failures), live=live)
+    store.garbage_collect()
+    reload_plan_store()
+    return {
+        "version":    version,
+        "status":     "live" if live else "rejected",
+        "plans":      len(keys) - len(failures),
+        "failed":     len(failures),
+        "failures":   failures,
+        "duration_s": round(time.perf_counter() - t0, 2),
+    }
+
+
+def _provenance() -> Dict[str, Optional[str]]:
+    """Model, rule set and corpus the plans were generated from."""
+    from app.config import HF_MODEL_ID
+    from app.dosage_rules import get_rule_set
+    from app.snapshot import compute_corpus_hash
+
+    return {"model": HF_MODEL_ID, "rules": get_rule_set().version, "corpus_hash": compute_corpus_hash()}
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Precomputed treatment plan store.")
+    parser.add_argument("--store", default=PLAN_STORE_PATH, help="SQLite file (default: PLAN_STORE_PATH)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Precompute the full plan grid into a new version")
+    build_parser.add_argument("--workers", type=int, default=PLAN_PRECOMPUTE_WORKERS)
+    build_parser.add_argument("--strategy", choices=("rag", "extractive"), default="rag")
+    build_parser.add_argument("--retries", type=int, default=1, help="Extra attempts per invalid plan")
+    build_parser.add_argument("--max-failures", type=int, default=0,
+                              help="Failed plans tolerated for the version to go live")
+
+    subparsers.add_parser("status", help="List the store versions")
+
+    args  = parser.parse_args(argv)
+    store = PlanStore(Path(args.store))
+
+    if args.command == "build":
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        summary = precompute_plans(
+            store, workers=args.workers, strategy=args.strategy,
+            retries=args.retries, max_failures=args.max_failures,
+        )
+        for key, problems in sorted(summary["failures"].items()):
+            print(f"[PLANS] FAILED {key}: {'; '.join(problems)}")
+        print(f"[PLANS] Version {summary['version']} {summary['status']}: {summary['plans']} plans, "
+              f"{summary['failed']} failed in {summary['duration_s']}s → {store.path.resolve()}")
+        return 0 if summary["status"] == "live" else 1
+
+    for run in store.runs():
+        print(f"[PLANS] v{run['version']:<4} {run['status']:<9} {run['strategy']:<10} "
+              f"{run['plans']:>4} plans {run['failed']:>3} failed  {run['created_at']}  "
+              f"model={run['model']} rules={run['rules']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
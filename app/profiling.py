@@ -0,0 +1,178 @@
+"""
+profiling.py — On-demand profiling of individual API requests.
+
+Enabled per request with `?profile=true` on /solutions, for callers sending
+the X-Admin-Token header (ADMIN_TOKEN). Nothing runs when it is not requested.
+
+Modes (PROFILE_MODE, or `?profile_mode=`):
+- sampling      : a background thread samples the request thread's Python
+                  stack every PROFILE_SAMPLE_INTERVAL_MS. Output: collapsed
+                  stacks (`.folded`), one "frame;frame;frame count" per line,
+                  readable by flamegraph.pl, speedscope or inferno.
+- deterministic : cProfile on the request thread. Output: a `.prof` file
+                  (pstats, `snakeviz file.prof` renders it as HTML).
+
+Profiles are saved under PROFILE_DIR; the response carries the file path
+and the top functions by self time.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from app.config import PROFILE_DIR, PROFILE_MODE, PROFILE_SAMPLE_INTERVAL_MS
+
+PROFILE_MODES = ("sampling", "deterministic")
+
+
+# ── Sampling profiler ──────────────────────────────────────────────────────────
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval from a daemon thread.
+    Cost is paid by the sampler, not by the profiled code.
+    """
+
+    def __init__(self, thread_id: int, interval_s: float):
+        self.thread_id  = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples    = 0
+        self._stop      = threading.Event()
+        self._thread    = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Collapsed-stack text, heaviest stacks first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = 15) -> List[Dict[str, Any]]:
+        """Leaf frames by number of samples (self time)."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [
+            {"function": frame, "samples": count, "share": round(count / max(self.samples, 1), 3)}
+            for frame, count in leaves.most_common(limit)
+        ]
+
+
+# ── Profiling session ──────────────────────────────────────────────────────────
+
+class ProfileSession:
+    """Result holder filled when the profiled() block exits."""
+
+    def __init__(self, mode: str, label: str):
+        self.mode   = mode
+        self.label  = label
+        self.report: Dict[str, Any] = {}
+
+
+def _output_path(label: str, suffix: str) -> Path:
+    out_dir = Path(PROFILE_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    return out_dir / f"{label}-{stamp}{suffix}"
+
+
+@contextmanager
+def profiled(mode: str = PROFILE_MODE, label: str = "request") -> Iterator[ProfileSession]:
+    """
+    Profiles the enclosed block (which must run on the calling thread).
+
+    Raises:
+        ValueError: If the mode is unknown
+
+    Usage:
+        with profiled("sampling", label="solutions") as session:
+            advice = generate_treatment_advice(payload)
+        session.report  # {"mode", "file", "duration_ms", "top", ...}
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}' (expected one of {PROFILE_MODES}).")
+
+    session = ProfileSession(mode, label)
+    t0 = time.perf_counter()
+
+    if mode == "sampling":
+        sampler = SamplingProfiler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        sampler.start()
+        try:
+            yield session
+        finally:
+            sampler.stop()
+            path = _output_path(label, ".folded")
+            path.write_text(sampler.collapsed(), encoding="utf-8")
+            session.report = {
+                "mode":        mode,
+                "format":      "collapsed",
+                "file":        str(path),
+                "duration_ms": round((time.perf_counter() - t0) * 1000, 1),
+                "samples":     sampler.samples,
+                "interval_ms": PROFILE_SAMPLE_INTERVAL_MS,
+                "top":         sampler.top(),
+            }
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield session
+    finally:
+        profiler.disable()
+        path = _output_path(label, ".prof")
+        profiler.dump_stats(str(path))
+        session.report = {
+            "mode":        mode,
+            "format":      "pstats",
+            "file":        str(path),
+            "duration_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "top":         _pstats_top(profiler),
+        }
+
+
+def _pstats_top(profiler: cProfile.Profile, limit: int = 15) -> List[Dict[str, Any]]:
+    """Functions by self time (tottime)."""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{name} ({os.path.basename(filename)}:{line})",
+            "calls":    ncalls,
+            "self_ms":  round(tottime * 1000, 3),
+            "cum_ms":   round(cumtime * 1000, 3),
+        }
+        for (filename, line, name), (_, ncalls, tottime, cumtime, _) in rows
+    ]
@@ -4,6 +4,41 @@ prompts.py — LLM prompt construction for treatment plan generation.
 
 from typing import List, Dict
 
+from app.tokens import count_tokens, truncate_tokens
+
+
+def fit_context_budget(chunks: List[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
+    """
+    Keeps the chunks that fit a prompt context budget, in retrieval
+    (relevance) order: a chunk too large for the remaining budget is
+    skipped, smaller ones after it can still fit. If not even the first
+    chunk fits, it is cut to the budget. A chunk's size is the `token_count`
+    stored at ingestion; its text is only counted when that is missing.
+
+    Args:
+        chunks: Retrieved chunks (dicts with a "text" key, and "token_count"
+                when retrieved from the index), most relevant first
+        max_tokens: Budget in tokens, counted like chunk sizes (0 = no budget)
+
+    Returns:
+        The kept chunks (the input list itself when there is no budget)
+    """
+    if max_tokens <= 0:
+        return chunks
+    kept: List[Dict[str, str]] = []
+    used = 0
+    for chunk in chunks:
+        cost = chunk.get("token_count")
+        if cost is None:
+            cost = count_tokens(chunk["text"])
+        if used + cost <= max_tokens:
+            kept.append(chunk)
+            used += cost
+    if not kept and chunks:
+        text = truncate_tokens(chunks[0]["text"], max_tokens)
+        kept.append({**chunks[0], "text": text, "token_count": count_tokens(text)})
+    return kept
+
 
 def build_treatment_prompt(
     cnn_label: str,
@@ -1,28 +1,82 @@
 """
 rag_pipeline.py — Main RAG pipeline for treatment plan generation.
 
+Labels whose advice does not need generation are short-circuited by their
+policy (LABEL_POLICIES): "template" plans come from the knowledge sheets
+without retrieval or LLM, "cached" plans are generated once and reused.
+Other labels are first looked up in the nightly plan store (app.plan_store).
+
+The request's quality tier (QUALITY_TIERS: fast, balanced, full) sets the
+retrieval depth, the prompt context budget, the completion cap and the
+model; "fast" never calls the LLM (plan store, else an extractive plan).
+
 Pipeline steps:
 1. Infer season from date
 2. Retrieve relevant knowledge chunks from Weaviate
-3. Build RAG prompt and call LLM
+3. Build RAG prompt and call LLM — or, with the extractive strategy,
+   assemble the plan from the knowledge sheets (see app.extractive)
 4. Compute dosage via dosage_rules
 5. Return structured response for the API
 """
 
 import json
+import logging
 import re
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 from app.dosage_rules import compute_dosage
+from app.extractive import build_extractive_plan
 from app.llm_client import LLMError, call_llm
-from app.prompts import build_treatment_prompt
-from app.weaviate_client import search_treatment_chunks, weaviate_client, weaviate_available
-from app.config import DISEASE_NAMES
+from app.prompts import build_treatment_prompt, fit_context_budget
+from app.health import weaviate_usable
+from app.metrics import (
+    FALLBACKS,
+    PLAN_CACHE_STALE,
+    PLAN_POLICIES,
+    PLAN_REFRESH_LATENCY,
+    record_cache,
+    record_parse,
+    stage,
+)
+from app.plan_store import PlanKey, lookup_plan, refresh_plan
+from app.weaviate_client import search_treatment_chunks, weaviate_client
+from app.config import (
+    DEFAULT_QUALITY,
+    DISEASE_NAMES,
+    EXTRACTIVE_FALLBACK,
+    GENERATION_STRATEGY,
+    LABEL_POLICIES,
+    PLAN_CACHE_HARD_TTL_S,
+    PLAN_CACHE_REFRESH_WORKERS,
+    PLAN_CACHE_SOFT_TTL_S,
+    QUALITY_TIERS,
+    RETRIEVAL_BACKEND,
+    RETRIEVAL_CACHE_TTL_S,
+    SUPPORTED_MODES,
+    SUPPORTED_SEVERITIES,
+)
+
+GENERATION_STRATEGIES = ("rag", "extractive")
+POLICIES = ("template", "cached", "llm")
+
+_unknown_policies = {label: p for label, p in LABEL_POLICIES.items() if p not in POLICIES}
+if _unknown_policies:
+    raise ValueError(f"LABEL_POLICIES: unknown policy in {_unknown_policies} (expected one of {POLICIES}).")
+
+QUALITIES = tuple(QUALITY_TIERS)
+if DEFAULT_QUALITY not in QUALITIES:
+    raise ValueError(f"DEFAULT_QUALITY: unknown tier '{DEFAULT_QUALITY}' (expected one of {QUALITIES}).")
 
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
+logger = logging.getLogger(__name__)
+
 
 # ── Static fallback ──────────────────────────────────────────────────────────
 
@@ -169,9 +223,7 @@ def _build_fallback_response(payload: Dict[str, Any]) -> Dict[str, Any]:
         "warnings":           [],
     })
 
-    dosage = compute_dosage(cnn_label, mode, area_m2, severity=severity)
-    if not dosage:
-        dosage = {"note": "No dosage rule available for this disease/mode/severity combination."}
+    dosage = _compute_dosage(payload)
 
     base_warnings = [
         "These recommendations are indicative only.",
@@ -191,6 +243,7 @@ def _build_fallback_response(payload: Dict[str, Any]) -> Dict[str, Any]:
         "treatment_actions":  fallback["treatment_actions"],
         "preventive_actions": fallback["preventive_actions"],
         "warnings":           base_warnings + fallback["warnings"],
+        "strategy":           "static",
         "raw_llm_output":     "Fallback mode — Weaviate unavailable.",
     }
 
@@ -332,6 +385,7 @@ def parse_llm_structured_response(raw: str) -> Dict[str, Any]:
     }
 
     if not raw or not raw.strip():
+        record_parse("empty")
         return default
 
     text = raw.strip()
@@ -349,12 +403,14 @@ def parse_llm_structured_response(raw: str) -> Dict[str, Any]:
         data = _heuristic_parse_from_text(text)
         if any([data.get("diagnostic"), data.get("treatment_actions"),
                 data.get("preventive_actions"), data.get("warnings")]):
+            record_parse("heuristic")
             return {
                 "diagnostic":        (data.get("diagnostic") or "").strip(),
                 "treatment_actions":  _to_str_list(data.get("treatment_actions")),
                 "preventive_actions": _to_str_list(data.get("preventive_actions")),
                 "warnings":           _to_str_list(data.get("warnings")),
             }
+        record_parse("raw_text")
         return default
 
     # Light cleanup
@@ -370,16 +426,20 @@ def parse_llm_structured_response(raw: str) -> Dict[str, Any]:
     candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
 
     # Parse JSON (with double-encoding fallback)
+    path = "json"
     try:
         data = json.loads(candidate)
         if isinstance(data, str):
             data = json.loads(data)
     except Exception:
         data = _heuristic_parse_from_text(text)
+        path = "heuristic"
 
     if not isinstance(data, dict):
+        record_parse("raw_text")
         return default
 
+    record_parse(path)
     return {
         "diagnostic":        str(data.get("diagnostic", "")).strip() or default["diagnostic"],
         "treatment_actions":  _to_str_list(data.get("treatment_actions")),
@@ -388,72 +448,409 @@ def parse_llm_structured_response(raw: str) -> Dict[str, Any]:
     }
 
 
+# ── Retrieval ──────────────────────────────────────────────────────────────────
+
+# (cnn_label, mode, severity, top_k) → (stored_at, chunks)
+_RETRIEVAL_CACHE: Dict[Tuple[str, str, str, int], Tuple[float, List[Dict[str, Any]]]] = {}
+_RETRIEVAL_CACHE_LOCK = threading.Lock()
+
+# Retrieval depths of the quality tiers (see retrieve_chunks)
+_TIER_DEPTHS = {tier["top_k"] for tier in QUALITY_TIERS.values()}
+
+
+def clear_retrieval_cache() -> None:
+    """Empties the retrieval cache (e.g. after a re-index)."""
+    with _RETRIEVAL_CACHE_LOCK:
+        _RETRIEVAL_CACHE.clear()
+
+
+def retrieve_chunks(
+    cnn_label: str,
+    mode: str,
+    severity: str,
+    top_k: int = 8,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Retrieves knowledge chunks from the configured backend:
+    - RETRIEVAL_BACKEND=snapshot : in-process index (see app.snapshot)
+    - otherwise                  : Weaviate, with a retry without mode filter
+
+    Non-empty results are cached for RETRIEVAL_CACHE_TTL_S seconds. Results
+    are ranked, so a cached deeper result (quality tier with a larger top_k)
+    also answers a shallower query with its first top_k chunks.
+
+    Returns:
+        List of chunk dicts (possibly empty), or None if Weaviate is not
+        configured or found down by the health monitor (caller uses the
+        static fallback)
+    """
+    key = (cnn_label, mode, severity, top_k)
+    now = time.monotonic()
+    with _RETRIEVAL_CACHE_LOCK:
+        for depth in [top_k] + sorted(_TIER_DEPTHS - {top_k}):
+            cached = _RETRIEVAL_CACHE.get((cnn_label, mode, severity, depth)) if depth >= top_k else None
+            if cached and now - cached[0] < RETRIEVAL_CACHE_TTL_S:
+                record_cache("retrieval", hit=True)
+                return cached[1][:top_k]
+    record_cache("retrieval", hit=False)
+
+    if RETRIEVAL_BACKEND == "snapshot":
+        from app.snapshot import search_snapshot_chunks
+
+        chunks = search_snapshot_chunks(
+            disease_input=cnn_label,
+            mode=mode,
+            severity=severity,
+            top_k=top_k,
+        )
+
+    else:
+        # Cached health state: no config parsing or network call per request
+        if not weaviate_usable():
+            return None
+
+        with weaviate_client(shared=True) as client:
+            if client is None:
+                return None
+
+            chunks = search_treatment_chunks(
+                client=client,
+                disease_input=cnn_label,
+                mode=mode,
+                severity=severity,
+                top_k=top_k,
+            )
+            # Fallback: retry without mode filter
+            if not chunks:
+                chunks = search_treatment_chunks(
+                    client=client,
+                    disease_input=cnn_label,
+                    mode=None,
+                    severity=severity,
+                    top_k=top_k,
+                )
+
+    if chunks:
+        with _RETRIEVAL_CACHE_LOCK:
+            _RETRIEVAL_CACHE[key] = (time.monotonic(), chunks)
+    return chunks
+
+
+# ── Label policies ─────────────────────────────────────────────────────────────
+
+def label_policy(cnn_label: str) -> str:
+    """Policy serving a label: "template", "cached" or "llm" (see LABEL_POLICIES)."""
+    return LABEL_POLICIES.get(cnn_label, "llm")
+
+
+@lru_cache(maxsize=128)
+def _template_plan(cnn_label: str, mode: str, severity: str) -> Dict[str, Any]:
+    """Template plan of a label, built once from the extractive index."""
+    return build_extractive_plan(cnn_label, mode, severity)
+
+
+def warm_template_plans() -> int:
+    """
+    Builds the template plans of every "template" policy label (startup warm-up).
+
+    Returns:
+        Number of (label, mode, severity) plans built
+    """
+    built = 0
+    for cnn_label in DISEASE_NAMES:
+        if label_policy(cnn_label) != "template":
+            continue
+        for mode in SUPPORTED_MODES:
+            for severity in SUPPORTED_SEVERITIES:
+                _template_plan(cnn_label, mode, severity)
+                built += 1
+    return built
+
+
+def _template_advice(payload: Dict[str, Any], season: str, refresh: bool = False) -> Dict[str, Any]:
+    cnn_label = payload["cnn_label"]
+    mode      = str(payload["mode"]).strip().lower()
+    severity  = str(payload["severity"]).strip().lower()
+
+    with stage("template"):
+        if refresh:
+            # Template plans are never stored: rebuild them from the current extractive index
+            _template_plan.cache_clear()
+        plan = _template_plan(cnn_label, mode, severity)
+    with stage("dosage"):
+        dosage = _compute_dosage(payload)
+    return _build_result(
+        payload, season, dosage, _copy_plan(plan), strategy="extractive",
+        raw_llm_output="Template plan — label policy 'template', no retrieval or LLM call.",
+    )
+
+
+# ((cnn_label, mode, severity, season), strategy, quality) → (stored_at, result)
+PlanCacheKey = Tuple[PlanKey, str, str]
+_PLAN_CACHE: Dict[PlanCacheKey, Tuple[float, Dict[str, Any]]] = {}
+_PLAN_CACHE_LOCK = threading.Lock()
+
+# Background regenerations in flight (at most one per key), and their pool
+_REVALIDATING: Dict[PlanCacheKey, Future] = {}
+_REFRESH_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+# Only complete plans are reused: a fallback answer would hide the recovery
+_CACHEABLE_STRATEGIES = ("rag", "extractive")
+
+
+def clear_plan_cache() -> None:
+    """Empties the plans of the "cached" and "template" policies (e.g. after a re-index)."""
+    with _PLAN_CACHE_LOCK:
+        _PLAN_CACHE.clear()
+    _template_plan.cache_clear()
+
+
+def _plan_key(payload: Dict[str, Any], season: str) -> PlanKey:
+    return (
+        payload["cnn_label"],
+        str(payload["mode"]).strip().lower(),
+        str(payload["severity"]).strip().lower(),
+        season,
+    )
+
+
+def _stored_advice(payload: Dict[str, Any], plan_key: PlanKey, strategy: str) -> Optional[Dict[str, Any]]:
+    """Plan of the nightly plan store with the dosage of the requested area, or None."""
+    with stage("plan_store"):
+        plan = lookup_plan(plan_key, strategy)
+        record_cache("plan_store", hit=plan is not None)
+    if plan is None:
+        return None
+    with stage("dosage"):
+        dosage = _compute_dosage(payload)
+    return {**plan, "area_m2": float(payload["area_m2"]), "treatment_plan": dosage}
+
+
+def _cached_advice(
+    payload: Dict[str, Any],
+    season: str,
+    strategy: str,
+    refresh: bool = False,
+    quality: str = "full",
+) -> Dict[str, Any]:
+    """
+    Plan generated once per (label, mode, severity, season, strategy, quality), then
+    served with stale-while-revalidate:
+    - younger than PLAN_CACHE_SOFT_TTL_S : served as is
+    - up to PLAN_CACHE_HARD_TTL_S        : served as is, and one background
+                                           regeneration replaces it
+    - older (or refresh)                 : regenerated in the request
+
+    Area, region and growth stage only change the dosage, recomputed on
+    every request.
+    """
+    key = (_plan_key(payload, season), strategy, quality)
+    with _PLAN_CACHE_LOCK:
+        cached = None if refresh else _PLAN_CACHE.get(key)
+    age = time.monotonic() - cached[0] if cached else None
+    if cached and age < PLAN_CACHE_HARD_TTL_S:
+        record_cache("plan", hit=True)
+        if age >= PLAN_CACHE_SOFT_TTL_S:
+            PLAN_CACHE_STALE.inc()
+            _revalidate(key, payload, season)
+        with stage("dosage"):
+            dosage = _compute_dosage(payload)
+        return {**_copy_plan(cached[1]), "area_m2": float(payload["area_m2"]), "treatment_plan": dosage}
+    record_cache("plan", hit=False)
+
+    result = _generate_treatment_advice(payload, strategy, season, quality)
+    _cache_plan(key, result)
+    return result
+
+
+def _cache_plan(key: PlanCacheKey, result: Dict[str, Any]) -> bool:
+    """Stores a complete plan (not a fallback one); returns whether it was stored."""
+    if result["strategy"] not in _CACHEABLE_STRATEGIES:
+        return False
+    with _PLAN_CACHE_LOCK:
+        _PLAN_CACHE[key] = (time.monotonic(), _copy_plan(result))
+    return True
+
+
+def _revalidate(key: PlanCacheKey, payload: Dict[str, Any], season: str) -> None:
+    """Schedules the background regeneration of a stale plan, unless one is running."""
+    global _REFRESH_EXECUTOR
+    with _PLAN_CACHE_LOCK:
+        if key in _REVALIDATING:
+            return
+        if _REFRESH_EXECUTOR is None:
+            _REFRESH_EXECUTOR = ThreadPoolExecutor(
+                max_workers=PLAN_CACHE_REFRESH_WORKERS, thread_name_prefix="plan-refresh",
+            )
+        _REVALIDATING[key] = _REFRESH_EXECUTOR.submit(_regenerate, key, dict(payload), season)
+
+
+def _regenerate(key: PlanCacheKey, payload: Dict[str, Any], season: str) -> None:
+    """
+    Background job: regenerates a plan and swaps it into the cache. On
+    failure the stale plan stays until the hard TTL.
+    """
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        if _cache_plan(key, _generate_treatment_advice(payload, key[1], season, key[2])):
+            outcome = "ok"
+    except Exception as e:
+        logger.warning(f"Background regeneration of plan {key} failed: {e}")
+    finally:
+        PLAN_REFRESH_LATENCY.labels(outcome=outcome).observe(time.perf_counter() - t0)
+        with _PLAN_CACHE_LOCK:
+            _REVALIDATING.pop(key, None)
+
+
+def _copy_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy with fresh lists: shared plans must not be mutated through a response."""
+    return {k: list(v) if isinstance(v, list) else v for k, v in plan.items()}
+
+
+def _compute_dosage(payload: Dict[str, Any]) -> Dict[str, Any]:
+    dosage = compute_dosage(
+        payload["cnn_label"],
+        str(payload["mode"]).strip().lower(),
+        float(payload["area_m2"]),
+        severity=str(payload["severity"]).strip().lower(),
+        region=payload.get("region"),
+        stage=payload.get("growth_stage"),
+    )
+    return dosage or {"note": "No dosage rule available for this disease/mode/severity combination."}
+
+
 # ── Main pipeline ──────────────────────────────────────────────────────────────
 
-def generate_treatment_advice(payload: Dict[str, Any]) -> Dict[str, Any]:
+def generate_treatment_advice(
+    payload: Dict[str, Any],
+    strategy: Optional[str] = None,
+    refresh: bool = False,
+    quality: Optional[str] = None,
+) -> Dict[str, Any]:
     """
-    Main RAG pipeline:
+    Main RAG pipeline (timed end-to-end as the "pipeline" stage):
     1. Infer season from date
     2. Retrieve relevant knowledge chunks from Weaviate
     3. Build RAG prompt and call LLM
     4. Compute dosage via dosage_rules
     5. Return structured response for the API
 
+    The label policy (see label_policy) comes first: "template" labels skip
+    steps 2-3. Other labels are served from the plan store when it holds
+    their plan, then "cached" labels only run steps 2-3 on a cache miss.
+
     Args:
-        payload: Dict with keys: cnn_label, mode, severity, area_m2, date_iso
+        payload:  Dict with keys: cnn_label, mode, severity, area_m2, date_iso
+                  (optional: region, growth_stage — dosage rule selection)
+        strategy: "rag" or "extractive" (no LLM call, see app.extractive);
+                  defaults to GENERATION_STRATEGY
+        refresh:  Regenerates the plan (plan store and plan cache bypassed)
+                  and writes it into the live plan store version; always
+                  at "full" quality, since the stored plan serves every tier.
+                  For "template" labels, rebuilds the template plans from
+                  the extractive index instead (still no LLM call)
+        quality:  QoS tier (see QUALITY_TIERS); defaults to DEFAULT_QUALITY.
+                  A tier without LLM ("fast") answers a plan store miss with
+                  the extractive strategy
 
     Returns:
-        Structured treatment plan dict
+        Structured treatment plan dict; `policy` tells what served it
+        (template, precomputed, cached or llm), `strategy` what produced
+        the plan (rag, extractive, extractive_fallback or static) and
+        `quality` the tier applied
+
+    Raises:
+        ValueError: If the strategy or the quality tier is unknown
     """
+    strategy = strategy or GENERATION_STRATEGY
+    if strategy not in GENERATION_STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}' (expected one of {GENERATION_STRATEGIES}).")
+    quality = "full" if refresh else (quality or DEFAULT_QUALITY)
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality '{quality}' (expected one of {QUALITIES}).")
+    # The plan store is looked up with the requested strategy; only a miss
+    # is generated without LLM when the tier has no completion budget
+    generation = strategy if QUALITY_TIERS[quality]["max_new_tokens"] > 0 else "extractive"
+
+    policy = label_policy(payload["cnn_label"])
+    with stage("pipeline", policy=policy, quality=quality):
+        with stage("season"):
+            season = infer_season_from_date(payload.get("date_iso", ""))
+
+        if policy == "template":
+            result = _template_advice(payload, season, refresh)
+        else:
+            plan_key = _plan_key(payload, season)
+            stored   = None if refresh else _stored_advice(payload, plan_key, strategy)
+            if stored is not None:
+                result, policy = stored, "precomputed"
+            elif policy == "cached":
+                result = _cached_advice(payload, season, generation, refresh, quality)
+            else:
+                result = _generate_treatment_advice(payload, generation, season, quality)
+            if refresh:
+                refresh_plan(plan_key, result, strategy)
+
+    PLAN_POLICIES.labels(policy=policy).inc()
+    result["policy"]  = policy
+    result["quality"] = quality
+    return result
+
+
+def _generate_treatment_advice(
+    payload: Dict[str, Any],
+    strategy: str,
+    season: Optional[str] = None,
+    quality: str = "full",
+) -> Dict[str, Any]:
     cnn_label = payload["cnn_label"]
     mode      = str(payload["mode"]).strip().lower()
     severity  = str(payload["severity"]).strip().lower()
     area_m2   = float(payload["area_m2"])
     date_iso  = payload.get("date_iso", "")
 
-    season       = infer_season_from_date(date_iso)
+    if season is None:
+        with stage("season"):
+            season = infer_season_from_date(date_iso)
     disease_name = DISEASE_NAMES.get(cnn_label, cnn_label)
+    tier = QUALITY_TIERS[quality]
+
+    # ── Step 1: Retrieve chunks (Weaviate or snapshot, cached) ─────────────────
+    with stage("retrieval"):
+        chunks = retrieve_chunks(cnn_label, mode, severity, top_k=tier["top_k"])
+        if chunks:
+            chunks = fit_context_budget(chunks, tier["context_tokens"])
 
     # ── Static fallback ────────────────────────────────────────────────────────
     # If Weaviate is not available (HuggingFace without WEAVIATE_URL configured),
     # return a static fallback response immediately — no crash, no 500 error.
     # This block is removed automatically once WEAVIATE_URL is set in HF secrets.
-    if not weaviate_available():
+    # Extractive plans do not need retrieval: they are served from the index.
+    if chunks is None and strategy != "extractive":
+        FALLBACKS.labels(reason="weaviate_unavailable").inc()
         return _build_fallback_response(payload)
 
-
-    # ── Step 1: Retrieve chunks from Weaviate ──────────────────────────────────
-    with weaviate_client() as client:
-        if client is None:
-            return _build_fallback_response(payload)
-        
-        chunks = search_treatment_chunks(
-            client=client,
-            disease_input=cnn_label,
-            mode=mode,
-            severity=severity,
-            top_k=8,
-        )
-        # Fallback: retry without mode filter
-        if not chunks:
-            chunks = search_treatment_chunks(
-                client=client,
-                disease_input=cnn_label,
-                mode=None,
-                severity=severity,
-                top_k=8,
-            )
-
     if DEBUG:
-        print(f"\n[RAG] {len(chunks)} chunks retrieved for '{cnn_label}'")
+        print(f"\n[RAG] {len(chunks or [])} chunks retrieved for '{cnn_label}'")
 
     # ── Step 2: Compute dosage ─────────────────────────────────────────────────
-    dosage = compute_dosage(cnn_label, mode, area_m2, severity=severity)
-    if not dosage:
-        dosage = {"note": "No dosage rule available for this disease/mode/severity combination."}
+    with stage("dosage"):
+        dosage = _compute_dosage(payload)
+
+    # ── Extractive strategy: plan from the knowledge sheets, no LLM call ──────
+    if strategy == "extractive":
+        with stage("extractive"):
+            parsed = build_extractive_plan(cnn_label, mode, severity, chunks)
+        return _build_result(
+            payload, season, dosage, parsed, strategy="extractive",
+            raw_llm_output="Extractive plan — assembled from the knowledge sheets, no LLM call.",
+        )
 
     # ── Step 3: Fallback chunks if Weaviate returned nothing ───────────────────
+    retrieved_chunks = chunks
     if not chunks:
+        FALLBACKS.labels(reason="no_chunks").inc()
         chunks = [{
             "text": (
                 "No relevant extract found in the knowledge base. "
@@ -462,29 +859,40 @@ def generate_treatment_advice(payload: Dict[str, Any]) -> Dict[str, Any]:
         }]
 
     # ── Step 4: Build prompt and call LLM ─────────────────────────────────────
-    prompt = build_treatment_prompt(
-        cnn_label=cnn_label,
-        disease_name=disease_name,
-        mode=mode,
-        severity=severity,
-        area_m2=area_m2,
-        season=season,
-        context_chunks=[{"text": c["text"]} for c in chunks],
-    )
+    with stage("prompt"):
+        prompt = build_treatment_prompt(
+            cnn_label=cnn_label,
+            disease_name=disease_name,
+            mode=mode,
+            severity=severity,
+            area_m2=area_m2,
+            season=season,
+            context_chunks=[{"text": c["text"]} for c in chunks],
+        )
 
     if DEBUG:
         print("\n===== PROMPT SENT TO LLM =====\n")
         print(prompt)
 
     # ── Step 5: Parse LLM response ─────────────────────────────────────────────
+    strategy = "rag"
     try:
-        raw_llm_text = call_llm(prompt, max_new_tokens=700, temperature=0.2, top_p=0.9)
+        with stage("llm"):
+            llm_result = call_llm(
+                prompt,
+                max_new_tokens=tier["max_new_tokens"],
+                temperature=0.2,
+                top_p=0.9,
+                model=tier["model"] or None,
+            )
+        raw_llm_text = llm_result.text
 
         if DEBUG:
             print("\n===== RAW LLM OUTPUT =====\n")
             print(raw_llm_text)
 
-        parsed = parse_llm_structured_response(raw_llm_text)
+        with stage("parse"):
+            parsed = parse_llm_structured_response(raw_llm_text)
 
         if not parsed.get("diagnostic"):
             parsed["diagnostic"] = (
@@ -494,9 +902,23 @@ def generate_treatment_advice(payload: Dict[str, Any]) -> Dict[str, Any]:
             )
 
     except LLMError as e:
+        FALLBACKS.labels(reason="llm_error").inc()
         if DEBUG:
             print(f"\n===== LLM ERROR =====\n{e}")
 
+        if EXTRACTIVE_FALLBACK:
+            # Degraded but useful: the knowledge sheets instead of a generic message
+            with stage("extractive"):
+                parsed = build_extractive_plan(cnn_label, mode, severity, retrieved_chunks)
+            parsed["warnings"] = [
+                "The language model was unavailable: this plan was assembled "
+                "directly from the knowledge sheets."
+            ] + parsed["warnings"]
+            return _build_result(
+                payload, season, dosage, parsed, strategy="extractive_fallback",
+                raw_llm_output=f"Extractive fallback — LLM unavailable ({e}).",
+            )
+
         fallback_text = (
             "The situation requires technical assessment. "
             "No detailed recommendation could be generated automatically. "
@@ -512,6 +934,19 @@ def generate_treatment_advice(payload: Dict[str, Any]) -> Dict[str, Any]:
         raw_llm_text = fallback_text
 
     # ── Step 6: Build final result ─────────────────────────────────────────────
+    return _build_result(payload, season, dosage, parsed, strategy=strategy, raw_llm_output=raw_llm_text)
+
+
+def _build_result(
+    payload: Dict[str, Any],
+    season: str,
+    dosage: Dict[str, Any],
+    parsed: Dict[str, Any],
+    strategy: str,
+    raw_llm_output: str,
+) -> Dict[str, Any]:
+    """Final API result from a parsed plan (LLM or extractive) and the dosage."""
+    cnn_label = payload["cnn_label"]
     base_warnings = [
         "These recommendations are indicative only.",
         "Always verify local regulations and product labels before application.",
@@ -519,17 +954,18 @@ def generate_treatment_advice(payload: Dict[str, Any]) -> Dict[str, Any]:
 
     result = {
         "cnn_label":          cnn_label,
-        "disease_name":       disease_name,
-        "mode":               mode,
-        "area_m2":            area_m2,
-        "severity":           severity,
+        "disease_name":       DISEASE_NAMES.get(cnn_label, cnn_label),
+        "mode":               str(payload["mode"]).strip().lower(),
+        "area_m2":            float(payload["area_m2"]),
+        "severity":           str(payload["severity"]).strip().lower(),
         "season":             season,
         "treatment_plan":     dosage,
         "diagnostic":         parsed.get("diagnostic") or "",
         "treatment_actions":  parsed.get("treatment_actions") or [],
         "preventive_actions": parsed.get("preventive_actions") or [],
         "warnings":           base_warnings + (parsed.get("warnings") or []),
-        "raw_llm_output":     raw_llm_text,
+        "strategy":           strategy,
+        "raw_llm_output":     raw_llm_output,
     }
 
     if DEBUG:
@@ -48,6 +48,14 @@ class SolutionRequest(BaseModel):
         None,
         description="Text location of the vineyard (optional, for contextual information only)",
     )
+    region: Optional[str] = Field(
+        None,
+        description="Wine region, selects region-specific dosage rules when defined (e.g. 'bordeaux')",
+    )
+    growth_stage: Optional[str] = Field(
+        None,
+        description="Vine growth stage, selects stage-specific dosage rules when defined (e.g. 'flowering')",
+    )
 
 
 # ──────────────────────────────────────────────
@@ -67,6 +75,26 @@ class DetailedHealthResponse(BaseModel):
         description="Health status of individual components (weaviate, llm)",
     )
     
+class ReadinessResponse(BaseModel):
+    """Response for GET /ready — startup warm-up progress."""
+    status: str = Field(..., description="'ready' once warm-up is done, 'warming_up' before")
+    started_at: Optional[str] = Field(None, description="Warm-up start time (ISO 8601, UTC)")
+    finished_at: Optional[str] = Field(None, description="Warm-up end time (ISO 8601, UTC)")
+    steps: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Outcome of each warm-up step (status, duration_ms, detail)",
+    )
+
+
+class RulesReloadResponse(BaseModel):
+    """Response for POST /admin/rules/reload — the active dosage rule set."""
+    version: str = Field(..., description="Rule set version (manifest.yaml)")
+    checksum: str = Field(..., description="SHA-256 of the rule files")
+    rules: int = Field(..., description="Number of (label, mode, region, stage) rules")
+    loaded_at: str = Field(..., description="Load time of the active rule set (ISO 8601, UTC)")
+    changed: bool = Field(..., description="Whether this call replaced the active rule set")
+
+
 class SolutionResponse(BaseModel):
     """Response for POST /solutions — wraps the full treatment advice payload."""
     data: Dict[str, Any] = Field(
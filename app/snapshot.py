@@ -0,0 +1,353 @@
+"""
+snapshot.py — Portable export/import of the knowledge index.
+
+A snapshot is a directory holding:
+- chunks.jsonl  : one JSON object per chunk (Weaviate properties)
+- vectors.npy   : float32 array of shape (n_chunks, dimension), same order
+- manifest.json : format version, embedding model id, dimension, count, corpus hash
+
+Export reads the live collection (through the alias) with its vectors.
+Import bulk-loads a snapshot into Weaviate (blue/green, see app.ingestion)
+or serves it from an in-process index (RETRIEVAL_BACKEND=snapshot),
+in both cases without loading the embedder.
+
+Usage:
+    python -m app.snapshot export data/snapshot
+    python -m app.snapshot import data/snapshot
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import (
+    CHUNK_PROPERTIES,
+    EMBEDDING_MODEL_ID,
+    KNOWLEDGE_COLLECTION,
+    KNOWLEDGE_DIR,
+    KNOWLEDGE_SNAPSHOT_DIR,
+)
+from app.metrics import stage
+from app.weaviate_client import build_query_text, embed_query, weaviate_client
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+CHUNKS_FILE   = "chunks.jsonl"
+VECTORS_FILE  = "vectors.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, corrupted or incompatible."""
+    pass
+
+
+# ── Helper functions ───────────────────────────────────────────────────────────
+
+def compute_corpus_hash(knowledge_dir: Path = Path(KNOWLEDGE_DIR)) -> str:
+    """
+    Returns a SHA-256 fingerprint of the markdown knowledge files
+    (file names + contents), used to detect stale snapshots.
+    """
+    digest = hashlib.sha256()
+    for md_path in sorted(Path(knowledge_dir).glob("*.md")):
+        digest.update(md_path.name.encode("utf-8"))
+        digest.update(md_path.read_bytes())
+    return digest.hexdigest()
+
+
+def write_snapshot(
+    out_dir: Path,
+    chunks: List[Dict[str, Any]],
+    vectors: Sequence[Sequence[float]],
+    model_id: str = EMBEDDING_MODEL_ID,
+    corpus_hash: Optional[str] = None,
+    source: str = "",
+) -> Dict[str, Any]:
+    """
+    Writes chunks, vectors and manifest into out_dir.
+
+    Returns:
+        The manifest dict
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(chunks):
+        raise SnapshotError(
+            f"Expected {len(chunks)} vectors, got array of shape {matrix.shape}."
+        )
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(out_dir / CHUNKS_FILE, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+
+    np.save(out_dir / VECTORS_FILE, matrix)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "model_id":       model_id,
+        "dimension":      int(matrix.shape[1]),
+        "count":          len(chunks),
+        "corpus_hash":    corpus_hash or compute_corpus_hash(),
+        "source":         source,
+        "created_at":     datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    with open(out_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def read_snapshot(
+    snapshot_dir: Path,
+    model_id: str = EMBEDDING_MODEL_ID,
+) -> Tuple[List[Dict[str, Any]], np.ndarray, Dict[str, Any]]:
+    """
+    Loads and checks a snapshot directory.
+
+    Raises:
+        SnapshotError: If files are missing, inconsistent with the manifest,
+                       or embedded with a different model than `model_id`
+                       (query vectors would not be comparable)
+
+    Returns:
+        Tuple (chunks, vectors, manifest)
+    """
+    snapshot_dir = Path(snapshot_dir)
+    for name in (CHUNKS_FILE, VECTORS_FILE, MANIFEST_FILE):
+        if not (snapshot_dir / name).exists():
+            raise SnapshotError(f"Snapshot file missing: {snapshot_dir / name}")
+
+    with open(snapshot_dir / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+    if manifest.get("model_id") != model_id:
+        raise SnapshotError(
+            f"Snapshot embedded with '{manifest.get('model_id')}', "
+            f"but the API uses '{model_id}'."
+        )
+
+    with open(snapshot_dir / CHUNKS_FILE, encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f if line.strip()]
+
+    vectors = np.load(snapshot_dir / VECTORS_FILE, mmap_mode="r")
+    expected_shape = (manifest["count"], manifest["dimension"])
+    if len(chunks) != manifest["count"] or vectors.shape != expected_shape:
+        raise SnapshotError(
+            f"Snapshot inconsistent: {len(chunks)} chunks, vectors {vectors.shape}, "
+            f"manifest expects {expected_shape}."
+        )
+
+    if manifest.get("corpus_hash") != compute_corpus_hash():
+        logger.warning(
+            "Snapshot corpus hash differs from data/knowledge — "
+            "the snapshot may be stale, consider re-exporting it."
+        )
+
+    return chunks, vectors, manifest
+
+
+# ── Export / import ────────────────────────────────────────────────────────────
+
+def export_snapshot(out_dir: Path) -> Dict[str, Any]:
+    """
+    Dumps the collection currently served by the alias (properties + vectors).
+
+    Returns:
+        The manifest dict
+    """
+    chunks: List[Dict[str, Any]] = []
+    vectors: List[List[float]] = []
+
+    with weaviate_client() as client:
+        if client is None:
+            raise SnapshotError("Weaviate is unavailable — nothing to export.")
+
+        collection = client.collections.get(KNOWLEDGE_COLLECTION)
+        for obj in collection.iterator(include_vector=True):
+            vector = obj.vector
+            if isinstance(vector, dict):
+                vector = vector.get("default") or next(iter(vector.values()), None)
+            if not vector:
+                continue
+            props = obj.properties or {}
+            chunks.append({name: props.get(name) for name in CHUNK_PROPERTIES})
+            vectors.append(vector)
+
+    # Deterministic order: same index content → byte-identical snapshot files
+    order   = sorted(
+        range(len(chunks)),
+        key=lambda i: (
+            chunks[i].get("cnn_label") or "",
+            chunks[i].get("section") or "",
+            chunks[i].get("chunk_index") or 0,
+            chunks[i].get("text") or "",
+        ),
+    )
+    chunks  = [chunks[i] for i in order]
+    vectors = [vectors[i] for i in order]
+
+    return write_snapshot(out_dir, chunks, vectors, source=KNOWLEDGE_COLLECTION)
+
+
+def import_snapshot(snapshot_dir: Path) -> str:
+    """
+    Bulk-loads a snapshot into a new versioned Weaviate collection
+    and repoints the alias. The embedder is never loaded.
+
+    Returns:
+        Name of the collection now served by the alias
+    """
+    # Imported here: app.ingestion loads the weaviate client library, which the
+    # in-process index (RETRIEVAL_BACKEND=snapshot) must not pull in
+    from app.ingestion import ingest_chunks_into_weaviate
+
+    chunks, vectors, _ = read_snapshot(snapshot_dir)
+    return ingest_chunks_into_weaviate(chunks, vectors=vectors)
+
+
+# ── In-process index ───────────────────────────────────────────────────────────
+
+class SnapshotIndex:
+    """
+    In-memory cosine-similarity index over a snapshot.
+    Mirrors the filters of search_treatment_chunks (disease + farming mode).
+    """
+
+    def __init__(self, chunks: List[Dict[str, Any]], vectors: np.ndarray):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms  = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.chunks  = chunks
+        self.vectors = matrix / np.where(norms == 0, 1.0, norms)
+        self.labels  = [
+            {c.get("cnn_label") or "", c.get("disease_id") or ""} for c in chunks
+        ]
+        self.modes   = [
+            {m.strip() for m in (c.get("farming_mode") or "").split(",") if m.strip()}
+            for c in chunks
+        ]
+
+    @classmethod
+    def from_dir(cls, snapshot_dir: Path) -> "SnapshotIndex":
+        chunks, vectors, _ = read_snapshot(snapshot_dir)
+        return cls(chunks, vectors)
+
+    def search(
+        self,
+        query_vector: Sequence[float],
+        disease_input: str,
+        mode: Optional[str],
+        top_k: int = 8,
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the top_k chunks of a disease, closest first.
+        Retries without the mode filter if the filtered search is empty.
+        """
+        key = (disease_input or "").strip()
+        if not key:
+            return []
+
+        disease_mask = np.array([key in labels for labels in self.labels], dtype=bool)
+        mask = disease_mask
+        if mode:
+            mask = disease_mask & np.array([mode in m for m in self.modes], dtype=bool)
+            if not mask.any():
+                mask = disease_mask
+
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        distances = 1.0 - self.vectors[candidates] @ query
+        best = candidates[np.argsort(distances, kind="stable")[:top_k]]
+
+        results = []
+        for idx in best:
+            chunk = self.chunks[idx]
+            results.append({
+                "text":         chunk.get("text", ""),
+                "section":      chunk.get("section", ""),
+                "subsection":   chunk.get("subsection", ""),
+                "disease_id":   chunk.get("disease_id", ""),
+                "cnn_label":    chunk.get("cnn_label", ""),
+                "disease_name": chunk.get("disease_name", ""),
+                "farming_mode": chunk.get("farming_mode", None),
+                "token_count":  chunk.get("token_count", None),
+                "plan_field":   chunk.get("plan_field"),
+                "plan_mode":    chunk.get("plan_mode"),
+                "distance":     float(1.0 - self.vectors[idx] @ query),
+            })
+        return results
+
+
+_SNAPSHOT_INDEX: Optional[SnapshotIndex] = None
+
+
+def get_snapshot_index() -> SnapshotIndex:
+    """
+    Returns the in-process snapshot index, loaded once from KNOWLEDGE_SNAPSHOT_DIR.
+    """
+    global _SNAPSHOT_INDEX
+    if _SNAPSHOT_INDEX is None:
+        _SNAPSHOT_INDEX = SnapshotIndex.from_dir(Path(KNOWLEDGE_SNAPSHOT_DIR))
+    return _SNAPSHOT_INDEX
+
+
+def search_snapshot_chunks(
+    disease_input: str,
+    mode: Optional[str],
+    severity: Optional[str],
+    top_k: int = 8,
+) -> List[Dict[str, Any]]:
+    """
+    Same contract as search_treatment_chunks, served from the in-process index.
+    """
+    key = (disease_input or "").strip()
+    if not key:
+        return []
+
+    query_vector = embed_query(build_query_text(key, mode, severity))
+    with stage("snapshot_search"):
+        return get_snapshot_index().search(query_vector, key, mode, top_k=top_k)
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export / import knowledge index snapshots.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Dump the live index to a snapshot")
+    export_parser.add_argument("path", nargs="?", default=KNOWLEDGE_SNAPSHOT_DIR)
+
+    import_parser = subparsers.add_parser("import", help="Load a snapshot into Weaviate")
+    import_parser.add_argument("path", nargs="?", default=KNOWLEDGE_SNAPSHOT_DIR)
+
+    args = parser.parse_args(argv)
+    path = Path(args.path)
+
+    if args.command == "export":
+        manifest = export_snapshot(path)
+        print(f"[SNAPSHOT] Exported {manifest['count']} chunks "
+              f"(dim={manifest['dimension']}) to {path}")
+    else:
+        target = import_snapshot(path)
+        print(f"[SNAPSHOT] Imported {path} into {target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+tokens.py — Approximate token counting shared by chunking and prompt budgets.
+
+Chunk sizes (CHUNK_MAX_TOKENS, see app.ingestion) and prompt context budgets
+(QUALITY_TIERS context_tokens, see app.prompts) are measured in the same unit:
+words + punctuation marks. No tokenizer is loaded, so this stays cheap on the
+request path.
+"""
+
+import re
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximates the number of tokens in a text (words + punctuation marks).
+    Close enough to the MiniLM word-piece count to size chunks.
+    """
+    return len(_TOKEN_PATTERN.findall(text or ""))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Returns:
+        The text cut right after its `max_tokens`-th token (unchanged if shorter)
+    """
+    if max_tokens <= 0:
+        return ""
+    for i, match in enumerate(_TOKEN_PATTERN.finditer(text or "")):
+        if i == max_tokens - 1:
+            return text[: match.end()]
+    return text
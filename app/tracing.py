@@ -0,0 +1,450 @@
+"""
+tracing.py — Lightweight span tracing for the treatment pipeline.
+
+Each API request opens a root span (see the middleware in app.main). The
+pipeline stages timed by app.metrics.stage open child spans under it, so one
+trace shows how retrieval retries and LLM attempts stack up, e.g.:
+
+    POST /solutions
+    └── pipeline
+        ├── retrieval            cache=miss
+        │   ├── weaviate_connect
+        │   ├── embed
+        │   ├── near_vector      with_mode=True   (0 results)
+        │   └── near_vector      with_mode=False
+        ├── prompt
+        ├── llm
+        │   ├── llm_attempt      attempt=1  error=...
+        │   └── llm_attempt      attempt=2
+        └── parse                path=json
+
+W3C Trace Context: an incoming `traceparent` header is continued, and the
+current one is sent on the response and on outbound LLM requests.
+Outside a request (warm-up, CLIs) no span is recorded.
+
+Exporters (TRACE_EXPORTER), run on a background thread:
+- none : nothing leaves the process
+- file : one JSON line per finished trace, appended to TRACE_FILE
+- http : each finished trace POSTed as JSON to TRACE_COLLECTOR_URL
+
+Dissect slow requests after the fact:
+    python -m app.tracing slowest traces/traces.jsonl --top 5
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import TRACE_COLLECTOR_URL, TRACE_EXPORTER, TRACE_FILE
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+# ── Spans ──────────────────────────────────────────────────────────────────────
+
+class Span:
+    """One timed operation. Spans of a trace share the root's `spans` list."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "sampled",
+        "attributes", "start_time", "_t0", "duration_ms", "spans",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        spans: List["Span"],
+        sampled: bool = True,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name        = name
+        self.trace_id    = trace_id
+        self.span_id     = os.urandom(8).hex()
+        self.parent_id   = parent_id
+        self.sampled     = sampled
+        self.attributes  = dict(attributes or {})
+        self.start_time  = time.time()
+        self._t0         = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.spans       = spans
+        spans.append(self)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name":        self.name,
+            "trace_id":    self.trace_id,
+            "span_id":     self.span_id,
+            "parent_id":   self.parent_id,
+            "start_time":  datetime.fromtimestamp(self.start_time, timezone.utc).isoformat(),
+            "duration_ms": self.duration_ms,
+            "attributes":  self.attributes,
+        }
+
+
+_CURRENT_SPAN: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _CURRENT_SPAN.get()
+
+
+@contextmanager
+def _activate(span_obj: Span) -> Iterator[Span]:
+    token = _CURRENT_SPAN.set(span_obj)
+    try:
+        yield span_obj
+    except BaseException as e:
+        span_obj.set_attribute("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        span_obj.end()
+        _CURRENT_SPAN.reset(token)
+
+
+@contextmanager
+def start_trace(
+    name: str,
+    traceparent: Optional[str] = None,
+    **attributes: Any,
+) -> Iterator[Span]:
+    """
+    Opens the root span of a trace (continuing `traceparent` if valid)
+    and hands the finished trace to the exporter on exit.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = os.urandom(16).hex(), None, True
+
+    root = Span(name, trace_id, parent_id, spans=[], sampled=sampled, attributes=attributes)
+    try:
+        with _activate(root):
+            yield root
+    finally:
+        if root.sampled:
+            export_trace(root)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Opens a child span of the current span. No-op (yields None)
+    outside a trace, so instrumented code can run anywhere.
+    """
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(
+        name, parent.trace_id, parent.span_id,
+        spans=parent.spans, sampled=parent.sampled, attributes=attributes,
+    )
+    with _activate(child):
+        yield child
+
+
+def annotate(**attributes: Any) -> None:
+    """Adds attributes to the current span (no-op outside a trace)."""
+    current = _CURRENT_SPAN.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+# ── W3C trace context ──────────────────────────────────────────────────────────
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """
+    Parses a W3C `traceparent` header.
+
+    Returns:
+        Tuple (trace_id, parent_span_id, sampled), or None if absent/invalid
+    """
+    match = TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 0x01)
+
+
+def format_traceparent(span_obj: Span) -> str:
+    return f"00-{span_obj.trace_id}-{span_obj.span_id}-{'01' if span_obj.sampled else '00'}"
+
+
+def current_traceparent() -> Optional[str]:
+    """`traceparent` value to send on outbound requests (None outside a trace)."""
+    current = _CURRENT_SPAN.get()
+    return format_traceparent(current) if current is not None else None
+
+
+# ── Per-request stage summary (Server-Timing / ?timings=true) ─────────────────
+
+def summarize_stages(spans: List[Span]) -> Dict[str, Dict[str, Any]]:
+    """
+    Condenses the spans of one request into per-stage timings:
+    durations of repeated spans (retries) are summed, and cache results,
+    LLM attempts / token usage and the parse path are carried over.
+
+    Embedding is only run on a query-vector cache miss: if retrieval went
+    to the backend without an `embed` span, the vector came from cache.
+
+    Returns:
+        Dict stage → {"ms": float, ...details}, in pipeline order
+    """
+    by_name: Dict[str, List[Span]] = {}
+    for s in spans:
+        by_name.setdefault(s.name, []).append(s)
+
+    def total_ms(*names: str) -> float:
+        return round(sum(s.duration_ms or 0.0 for n in names for s in by_name.get(n, [])), 3)
+
+    summary: Dict[str, Dict[str, Any]] = {}
+
+    if "retrieval" in by_name:
+        retrieval = by_name["retrieval"][0]
+        summary["retrieval"] = {"ms": total_ms("retrieval"), "cache": retrieval.attributes.get("cache")}
+
+        if "embed" in by_name:
+            summary["embedding"] = {"ms": total_ms("embed"), "cache": "miss"}
+        elif retrieval.attributes.get("cache") == "miss":
+            summary["embedding"] = {"ms": 0.0, "cache": "hit"}
+
+        searches = by_name.get("near_vector", []) + by_name.get("snapshot_search", [])
+        if searches:
+            summary["search"] = {"ms": total_ms("near_vector", "snapshot_search"), "queries": len(searches)}
+
+    if "prompt" in by_name:
+        summary["prompt"] = {"ms": total_ms("prompt")}
+
+    if "llm" in by_name:
+        attempts = by_name.get("llm_attempt", [])
+        llm: Dict[str, Any] = {"ms": total_ms("llm"), "attempts": len(attempts)}
+        for key in ("prompt_tokens", "completion_tokens"):
+            values = [s.attributes[key] for s in attempts if s.attributes.get(key) is not None]
+            if values:
+                llm[key] = sum(values)
+        finish_reasons = [s.attributes["finish_reason"] for s in attempts if s.attributes.get("finish_reason")]
+        if finish_reasons:
+            llm["finish_reason"] = finish_reasons[-1]
+        summary["llm"] = llm
+
+    if "parse" in by_name:
+        parse = by_name["parse"][0]
+        summary["parse"] = {"ms": total_ms("parse"), "path": parse.attributes.get("path")}
+
+    if "dosage" in by_name:
+        summary["dosage"] = {"ms": total_ms("dosage")}
+
+    return summary
+
+
+def format_server_timing(summary: Dict[str, Dict[str, Any]], total_ms: Optional[float] = None) -> str:
+    """
+    Renders a stage summary as a `Server-Timing` header value, e.g.
+    `retrieval;dur=3.1;desc="cache=miss", llm;dur=812.4;desc="attempts=2 tokens=412+96"`.
+    """
+    entries = []
+    for name, stats in summary.items():
+        details = []
+        if stats.get("cache"):
+            details.append(f"cache={stats['cache']}")
+        if "queries" in stats:
+            details.append(f"queries={stats['queries']}")
+        if "attempts" in stats:
+            details.append(f"attempts={stats['attempts']}")
+        if "prompt_tokens" in stats or "completion_tokens" in stats:
+            details.append(f"tokens={stats.get('prompt_tokens', 0)}+{stats.get('completion_tokens', 0)}")
+        if stats.get("path"):
+            details.append(f"path={stats['path']}")
+
+        entry = f"{name};dur={stats['ms']:.1f}"
+        if details:
+            entry += f';desc="{" ".join(details)}"'
+        entries.append(entry)
+
+    if total_ms is not None:
+        entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+# ── Exporters ──────────────────────────────────────────────────────────────────
+
+def trace_to_dict(root: Span) -> Dict[str, Any]:
+    return {
+        "trace_id":    root.trace_id,
+        "name":        root.name,
+        "duration_ms": root.duration_ms,
+        "spans":       [s.to_dict() for s in root.spans],
+    }
+
+
+class FileExporter:
+    """Appends one JSON line per trace to a local file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, trace: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace, ensure_ascii=False) + "\n")
+
+
+class HttpExporter:
+    """POSTs each trace as JSON to a collector (or local stand-in)."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url     = url
+        self.timeout = timeout
+
+    def export(self, trace: Dict[str, Any]) -> None:
+        import requests
+
+        requests.post(self.url, json=trace, timeout=self.timeout)
+
+
+def build_exporter(kind: str = TRACE_EXPORTER):
+    """
+    Raises:
+        ValueError: If the exporter name is unknown or misconfigured
+    """
+    if kind == "none":
+        return None
+    if kind == "file":
+        return FileExporter(Path(TRACE_FILE))
+    if kind == "http":
+        if not TRACE_COLLECTOR_URL:
+            raise ValueError("TRACE_EXPORTER=http requires TRACE_COLLECTOR_URL.")
+        return HttpExporter(TRACE_COLLECTOR_URL)
+    raise ValueError(f"Unknown TRACE_EXPORTER '{kind}' (expected 'none', 'file' or 'http').")
+
+
+_EXPORTER: Optional[Any] = None
+_EXPORTER_LOADED = False
+_EXPORT_QUEUE: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=1000)
+_EXPORT_THREAD: Optional[threading.Thread] = None
+_EXPORT_LOCK = threading.Lock()
+
+
+def get_exporter():
+    """Returns the configured exporter, built once (None when disabled)."""
+    global _EXPORTER, _EXPORTER_LOADED
+    if not _EXPORTER_LOADED:
+        try:
+            _EXPORTER = build_exporter()
+        except ValueError as e:
+            logger.error(f"Tracing export disabled: {e}")
+            _EXPORTER = None
+        _EXPORTER_LOADED = True
+    return _EXPORTER
+
+
+def set_exporter(exporter) -> None:
+    """Replaces the exporter (e.g. an in-memory one in tests)."""
+    global _EXPORTER, _EXPORTER_LOADED
+    _EXPORTER = exporter
+    _EXPORTER_LOADED = True
+
+
+def _export_loop() -> None:
+    while True:
+        trace = _EXPORT_QUEUE.get()
+        try:
+            exporter = get_exporter()
+            if exporter is not None:
+                exporter.export(trace)
+        except Exception as e:
+            logger.warning(f"Trace export failed: {e}")
+        finally:
+            _EXPORT_QUEUE.task_done()
+
+
+def export_trace(root: Span) -> None:
+    """Queues a finished trace for the background exporter (drops it if the queue is full)."""
+    global _EXPORT_THREAD
+    if get_exporter() is None:
+        return
+
+    with _EXPORT_LOCK:
+        if _EXPORT_THREAD is None:
+            _EXPORT_THREAD = threading.Thread(target=_export_loop, name="trace-exporter", daemon=True)
+            _EXPORT_THREAD.start()
+
+    try:
+        _EXPORT_QUEUE.put_nowait(trace_to_dict(root))
+    except queue.Full:
+        logger.warning("Trace export queue full — dropping trace.")
+
+
+def flush_exports() -> None:
+    """Blocks until every queued trace has been exported."""
+    _EXPORT_QUEUE.join()
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def format_trace_tree(trace: Dict[str, Any]) -> str:
+    """Renders a trace as an indented span tree with durations and attributes."""
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    span_ids = {s["span_id"] for s in trace["spans"]}
+    for s in trace["spans"]:
+        parent = s["parent_id"] if s["parent_id"] in span_ids else None
+        children.setdefault(parent, []).append(s)
+
+    lines: List[str] = []
+
+    def walk(parent_id: Optional[str], depth: int) -> None:
+        for s in children.get(parent_id, []):
+            attrs = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+            lines.append(f"{'  ' * depth}{s['name']:<{max(1, 28 - 2 * depth)}} "
+                         f"{s['duration_ms']:>10.1f} ms  {attrs}".rstrip())
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Inspect exported traces.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    slowest_parser = subparsers.add_parser("slowest", help="Print the slowest traces as span trees")
+    slowest_parser.add_argument("path", nargs="?", default=TRACE_FILE)
+    slowest_parser.add_argument("--top", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    with open(args.path, encoding="utf-8") as f:
+        traces = [json.loads(line) for line in f if line.strip()]
+
+    traces.sort(key=lambda t: t.get("duration_ms") or 0.0, reverse=True)
+    for trace in traces[:args.top]:
+        print(f"[TRACE] {trace['trace_id']}  {trace['name']}  {trace['duration_ms']:.1f} ms")
+        print(format_trace_tree(trace))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+warmup.py — Startup warm-up and readiness state.
+
+Run once in the background when the API starts (see the lifespan in app.main),
+so that the first /solutions calls after a deploy do not pay for:
+1. Loading the dosage rule files (see app.dosage_rules)
+2. Loading the extractive plan index (see app.extractive) and building the
+   plans of "template" policy labels (see LABEL_POLICIES)
+3. Loading the live version of the plan store (see app.plan_store)
+4. Loading the embedder + a first encode
+5. Opening the shared Weaviate connection
+6. Priming the query-vector and retrieval caches for every label/mode/severity
+7. Loading the in-process model weights (GENERATION_BACKEND=local)
+8. (optional) A first round-trip to the LLM router
+
+GET /ready reports ready only once warm-up has finished; GET / stays a cheap
+liveness probe. A failing step is recorded but does not block readiness:
+the pipeline can still answer (retrying the step lazily or falling back).
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import (
+    DISEASE_NAMES,
+    GENERATION_BACKEND,
+    PLAN_STORE_PATH,
+    RETRIEVAL_BACKEND,
+    SUPPORTED_MODES,
+    SUPPORTED_SEVERITIES,
+    WARMUP_PING_LLM,
+    WARMUP_PRIME_CACHES,
+)
+
+logger = logging.getLogger(__name__)
+
+# A step returns an optional detail message, or raises on failure
+WarmupStep = Tuple[str, Callable[[], Optional[str]]]
+
+_STATE: Dict[str, Any] = {
+    "status":      "pending",      # pending → running → ready
+    "started_at":  None,
+    "finished_at": None,
+    "steps":       {},
+}
+_STATE_LOCK = threading.Lock()
+_DONE = threading.Event()
+
+
+# ── Warm-up steps ──────────────────────────────────────────────────────────────
+
+def _retrieval_enabled() -> bool:
+    """False in static fallback mode, where the embedder and Weaviate are never used."""
+    from app.health import weaviate_configured
+
+    return RETRIEVAL_BACKEND == "snapshot" or weaviate_configured()
+
+
+def _load_dosage_rules() -> Optional[str]:
+    from app.dosage_rules import get_rule_set
+
+    rule_set = get_rule_set()
+    return f"rule set {rule_set.version} loaded ({len(rule_set)} rules)"
+
+
+def _load_extractive_index() -> Optional[str]:
+    from app.extractive import get_extractive_index
+    from app.rag_pipeline import warm_template_plans
+
+    templates = warm_template_plans()
+    return f"{len(get_extractive_index()['labels'])} labels loaded, {templates} template plans built"
+
+
+def _load_plan_store() -> Optional[str]:
+    from app.plan_store import load_live_version
+
+    if not PLAN_STORE_PATH:
+        return "skipped (plan store disabled)"
+    version, plans = load_live_version()
+    if version is None:
+        return "skipped (no live version)"
+    return f"version {version} loaded ({plans} plans)"
+
+
+def _warm_embedder() -> Optional[str]:
+    if not _retrieval_enabled():
+        return "skipped (static fallback mode)"
+    from app.weaviate_client import get_embedder
+
+    get_embedder().encode("Grapevine disease treatment warm-up.")
+    return None
+
+
+def _warm_retrieval_backend() -> Optional[str]:
+    if RETRIEVAL_BACKEND == "snapshot":
+        from app.snapshot import get_snapshot_index
+
+        return f"snapshot index loaded ({len(get_snapshot_index().chunks)} chunks)"
+
+    from app.weaviate_client import weaviate_client
+
+    with weaviate_client(shared=True) as client:
+        if client is None:
+            return "skipped (static fallback mode)"
+        if not client.is_ready():
+            raise RuntimeError("Weaviate connection opened but instance is not ready")
+    return None
+
+
+def _prime_caches() -> Optional[str]:
+    if not _retrieval_enabled():
+        return "skipped (static fallback mode)"
+    from app.rag_pipeline import retrieve_chunks
+
+    primed = 0
+    for cnn_label in DISEASE_NAMES:
+        for mode in SUPPORTED_MODES:
+            for severity in SUPPORTED_SEVERITIES:
+                retrieve_chunks(cnn_label, mode, severity, top_k=8)
+                primed += 1
+    return f"{primed} combinations primed"
+
+
+def _load_generator() -> Optional[str]:
+    from app.llm_client import get_generator
+
+    return f"model {get_generator().model_id} loaded"
+
+
+def _ping_llm() -> Optional[str]:
+    from app.llm_client import call_llm
+
+    call_llm("Reply with the single word OK.", max_new_tokens=2, max_retries=1, timeout=15)
+    return None
+
+
+def default_warmup_steps() -> List[WarmupStep]:
+    """Returns the warm-up steps enabled by configuration, in execution order."""
+    steps: List[WarmupStep] = [
+        ("dosage_rules", _load_dosage_rules),
+        ("extractive_index", _load_extractive_index),
+        ("plan_store", _load_plan_store),
+        ("embedder", _warm_embedder),
+        ("retrieval_backend", _warm_retrieval_backend),
+    ]
+    if WARMUP_PRIME_CACHES:
+        steps.append(("caches", _prime_caches))
+    if GENERATION_BACKEND == "local":
+        steps.append(("generator", _load_generator))
+    if WARMUP_PING_LLM:
+        steps.append(("llm", _ping_llm))
+    return steps
+
+
+# ── Runner ─────────────────────────────────────────────────────────────────────
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def run_warmup(steps: Optional[List[WarmupStep]] = None) -> Dict[str, Any]:
+    """
+    Runs the warm-up steps sequentially and records their outcome.
+
+    Returns:
+        The final warm-up state (see get_warmup_state)
+    """
+    steps = default_warmup_steps() if steps is None else steps
+
+    with _STATE_LOCK:
+        _STATE.update(status="running", started_at=_now(), finished_at=None, steps={})
+    _DONE.clear()
+
+    for name, step in steps:
+        t0 = time.perf_counter()
+        try:
+            detail = step()
+            outcome = {"status": "skipped" if detail and detail.startswith("skipped") else "ok"}
+            if detail:
+                outcome["detail"] = detail
+        except Exception as e:
+            logger.warning(f"Warm-up step '{name}' failed: {e}")
+            outcome = {"status": "error", "detail": str(e)}
+        outcome["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        with _STATE_LOCK:
+            _STATE["steps"][name] = outcome
+
+    with _STATE_LOCK:
+        _STATE.update(status="ready", finished_at=_now())
+    _DONE.set()
+    logger.info("Warm-up complete.")
+    return get_warmup_state()
+
+
+def start_warmup() -> threading.Thread:
+    """Runs the warm-up in a daemon thread, so liveness probes answer immediately."""
+    thread = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def mark_ready() -> None:
+    """Declares the API ready without warming up (WARMUP_ON_STARTUP=false)."""
+    run_warmup(steps=[])
+
+
+def is_ready() -> bool:
+    return _DONE.is_set()
+
+
+def wait_until_ready(timeout: Optional[float] = None) -> bool:
+    """Blocks until warm-up has finished. Returns False on timeout."""
+    return _DONE.wait(timeout)
+
+
+def get_warmup_state() -> Dict[str, Any]:
+    """Returns a copy of the warm-up state (status, timestamps, per-step outcome)."""
+    with _STATE_LOCK:
+        return {**_STATE, "steps": {k: dict(v) for k, v in _STATE["steps"].items()}}
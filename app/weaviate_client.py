@@ -6,37 +6,68 @@ Connection strategy:
 - Local development (no HF env var) : connects to localhost:8080
 - HuggingFace without WEAVIATE_URL  : yields None (graceful degradation)
                                       → rag_pipeline falls back to static responses
+
+The weaviate client library and the embedder are imported lazily, on first
+connection / first query: importing app.main stays cheap for liveness probes
+and for the static fallback mode, where they are never used.
 """
 
 import os
 import logging
+import threading
 from contextlib import contextmanager
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-import weaviate
-import weaviate.classes as wvc
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from weaviate.classes.init import AdditionalConfig, Timeout
-from app.config import WEAVIATE_URL
+from app.config import KNOWLEDGE_COLLECTION, QUERY_VECTOR_CACHE_SIZE, WEAVIATE_URL
+from app.metrics import stage
+from app.tracing import annotate
+
+if TYPE_CHECKING:
+    import weaviate
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# ── Embedder (loaded once globally) ───────────────────────────────────────────
 
-_EMBEDDER: Optional[SentenceTransformer] = None
+# ── Embedder ───────────────────────────────────────────────────────────────────
+
+def get_embedder():
+    """
+    Returns the configured embedder (see app.embeddings), loaded once and reused.
+    The embedding backend is only imported on first use.
+    """
+    from app.embeddings import get_embedder as _get_embedder
+
+    return _get_embedder()
 
 
-def get_embedder() -> SentenceTransformer:
+@lru_cache(maxsize=QUERY_VECTOR_CACHE_SIZE)
+def embed_query(query_text: str) -> Tuple[float, ...]:
     """
-    Returns a SentenceTransformer model, loaded once and reused.
+    Embeds a retrieval query text, memoized.
+    Query texts only depend on (disease, mode, severity), so the cache
+    stays small and a warm process never re-encodes a known query.
     """
-    global _EMBEDDER
-    if _EMBEDDER is None:
-        _EMBEDDER = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    return _EMBEDDER
+    embedder = get_embedder()
+    with stage("embed"):
+        vector = embedder.encode(query_text)
+    return tuple(float(x) for x in vector)
+
+# ── Query text ─────────────────────────────────────────────────────────────────
+
+def build_query_text(disease_input: str, mode: Optional[str], severity: Optional[str]) -> str:
+    """
+    Builds the text embedded as the retrieval query vector.
+    Shared by every retrieval backend so that they rank chunks identically.
+    """
+    return (
+        f"Treatment recommendations for grapevine disease: {disease_input}. "
+        f"Farming mode: {mode or 'unspecified'}. Severity: {severity or 'unspecified'}. "
+        "Include diagnosis, curative actions, prevention and safety precautions."
+    )
 
 
 # ── Deployment detection helpers ───────────────────────────────────────────────
@@ -95,8 +126,72 @@ def weaviate_available() -> bool:
 
 # ── Weaviate client (context manager) ─────────────────────────────────────────
 
+def _connect():
+    """
+    Opens a new Weaviate connection (cloud if WEAVIATE_URL is set, else localhost).
+    """
+    import weaviate
+    from weaviate.classes.init import AdditionalConfig, Timeout
+
+    url     = (WEAVIATE_URL or "").strip()
+    api_key = (os.getenv("WEAVIATE_API_KEY") or "").strip()
+    is_local_url = not url or "localhost" in url or "127.0.0.1" in url
+
+    # ── LOCAL MODE ─────────────────────────────────────────────────────────────
+    if is_local_url:
+        logger.info("Connecting to local Weaviate instance (localhost:8080)")
+        return weaviate.connect_to_local(
+            host="localhost",
+            port=8080,
+            grpc_port=50051,
+            additional_config=AdditionalConfig(
+                timeout=Timeout(init=30, query=60, insert=60)
+            ),
+        )
+
+    # ── CLOUD MODE (Weaviate Cloud) ────────────────────────────────────────────
+    logger.info(f"Connecting to Weaviate Cloud: {url}")
+    auth = weaviate.auth.AuthApiKey(api_key) if api_key else None
+    return weaviate.connect_to_weaviate_cloud(
+        cluster_url=url,
+        auth_credentials=auth,
+        additional_config=AdditionalConfig(
+            timeout=Timeout(init=30, query=60, insert=60)
+        ),
+    )
+
+
+_SHARED_CLIENT: Optional["weaviate.WeaviateClient"] = None
+_SHARED_CLIENT_LOCK = threading.Lock()
+
+
+def get_shared_client() -> "weaviate.WeaviateClient":
+    """
+    Returns the process-wide Weaviate client used by the API request path,
+    connecting (or reconnecting after a dropped connection) when needed.
+    Saves the connection setup cost on every /solutions request.
+    """
+    global _SHARED_CLIENT
+    with _SHARED_CLIENT_LOCK:
+        if _SHARED_CLIENT is None or not _SHARED_CLIENT.is_connected():
+            if _SHARED_CLIENT is not None:
+                _SHARED_CLIENT.close()
+            _SHARED_CLIENT = _connect()
+        return _SHARED_CLIENT
+
+
+def close_shared_client() -> None:
+    """Closes the process-wide Weaviate client (called on API shutdown)."""
+    global _SHARED_CLIENT
+    with _SHARED_CLIENT_LOCK:
+        if _SHARED_CLIENT is not None:
+            _SHARED_CLIENT.close()
+            _SHARED_CLIENT = None
+            logger.info("Shared Weaviate connection closed.")
+
+
 @contextmanager
-def weaviate_client():
+def weaviate_client(shared: bool = False):
     """
     Context manager that opens and closes the Weaviate connection.
 
@@ -106,14 +201,16 @@ def weaviate_client():
     - Deployed without WEAVIATE_URL : yields None instead of raising RuntimeError
                                       → caller must check for None before using client
 
+    With shared=True, the process-wide client (see get_shared_client) is
+    yielded and left open on exit — used by the API request path.
+
     Usage:
         with weaviate_client() as client:
             if client is None:
                 return fallback_response()
             # ... use client normally
     """
-    url     = (WEAVIATE_URL or "").strip()
-    api_key = (os.getenv("WEAVIATE_API_KEY") or "").strip()
+    url = (WEAVIATE_URL or "").strip()
 
     # ── Check if we're deployed without proper Weaviate config ─────────────────
     is_local_url = not url or "localhost" in url or "127.0.0.1" in url
@@ -126,32 +223,15 @@ def weaviate_client():
         yield None
         return
 
+    if shared:
+        with stage("weaviate_connect"):
+            client = get_shared_client()
+        yield client
+        return
+
     client = None
     try:
-        # ── LOCAL MODE ─────────────────────────────────────────────────────────
-        if is_local_url:
-            logger.info("Connecting to local Weaviate instance (localhost:8080)")
-            client = weaviate.connect_to_local(
-                host="localhost",
-                port=8080,
-                grpc_port=50051,
-                additional_config=AdditionalConfig(
-                    timeout=Timeout(init=30, query=60, insert=60)
-                ),
-            )
-
-        # ── CLOUD MODE (Weaviate Cloud) ────────────────────────────────────────
-        else:
-            logger.info(f"Connecting to Weaviate Cloud: {url}")
-            auth = weaviate.auth.AuthApiKey(api_key) if api_key else None
-            client = weaviate.connect_to_weaviate_cloud(
-                cluster_url=url,
-                auth_credentials=auth,
-                additional_config=AdditionalConfig(
-                    timeout=Timeout(init=30, query=60, insert=60)
-                ),
-            )
-
+        client = _connect()
         yield client
 
     finally:
@@ -164,7 +244,7 @@ def weaviate_client():
 # ── RAG search ─────────────────────────────────────────────────────────────────
 
 def search_treatment_chunks(
-    client: weaviate.WeaviateClient,
+    client: "weaviate.WeaviateClient",
     disease_input: str,
     mode: Optional[str],
     severity: Optional[str],
@@ -187,10 +267,14 @@ def search_treatment_chunks(
     Returns:
         List of chunk dicts with text and metadata
     """
+    import weaviate.classes as wvc
+
+    # KNOWLEDGE_COLLECTION is an alias: Weaviate resolves it server-side to the
+    # current versioned collection, so a re-index never serves partial results.
     try:
-        collection = client.collections.get("VitiScanKnowledge")
+        collection = client.collections.get(KNOWLEDGE_COLLECTION)
     except Exception as e:
-        logger.error(f"Collection VitiScanKnowledge not found: {e}")
+        logger.error(f"Collection {KNOWLEDGE_COLLECTION} not found: {e}")
         return []
 
     key = (disease_input or "").strip()
@@ -198,13 +282,9 @@ def search_treatment_chunks(
         return []
 
     # Build query text for embedding
-    query_text = (
-        f"Treatment recommendations for grapevine disease: {key}. "
-        f"Farming mode: {mode or 'unspecified'}. Severity: {severity or 'unspecified'}. "
-        "Include diagnosis, curative actions, prevention and safety precautions."
-    )
+    query_text = build_query_text(key, mode, severity)
 
-    query_vector = get_embedder().encode(query_text).tolist()
+    query_vector = list(embed_query(query_text))
 
     # Disease filter: match cnn_label OR disease_id
     disease_filter = (
@@ -219,12 +299,14 @@ def search_treatment_chunks(
             where_filter = where_filter & mode_filter
 
         try:
-            response = collection.query.near_vector(
-                near_vector=query_vector,
-                limit=top_k,
-                filters=where_filter,
-                return_metadata=wvc.query.MetadataQuery(distance=True),
-            )
+            with stage("near_vector", with_mode=bool(with_mode and mode)):
+                response = collection.query.near_vector(
+                    near_vector=query_vector,
+                    limit=top_k,
+                    filters=where_filter,
+                    return_metadata=wvc.query.MetadataQuery(distance=True),
+                )
+                annotate(results=len(response.objects))
         except TimeoutError as e:
             logger.error(f"Weaviate query timeout: {e}")
             return []
@@ -245,10 +327,14 @@ def search_treatment_chunks(
             chunks.append({
                 "text":         text,
                 "section":      props.get("section", ""),
+                "subsection":   props.get("subsection", ""),
                 "disease_id":   props.get("disease_id", ""),
                 "cnn_label":    props.get("cnn_label", ""),
                 "disease_name": props.get("disease_name", ""),
                 "farming_mode": props.get("farming_mode", None),
+                "token_count":  props.get("token_count", None),
+                "plan_field":   props.get("plan_field"),
+                "plan_mode":    props.get("plan_mode"),
                 "distance":     distance,
             })
 
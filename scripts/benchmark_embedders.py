@@ -0,0 +1,90 @@
+"""
+benchmark_embedders.py — Compares the embedding backends (torch / onnx / onnx-int8).
+
+For each backend, a fresh Python process measures:
+  - cold start : import + model load + first encode (what a new worker pays)
+  - latency    : p50 / p95 of single-query encodes (the per-request cost)
+  - RSS        : peak resident memory of the process
+
+This script is NOT an automated pytest test.
+The ONNX backends require an exported model:
+    python -m app.embeddings export --quantize
+
+Usage:
+    python scripts/benchmark_embedders.py [--runs 200]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+BACKENDS = {
+    "torch":     {"EMBEDDING_BACKEND": "torch"},
+    "onnx":      {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZED": "false"},
+    "onnx-int8": {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZED": "true"},
+}
+
+# Executed in a child process so that cold start and RSS are not polluted
+# by previously loaded backends.
+CHILD = """
+import json, resource, statistics, sys, time
+t0 = time.perf_counter()
+from app.embeddings import get_embedder
+from app.weaviate_client import build_query_text
+embedder = get_embedder()
+embedder.encode(build_query_text("plasmopara_viticola", "organic", "high"))
+cold_start = time.perf_counter() - t0
+
+latencies = []
+for i in range(int(sys.argv[1])):
+    text = build_query_text("erysiphe_necator", "conventional", ("low", "moderate", "high")[i % 3])
+    t = time.perf_counter()
+    embedder.encode(text)
+    latencies.append((time.perf_counter() - t) * 1000)
+
+latencies.sort()
+print(json.dumps({
+    "cold_start_s": round(cold_start, 2),
+    "p50_ms":       round(statistics.median(latencies), 2),
+    "p95_ms":       round(latencies[int(len(latencies) * 0.95) - 1], 2),
+    "peak_rss_mb":  round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+}))
+"""
+
+
+def run_backend(env_overrides: dict, runs: int) -> dict:
+    import os
+
+    env = {**os.environ, **env_overrides}
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, str(runs)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=200, help="Single-query encodes per backend")
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'cold start':>11} {'p50':>9} {'p95':>9} {'peak RSS':>10}")
+    for name, env in BACKENDS.items():
+        r = run_backend(env, args.runs)
+        if "error" in r:
+            print(f"{name:<10} ERROR: {r['error']}")
+            continue
+        print(
+            f"{name:<10} {r['cold_start_s']:>10}s {r['p50_ms']:>7}ms "
+            f"{r['p95_ms']:>7}ms {r['peak_rss_mb']:>8}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+benchmark_pipeline.py — Micro-benchmarks of the CPU-side pipeline stages.
+
+Cases:
+  - parse/*    : parse_llm_structured_response over realistic LLM outputs
+                 (clean, fenced, repaired, double-encoded, truncated, prose)
+  - prompt     : build_treatment_prompt with 8 knowledge chunks
+  - dosage     : compute_dosage over every label × mode × severity (42 calls)
+  - dosage_batch/* : the same 42 combinations × 240 plots (10,080 plots) through
+                 compute_dosage_batch (dicts) and compute_dosage_arrays (columns)
+  - chunking   : split_markdown_sections + build_chunk_objects on the
+                 knowledge corpus scaled ×20 (synthetic copies)
+  - season     : infer_season_from_date over 13 dates (incl. invalid)
+  - schemas/*  : SolutionRequest validation, SolutionResponse serialization
+
+Timings are the best of several repeats. They are divided by a fixed
+pure-Python calibration workload timed the same way, so the recorded
+baseline stays comparable across machines (a CI runner vs a laptop).
+
+This script runs in CI through tests/test_benchmarks.py.
+
+Usage:
+    python scripts/benchmark_pipeline.py                    # report vs baseline
+    python scripts/benchmark_pipeline.py --check            # exit 1 on regression
+    python scripts/benchmark_pipeline.py --update-baseline  # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.config import DISEASE_NAMES, KNOWLEDGE_DIR, SUPPORTED_MODES, SUPPORTED_SEVERITIES  # noqa: E402
+from app.dosage_rules import compute_dosage, compute_dosage_arrays, compute_dosage_batch  # noqa: E402
+from app.ingestion import build_chunk_objects, load_markdown_files  # noqa: E402
+from app.prompts import build_treatment_prompt  # noqa: E402
+from app.rag_pipeline import infer_season_from_date, parse_llm_structured_response  # noqa: E402
+from app.schemas import SolutionRequest, SolutionResponse  # noqa: E402
+
+BASELINE_PATH = PROJECT_ROOT / "scripts" / "benchmark_baseline.json"
+
+# A case regresses when its normalized time exceeds baseline × (1 + tolerance)
+DEFAULT_TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", "1.0"))
+
+
+# ── Inputs ─────────────────────────────────────────────────────────────────────
+
+_PLAN = {
+    "diagnostic": "Downy mildew detected on young leaves, with oil spots and white sporulation underneath.",
+    "treatment_actions": [
+        "Apply a copper-based fungicide (Bordeaux mixture) within 24 hours.",
+        "Renew the application after 20 mm of rain.",
+        "Remove and destroy the most infected leaves.",
+    ],
+    "preventive_actions": [
+        "Open the canopy to reduce humidity around the bunches.",
+        "Monitor weather forecasts and treat before rain periods.",
+    ],
+    "warnings": [
+        "Respect the annual copper limit of 4 kg/ha in organic farming.",
+        "Respect the pre-harvest interval of the product.",
+    ],
+}
+
+LLM_OUTPUTS: Dict[str, str] = {
+    "clean_json":     json.dumps(_PLAN, ensure_ascii=False),
+    "fenced_json":    "Here is the plan:\n```json\n" + json.dumps(_PLAN, indent=2) + "\n```\nGood luck.",
+    # Smart quotes + trailing commas: repaired before json.loads
+    "repaired_json":  json.dumps(_PLAN, indent=2)
+                      .replace('"diagnostic"', "“diagnostic”")
+                      .replace("]\n}", "],\n}")
+                      .replace('interval of the product."', 'interval of the product.",'),
+    "double_encoded": json.dumps(json.dumps(_PLAN)),
+    # Cut by max_new_tokens (finish_reason == "length"): heuristic regex path
+    "truncated_json": json.dumps(_PLAN, indent=2)[:520],
+    "prose_bullets":  "- Apply copper fungicide.\n- Remove infected leaves.\n- Monitor after rain.\n" * 3,
+}
+
+_DATES = [f"2024-{month:02d}-15" for month in range(1, 13)] + ["not-a-date"]
+
+_RESPONSE_DATA = {
+    "cnn_label":      "plasmopara_viticola",
+    "disease_name":   "Downy mildew",
+    "mode":           "organic",
+    "area_m2":        12500.0,
+    "severity":       "high",
+    "season":         "spring",
+    "treatment_plan": compute_dosage("plasmopara_viticola", "organic", 12500.0, severity="high"),
+    **_PLAN,
+}
+
+
+def _scaled_corpus(copies: int) -> List[Dict[str, Any]]:
+    """The knowledge fiches repeated `copies` times, with distinct labels."""
+    fiches = load_markdown_files(Path(KNOWLEDGE_DIR))
+    scaled = []
+    for i in range(copies):
+        for fiche in fiches:
+            meta = dict(fiche["meta"], cnn_label=f"{fiche['meta'].get('cnn_label')}_{i}")
+            scaled.append({"path": fiche["path"], "meta": meta, "content": fiche["content"]})
+    return scaled
+
+
+def build_cases() -> Dict[str, Callable[[], Any]]:
+    """Returns benchmark name → zero-argument callable (inputs prepared once)."""
+    cases: Dict[str, Callable[[], Any]] = {}
+
+    for name, raw in LLM_OUTPUTS.items():
+        cases[f"parse/{name}"] = lambda raw=raw: parse_llm_structured_response(raw)
+
+    chunks = build_chunk_objects(load_markdown_files(Path(KNOWLEDGE_DIR)))[:8]
+    cases["prompt"] = lambda: build_treatment_prompt(
+        cnn_label="plasmopara_viticola",
+        disease_name="Downy mildew",
+        mode="organic",
+        severity="high",
+        area_m2=12500.0,
+        season="spring",
+        context_chunks=[{"text": c["text"]} for c in chunks],
+    )
+
+    combos = [(label, mode, severity)
+              for label in DISEASE_NAMES for mode in SUPPORTED_MODES for severity in SUPPORTED_SEVERITIES]
+    cases["dosage"] = lambda: [compute_dosage(l, m, 5000.0, severity=s) for l, m, s in combos]
+
+    plots = combos * 240
+    labels, modes, severities = (list(column) for column in zip(*plots))
+    areas = [500.0 + 37.5 * i for i in range(len(plots))]
+    cases["dosage_batch/dicts"] = lambda: compute_dosage_batch(labels, modes, areas, severities)
+    cases["dosage_batch/arrays"] = lambda: compute_dosage_arrays(labels, modes, areas, severities)
+
+    corpus = _scaled_corpus(copies=20)
+    cases["chunking"] = lambda: build_chunk_objects(corpus)
+
+    cases["season"] = lambda: [infer_season_from_date(d) for d in _DATES]
+
+    request_body = {
+        "cnn_label": "plasmopara_viticola", "mode": "organic", "severity": "high",
+        "area_m2": 12500.0, "date_iso": "2024-05-15", "location": "Bordeaux, France",
+    }
+    cases["schemas/request_validate"] = lambda: SolutionRequest.model_validate(request_body)
+    cases["schemas/response_serialize"] = lambda: SolutionResponse(data=_RESPONSE_DATA).model_dump_json()
+
+    return cases
+
+
+def _calibration_workload() -> Any:
+    """Fixed pure-Python work (string ops, regex, dicts, sorting) used as time unit."""
+    words = [f"word{i % 97}" for i in range(300)]
+    text  = " ".join(words)
+    counts: Dict[str, int] = {}
+    for token in re.findall(r"\w+", text):
+        counts[token] = counts.get(token, 0) + 1
+    return sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+
+
+# ── Runner ─────────────────────────────────────────────────────────────────────
+
+def time_callable(fn: Callable[[], Any], repeat: int, min_time_s: float) -> float:
+    """
+    Returns the best time per call in microseconds: the number of calls per
+    repeat is scaled so that one repeat lasts at least min_time_s.
+    """
+    timer  = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time_s:
+            break
+        number = max(number * 2, int(number * min_time_s / max(elapsed, 1e-9) * 1.2))
+    return min([elapsed] + timer.repeat(repeat=repeat - 1, number=number)) / number * 1e6
+
+
+def run_suite(quick: bool = False) -> Dict[str, Any]:
+    repeat, min_time_s = (3, 0.02) if quick else (7, 0.1)
+
+    cases = build_cases()
+    raw   = {name: 0.0 for name in cases}
+
+    # Calibration timed before and after the cases: the best of both absorbs
+    # frequency scaling / noisy neighbours at either end of the run
+    calibration_us = time_callable(_calibration_workload, repeat, min_time_s)
+    for name, fn in cases.items():
+        raw[name] = time_callable(fn, repeat, min_time_s)
+    calibration_us = min(calibration_us, time_callable(_calibration_workload, repeat, min_time_s))
+
+    results: Dict[str, Dict[str, float]] = {
+        name: {"us": round(us, 2), "normalized": round(us / calibration_us, 4)}
+        for name, us in raw.items()
+    }
+
+    return {
+        "python":         platform.python_version(),
+        "calibration_us": round(calibration_us, 2),
+        "cases":          results,
+    }
+
+
+def compare(run: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Tuple[str, float, str]]:
+    """
+    Returns:
+        List of (case, ratio to baseline, status) — status is 'ok', 'REGRESSION' or 'new'
+    """
+    rows = []
+    for name, stats in run["cases"].items():
+        reference = baseline.get("cases", {}).get(name)
+        if not reference:
+            rows.append((name, float("nan"), "new"))
+            continue
+        ratio = stats["normalized"] / reference["normalized"]
+        rows.append((name, ratio, "REGRESSION" if ratio > 1 + tolerance else "ok"))
+    return rows
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="CPU-side pipeline micro-benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="Fewer / shorter repeats (CI)")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if a case regresses")
+    parser.add_argument("--update-baseline", action="store_true", help=f"Write {BASELINE_PATH.name}")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown vs baseline (1.0 = up to 2x)")
+    parser.add_argument("--json", action="store_true", help="Print the raw results as JSON")
+    args = parser.parse_args(argv)
+
+    run = run_suite(quick=args.quick)
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(run, indent=2) + "\n", encoding="utf-8")
+        print(f"[BENCH] Baseline written to {BASELINE_PATH}")
+        return 0
+
+    baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8")) if BASELINE_PATH.exists() else {}
+    rows = compare(run, baseline, args.tolerance)
+
+    if args.json:
+        print(json.dumps({**run, "comparison": {n: {"ratio": r, "status": s} for n, r, s in rows}}))
+    else:
+        print(f"[BENCH] calibration unit = {run['calibration_us']:.2f} µs "
+              f"(baseline {baseline.get('calibration_us', float('nan')):.2f} µs)")
+        print(f"{'case':<28} {'µs/call':>12} {'normalized':>11} {'vs base':>8}  status")
+        for name, ratio, status in rows:
+            stats = run["cases"][name]
+            print(f"{name:<28} {stats['us']:>12.2f} {stats['normalized']:>11.4f} {ratio:>7.2f}x  {status}")
+
+    regressions = [name for name, _, status in rows if status == "REGRESSION"]
+    if args.check and regressions:
+        print(f"[BENCH] Regression (> {1 + args.tolerance:.1f}x baseline): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,517 @@
+"""
+loadtest.py — Offline end-to-end load test of POST /solutions.
+
+For each scenario, the harness:
+  1. starts a mock LLM router (scripts/mock_llm_server.py) with the
+     scenario's latency distribution, token rate and 500 / 429 injection
+  2. starts the real API (uvicorn app.main:app) in a child process, wired to
+     the mock router and to an in-process retrieval stand-in: the knowledge
+     corpus chunked as in ingestion, embedded by a hashing embedder and
+     served by the snapshot index (RETRIEVAL_BACKEND=snapshot), with
+     configurable embedding / search latencies in place of Weaviate
+  3. waits for GET /ready, then drives open-loop traffic at the target RPS
+     (arrivals do not wait for responses; latency is measured from the
+     scheduled send time, so a slow server cannot hide its queueing)
+  4. reports throughput, latency p50 / p95 / p99, errors, degraded answers
+     (fallback counters scraped from /metrics), mock LLM answers and the
+     server's CPU / peak RSS / threads
+
+Nothing leaves the machine: no HF credits, no Weaviate instance.
+
+Scenario files are JSON lists; missing keys take DEFAULT_SCENARIO values:
+    {"name": "no_cache", "rps": 10, "duration_s": 20,
+     "llm":       {"latency": "lognormal:0.6,0.5", "token_rate": 80, "rate_limit_rate": 0.05},
+     "retrieval": {"embed_latency": "fixed:0.01", "search_latency": "lognormal:0.03,0.4"},
+     "env":       {"RETRIEVAL_CACHE_TTL_S": "0"},
+     "server":    {"limit_concurrency": 32}}
+With "env": {"GENERATION_BACKEND": "stub"} the API generates with the
+in-process stub (app.llm_client) instead of calling the mock router.
+
+This script is NOT an automated pytest test (tests/test_loadtest.py runs
+a 2-second smoke scenario).
+
+Usage:
+    python scripts/loadtest.py                                          # default scenario
+    python scripts/loadtest.py --scenarios scripts/loadtest_scenarios.json
+    python scripts/loadtest.py --rps 20 --duration 30 --llm-latency fixed:0.5 --rate-limit-rate 0.1
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SCRIPTS_DIR  = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from mock_llm_server import LatencyDistribution, MockLLMServer, config_from_dict  # noqa: E402
+
+DEFAULT_SCENARIO: Dict[str, Any] = {
+    "name":       "default",
+    "rps":        10.0,
+    "duration_s": 20.0,
+    "arrival":    "poisson",        # "poisson" or "uniform" inter-arrival times
+    "seed":       0,
+    "timeout_s":  60.0,
+    "max_in_flight": 512,           # client-side cap; arrivals beyond it are dropped
+    "llm": {
+        "latency":    "lognormal:0.6,0.5",
+        "token_rate": 80.0,
+    },
+    "retrieval": {
+        "embed_latency":  "fixed:0.01",
+        "search_latency": "lognormal:0.03,0.4",
+    },
+    "env":    {},                   # extra environment for the API process
+    "server": {},                   # extra uvicorn.run() options (limit_concurrency...)
+}
+
+# Environment of the API process, before the scenario's own "env"
+BASE_APP_ENV = {
+    "HF_TOKEN":                "loadtest",
+    "RETRIEVAL_BACKEND":       "snapshot",
+    "HEALTH_PROBE_INTERVAL_S": "0",
+    "TRACE_EXPORTER":          "none",
+    "WARMUP_ON_STARTUP":       "true",
+    "WARMUP_PING_LLM":         "false",
+    # Every label through the full pipeline (a scenario can set its own policies)
+    "LABEL_POLICIES":          "",
+    "PLAN_STORE_PATH":         "",
+}
+
+
+# ── Retrieval stand-in (runs inside the API process) ───────────────────────────
+
+class HashingEmbedder:
+    """
+    Deterministic stand-in for the sentence embedder: each word is hashed to
+    a fixed random direction, the text vector is their normalized sum.
+    Similar texts share words, so ranking stays meaningful.
+    """
+
+    def __init__(self, dimension: int = 384, latency: Optional[LatencyDistribution] = None, seed: int = 0):
+        self.dimension = dimension
+        self.latency   = latency
+        self._rng      = random.Random(seed)
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        return np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+
+    def encode(self, text: str) -> np.ndarray:
+        if self.latency is not None:
+            time.sleep(self.latency.sample(self._rng))
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            vector += self._word_vector(word.strip(".,:;()"))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def install_retrieval_standin(embed_latency: str, search_latency: str, seed: int = 0) -> int:
+    """
+    Replaces the embedder and the snapshot index of this process by the
+    stand-ins (must run before the first request).
+
+    Returns:
+        Number of indexed chunks
+    """
+    import app.embeddings
+    import app.snapshot
+    from app.config import KNOWLEDGE_DIR
+    from app.ingestion import build_chunk_objects, load_markdown_files
+
+    embedder = HashingEmbedder(latency=LatencyDistribution.parse(embed_latency), seed=seed)
+    chunks   = build_chunk_objects(load_markdown_files(Path(KNOWLEDGE_DIR)))
+    indexer  = HashingEmbedder()
+    vectors  = np.stack([indexer.encode(c["text"]) for c in chunks])
+
+    search_delay = LatencyDistribution.parse(search_latency)
+    rng  = random.Random(seed)
+    lock = threading.Lock()
+
+    class StandinIndex(app.snapshot.SnapshotIndex):
+        """Snapshot index paying a Weaviate-like network latency per search."""
+
+        def search(self, *args, **kwargs):
+            with lock:
+                delay = search_delay.sample(rng)
+            time.sleep(delay)
+            return super().search(*args, **kwargs)
+
+    app.embeddings._EMBEDDER     = embedder
+    app.snapshot._SNAPSHOT_INDEX = StandinIndex(chunks, vectors)
+    return len(chunks)
+
+
+# Executed in the API child process
+CHILD = """
+import json, sys
+sys.path.insert(0, %(scripts_dir)r)
+from loadtest import install_retrieval_standin
+install_retrieval_standin(%(embed_latency)r, %(search_latency)r, seed=%(seed)d)
+
+import uvicorn
+from app.main import app
+uvicorn.run(app, host="127.0.0.1", port=%(port)d, log_level="warning", **json.loads(%(server)r))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(scenario: Dict[str, Any], llm_url: str, log_file) -> Tuple[subprocess.Popen, str]:
+    """Starts the API child process and returns it with its base URL."""
+    port = _free_port()
+    code = CHILD % {
+        "scripts_dir":    str(SCRIPTS_DIR),
+        "embed_latency":  scenario["retrieval"]["embed_latency"],
+        "search_latency": scenario["retrieval"]["search_latency"],
+        "seed":           scenario["seed"],
+        "port":           port,
+        "server":         json.dumps(scenario["server"]),
+    }
+    env = {**os.environ, **BASE_APP_ENV, "HF_API_URL": llm_url,
+           **{k: str(v) for k, v in scenario["env"].items()}}
+    proc = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-c", code],
+        cwd=PROJECT_ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def wait_ready(proc: subprocess.Popen, base_url: str, timeout_s: float = 120.0) -> None:
+    """
+    Raises:
+        RuntimeError: If the API exits or is not ready within timeout_s
+    """
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API process exited with code {proc.returncode}")
+        try:
+            if requests.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"API not ready after {timeout_s:.0f}s")
+
+
+# ── Server resources (Linux /proc) ─────────────────────────────────────────────
+
+class ResourceSampler:
+    """Samples CPU time, RSS and thread count of a process every interval_s."""
+
+    def __init__(self, pid: int, interval_s: float = 0.25):
+        self.pid        = pid
+        self.interval_s = interval_s
+        self.samples: List[Dict[str, float]] = []
+        self._stop      = threading.Event()
+        self._thread    = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    def read(self) -> Optional[Dict[str, float]]:
+        try:
+            stat   = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+            status = Path(f"/proc/{self.pid}/status").read_text()
+        except OSError:
+            return None
+        fields = dict(line.split(":", 1) for line in status.splitlines() if ":" in line)
+        ticks  = os.sysconf("SC_CLK_TCK")
+        return {
+            "t":       time.monotonic(),
+            "cpu_s":   (int(stat[11]) + int(stat[12])) / ticks,   # utime + stime
+            "rss_mb":  int(fields["VmRSS"].split()[0]) / 1024,
+            "threads": int(fields["Threads"]),
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            sample = self.read()
+            if sample:
+                self.samples.append(sample)
+            self._stop.wait(self.interval_s)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop.set()
+        self._thread.join()
+        if len(self.samples) < 2:
+            return {"cpu_percent": None, "peak_rss_mb": None, "max_threads": None}
+        first, last = self.samples[0], self.samples[-1]
+        return {
+            "cpu_percent": round(100 * (last["cpu_s"] - first["cpu_s"]) / (last["t"] - first["t"]), 1),
+            "peak_rss_mb": round(max(s["rss_mb"] for s in self.samples), 1),
+            "max_threads": max(s["threads"] for s in self.samples),
+        }
+
+
+# ── Metrics scraped from the API ───────────────────────────────────────────────
+
+SCRAPED_COUNTERS = ("vitiscan_fallbacks_total", "vitiscan_llm_retries_total", "vitiscan_llm_attempts_total")
+
+
+def scrape_counters(base_url: str) -> Counter:
+    """Returns {"metric{label=value}": value} for SCRAPED_COUNTERS."""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    text   = requests.get(f"{base_url}/metrics", timeout=5).text
+    values = Counter()
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name in SCRAPED_COUNTERS:
+                labels = ",".join(f"{k}={v}" for k, v in sorted(sample.labels.items()))
+                values[f"{sample.name}{{{labels}}}" if labels else sample.name] += sample.value
+    return values
+
+
+# ── Open-loop load generator ───────────────────────────────────────────────────
+
+def random_payload(rng: random.Random) -> Dict[str, Any]:
+    from app.config import DISEASE_NAMES, SUPPORTED_MODES, SUPPORTED_SEVERITIES
+
+    return {
+        "cnn_label": rng.choice(sorted(DISEASE_NAMES)),
+        "mode":      rng.choice(SUPPORTED_MODES),
+        "severity":  rng.choice(SUPPORTED_SEVERITIES),
+        "area_m2":   float(rng.choice((500, 2500, 10000, 50000))),
+        "date_iso":  f"2024-{rng.randint(1, 12):02d}-15",
+    }
+
+
+def run_load(base_url: str, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Sends requests at the scheduled arrival times for duration_s seconds.
+
+    Returns:
+        Dict with the per-request results and the wall-clock duration
+    """
+    rng     = random.Random(scenario["seed"])
+    rps     = float(scenario["rps"])
+    results: List[Dict[str, Any]] = []
+    local   = threading.local()
+    lock    = threading.Lock()
+    in_flight = 0
+    dropped   = 0
+
+    def send(scheduled: float, payload: Dict[str, Any]) -> None:
+        nonlocal in_flight
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        outcome: Dict[str, Any] = {}
+        try:
+            response = session.post(f"{base_url}/solutions", json=payload, timeout=scenario["timeout_s"])
+            outcome["status"] = response.status_code
+        except requests.Timeout:
+            outcome["error"] = "timeout"
+        except requests.RequestException as e:
+            outcome["error"] = type(e).__name__
+        outcome["latency_ms"] = (time.perf_counter() - scheduled) * 1000
+        with lock:
+            results.append(outcome)
+            in_flight -= 1
+
+    executor = ThreadPoolExecutor(max_workers=scenario["max_in_flight"], thread_name_prefix="load")
+    start    = time.perf_counter()
+    next_at  = start
+    end      = start + float(scenario["duration_s"])
+    max_lag  = 0.0
+
+    while next_at < end:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        max_lag = max(max_lag, time.perf_counter() - next_at)
+        with lock:
+            accepted = in_flight < scenario["max_in_flight"]
+            if accepted:
+                in_flight += 1
+        if accepted:
+            executor.submit(send, next_at, random_payload(rng))
+        else:
+            dropped += 1
+        gap = rng.expovariate(rps) if scenario["arrival"] == "poisson" else 1.0 / rps
+        next_at += gap
+
+    executor.shutdown(wait=True)
+    return {
+        "results":       results,
+        "dropped":       dropped,
+        "wall_s":        time.perf_counter() - start,
+        "max_send_lag_ms": round(max_lag * 1000, 1),
+    }
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return round(sorted_values[rank - 1], 1)
+
+
+def summarize(load: Dict[str, Any]) -> Dict[str, Any]:
+    results = load["results"]
+    ok      = sorted(r["latency_ms"] for r in results if r.get("status") == 200)
+    errors  = Counter(r.get("error") or f"http_{r['status']}" for r in results if r.get("status") != 200)
+    sent    = len(results) + load["dropped"]
+    return {
+        "sent":            sent,
+        "ok":              len(ok),
+        "throughput_rps":  round(len(ok) / load["wall_s"], 2) if load["wall_s"] else 0.0,
+        "error_rate":      round((sent - len(ok)) / sent, 4) if sent else 0.0,
+        "errors":          dict(errors, **({"dropped": load["dropped"]} if load["dropped"] else {})),
+        "latency_ms": {
+            "p50": _percentile(ok, 50),
+            "p95": _percentile(ok, 95),
+            "p99": _percentile(ok, 99),
+            "max": round(ok[-1], 1) if ok else None,
+        },
+        "max_send_lag_ms": load["max_send_lag_ms"],
+    }
+
+
+# ── Scenario runner ────────────────────────────────────────────────────────────
+
+def resolve_scenario(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Fills missing keys (including nested llm / retrieval ones) from DEFAULT_SCENARIO."""
+    scenario = copy.deepcopy(DEFAULT_SCENARIO)
+    for key, value in raw.items():
+        if isinstance(value, dict) and isinstance(scenario.get(key), dict):
+            scenario[key].update(value)
+        else:
+            scenario[key] = value
+    return scenario
+
+
+def run_scenario(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs one scenario end to end and returns its report."""
+    scenario = resolve_scenario(raw)
+    print(f"[LOAD] {scenario['name']}: {scenario['rps']:g} rps for {scenario['duration_s']:g}s "
+          f"(llm={scenario['llm']}, env={scenario['env']}, server={scenario['server']})", file=sys.stderr)
+
+    with MockLLMServer(config_from_dict(scenario["llm"])) as llm, \
+            tempfile.TemporaryFile(mode="w+") as log_file:
+        proc, base_url = start_app(scenario, llm.completions_url, log_file)
+        try:
+            try:
+                wait_ready(proc, base_url)
+            except RuntimeError:
+                log_file.seek(0)
+                print(log_file.read()[-4000:], file=sys.stderr)
+                raise
+
+            sampler = ResourceSampler(proc.pid)
+            before  = scrape_counters(base_url)
+            llm.stats.clear()
+            sampler.start()
+            load = run_load(base_url, scenario)
+            resources = sampler.stop()
+            after = scrape_counters(base_url)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    return {
+        "scenario":  scenario["name"],
+        "config":    {k: scenario[k] for k in ("rps", "duration_s", "arrival", "llm", "retrieval", "env", "server")},
+        **summarize(load),
+        "server":    resources,
+        "pipeline":  {k: round(v, 2) for k, v in (after - before).items() if v},
+        "mock_llm":  {f"http_{status}": n for status, n in sorted(llm.stats.items())},
+    }
+
+
+def print_report(reports: List[Dict[str, Any]]) -> None:
+    print(f"{'scenario':<22} {'rps':>6} {'ok/s':>7} {'err%':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'cpu%':>6} {'rss MB':>7}")
+    for r in reports:
+        lat, srv = r["latency_ms"], r["server"]
+        cells = [lat["p50"], lat["p95"], lat["p99"]]
+        print(f"{r['scenario']:<22} {r['config']['rps']:>6g} {r['throughput_rps']:>7.2f} "
+              f"{r['error_rate'] * 100:>5.1f}% "
+              + " ".join(f"{c:>8.1f}" if c is not None else f"{'-':>8}" for c in cells)
+              + f" {srv['cpu_percent'] if srv['cpu_percent'] is not None else '-':>6} "
+              f"{srv['peak_rss_mb'] if srv['peak_rss_mb'] is not None else '-':>7}")
+        if r["errors"]:
+            print(f"  errors   : {r['errors']}")
+        if r["pipeline"]:
+            print(f"  pipeline : {r['pipeline']}")
+        print(f"  mock LLM : {r['mock_llm']}")
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test of POST /solutions.")
+    parser.add_argument("--scenarios", type=Path, help="JSON list of scenarios (see module docstring)")
+    parser.add_argument("--only", action="append", help="Run only the named scenario(s)")
+    parser.add_argument("--rps", type=float, help="Target requests per second")
+    parser.add_argument("--duration", type=float, help="Load duration in seconds")
+    parser.add_argument("--llm-latency", help="fixed:S | uniform:LOW,HIGH | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--token-rate", type=float, help="Mock LLM completion tokens per second")
+    parser.add_argument("--error-rate", type=float, help="Share of HTTP 500 from the mock LLM")
+    parser.add_argument("--rate-limit-rate", type=float, help="Share of HTTP 429 from the mock LLM")
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    parser.add_argument("--output", type=Path, help="Also write the JSON reports to this file")
+    args = parser.parse_args(argv)
+
+    scenarios = json.loads(args.scenarios.read_text(encoding="utf-8")) if args.scenarios else [{}]
+    if args.only:
+        scenarios = [s for s in scenarios if s.get("name") in args.only]
+
+    # Command-line values override every selected scenario
+    overrides: Dict[str, Any] = {"llm": {}}
+    for flag, key in (("rps", "rps"), ("duration", "duration_s")):
+        if getattr(args, flag) is not None:
+            overrides[key] = getattr(args, flag)
+    for flag, key in (("llm_latency", "latency"), ("token_rate", "token_rate"),
+                      ("error_rate", "error_rate"), ("rate_limit_rate", "rate_limit_rate")):
+        if getattr(args, flag) is not None:
+            overrides["llm"][key] = getattr(args, flag)
+
+    reports = []
+    for raw in scenarios:
+        raw = copy.deepcopy(raw)
+        raw.update({k: v for k, v in overrides.items() if k != "llm"})
+        raw["llm"] = {**raw.get("llm", {}), **overrides["llm"]}
+        reports.append(run_scenario(raw))
+
+    if args.output:
+        args.output.write_text(json.dumps(reports, indent=2) + "\n", encoding="utf-8")
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_report(reports)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+mock_llm_server.py — Local stand-in for the OpenAI-compatible LLM router.
+
+Serves the two routes the API uses, without HF credits or network:
+  - POST /v1/chat/completions : a valid JSON treatment plan, with `usage`
+                                and `finish_reason` like the HF router
+  - GET  /v1/models           : reachability probe (see app.health)
+  - GET  /stats               : requests served, by HTTP status
+
+Behaviour is configurable per server:
+  - latency    : base latency distribution before the first token
+                 ("fixed:0.4", "uniform:0.2,1.0", "lognormal:0.6,0.5"
+                 = median seconds, sigma)
+  - token rate : completion tokens generated per second (adds
+                 completion_tokens / rate to the base latency)
+  - errors     : share of HTTP 500 and HTTP 429 (with Retry-After) answers
+  - truncation : share of answers cut at max_tokens (finish_reason "length")
+
+Draws are seeded, so two runs with the same configuration and request
+sequence see the same latencies and failures.
+
+Usage:
+    python scripts/mock_llm_server.py --port 8081 --latency lognormal:0.6,0.5 \\
+        --token-rate 40 --error-rate 0.02 --rate-limit-rate 0.05
+    HF_API_URL=http://127.0.0.1:8081/v1/chat/completions HF_TOKEN=mock uvicorn app.main:app
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+MODEL_ID = "mock/treatment-plan-llm"
+
+_PLAN = {
+    "diagnostic": "Symptoms are consistent with the detected disease; the infection is active on young leaves.",
+    "treatment_actions": [
+        "Apply an authorized fungicide adapted to the farming mode within 48 hours.",
+        "Renew the application after significant rainfall, respecting the label interval.",
+        "Remove and destroy the most infected leaves and bunches.",
+    ],
+    "preventive_actions": [
+        "Open the canopy to reduce humidity around the bunches.",
+        "Monitor weather forecasts and treat before rain periods.",
+    ],
+    "warnings": [
+        "Respect the pre-harvest interval of every applied product.",
+        "Wear personal protective equipment during application.",
+    ],
+}
+PLAN_TEXT = json.dumps(_PLAN, ensure_ascii=False)
+
+
+# ── Latency distributions ──────────────────────────────────────────────────────
+
+@dataclass
+class LatencyDistribution:
+    """
+    Latency in seconds, parsed from "kind:params":
+    fixed:S | uniform:LOW,HIGH | lognormal:MEDIAN,SIGMA
+    """
+    kind: str = "fixed"
+    params: Tuple[float, ...] = (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        """
+        Raises:
+            ValueError: If the spec is malformed or the kind is unknown
+        """
+        kind, _, raw = spec.strip().partition(":")
+        params = tuple(float(p) for p in raw.split(",") if p.strip())
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(
+                f"Invalid latency '{spec}' (expected fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA)."
+            )
+        return cls(kind, params)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return self.params[0]
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(f'{p:g}' for p in self.params)}"
+
+
+# ── Server ─────────────────────────────────────────────────────────────────────
+
+@dataclass
+class MockLLMConfig:
+    latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    token_rate: float = 50.0            # completion tokens per second (0 = instant)
+    completion_tokens: Tuple[int, int] = (180, 320)
+    error_rate: float = 0.0             # share of HTTP 500
+    rate_limit_rate: float = 0.0        # share of HTTP 429
+    truncation_rate: float = 0.0        # share of finish_reason "length"
+    seed: int = 0
+
+
+class MockLLMServer:
+    """
+    Threaded HTTP server answering like the HF router. Use as a context
+    manager, or start()/stop() around a run.
+
+    Usage:
+        with MockLLMServer(MockLLMConfig(token_rate=40)) as llm:
+            os.environ["HF_API_URL"] = llm.completions_url
+    """
+
+    def __init__(self, config: MockLLMConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config  = config
+        self.stats: Counter = Counter()
+        self._rng    = random.Random(config.seed)
+        self._lock   = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def completions_url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    def start(self) -> "MockLLMServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def draw(self, max_tokens: int) -> Dict[str, Any]:
+        """Draws the outcome of one completion request (under a lock: seeded sequence)."""
+        cfg = self.config
+        with self._lock:
+            roll = self._rng.random()
+            if roll < cfg.rate_limit_rate:
+                return {"status": 429}
+            if roll < cfg.rate_limit_rate + cfg.error_rate:
+                return {"status": 500}
+            completion = min(self._rng.randint(*cfg.completion_tokens), max_tokens)
+            truncated  = self._rng.random() < cfg.truncation_rate
+            delay      = cfg.latency.sample(self._rng)
+        if truncated:
+            completion = max_tokens
+        if cfg.token_rate > 0:
+            delay += completion / cfg.token_rate
+        return {"status": 200, "completion_tokens": completion, "truncated": truncated, "delay": delay}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                with server._lock:
+                    server.stats[status] += 1
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": MODEL_ID, "object": "model"}]})
+                elif self.path == "/stats":
+                    with server._lock:
+                        stats = {str(k): v for k, v in server.stats.items()}
+                    self._send_json(200, stats)
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self) -> None:
+                length  = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": "not found"})
+                    return
+
+                outcome = server.draw(int(payload.get("max_tokens") or 256))
+                if outcome["status"] == 429:
+                    self._send_json(429, {"error": "Rate limit reached"}, {"Retry-After": "1"})
+                    return
+                if outcome["status"] == 500:
+                    self._send_json(500, {"error": "Internal server error (injected)"})
+                    return
+
+                time.sleep(outcome["delay"])
+                prompt = " ".join(m.get("content", "") for m in payload.get("messages", []))
+                prompt_tokens = max(1, len(prompt) // 4)
+                text = PLAN_TEXT
+                if outcome["truncated"]:
+                    text = text[: max(1, len(text) * 2 // 3)]
+                self._send_json(200, {
+                    "id":      f"mock-{time.time_ns()}",
+                    "object":  "chat.completion",
+                    "model":   payload.get("model") or MODEL_ID,
+                    "choices": [{
+                        "index":         0,
+                        "message":       {"role": "assistant", "content": text},
+                        "finish_reason": "length" if outcome["truncated"] else "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens":     prompt_tokens,
+                        "completion_tokens": outcome["completion_tokens"],
+                        "total_tokens":      prompt_tokens + outcome["completion_tokens"],
+                    },
+                })
+
+        return Handler
+
+
+def config_from_dict(raw: Dict[str, Any]) -> MockLLMConfig:
+    """Builds a MockLLMConfig from a scenario's "llm" block (see scripts/loadtest.py)."""
+    config = MockLLMConfig()
+    if "latency" in raw:
+        config.latency = LatencyDistribution.parse(raw["latency"])
+    if "completion_tokens" in raw:
+        config.completion_tokens = tuple(raw["completion_tokens"])
+    for key in ("token_rate", "error_rate", "rate_limit_rate", "truncation_rate", "seed"):
+        if key in raw:
+            setattr(config, key, type(getattr(config, key))(raw[key]))
+    return config
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM router.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="lognormal:0.6,0.5", help="fixed:S | uniform:LOW,HIGH | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Completion tokens per second (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of HTTP 500 answers")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of HTTP 429 answers")
+    parser.add_argument("--truncation-rate", type=float, default=0.0, help="Share of answers cut at max_tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = MockLLMConfig(
+        latency=LatencyDistribution.parse(args.latency),
+        token_rate=args.token_rate,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        truncation_rate=args.truncation_rate,
+        seed=args.seed,
+    )
+    server = MockLLMServer(config, host=args.host, port=args.port)
+    print(f"[MOCK-LLM] Serving {server.completions_url} (latency={config.latency}, "
+          f"{config.token_rate:g} tok/s, 500={config.error_rate:.0%}, 429={config.rate_limit_rate:.0%})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""
+replay_requests.py — Replays a recorded log of SolutionRequest bodies and
+compares runs (latency and output drift).
+
+Input: JSON lines (optionally .gz, or "-" for stdin), each line either a
+SolutionRequest body or an envelope carrying its arrival time:
+    {"cnn_label": "plasmopara_viticola", "mode": "organic", "severity": "high", "area_m2": 5000}
+    {"ts": "2025-06-01T08:12:03.120Z", "request": {...}}        # also "timestamp" / "body"
+
+The log is streamed: memory does not depend on its size, so multi-GB logs
+are fine. Requests are sent:
+  - as fast as --concurrency allows (default), or
+  - at their recorded timing (--speed 1) or accelerated (--speed 10 = 10x)
+against a running instance (--target http://host:port, POST /solutions) or
+in-process (--in-process, through generate_treatment_advice with the local
+configuration — point HF_API_URL at scripts/mock_llm_server.py to stay offline).
+
+A run file (JSON lines, input order) records per request: latency, status
+and a hash of the treatment plan (volatile fields excluded). Two runs of the
+same log — e.g. before and after a cache or model change — are compared
+with `diff`: latency percentiles, slowest regressions, status changes and
+plans whose hash changed.
+
+Usage:
+    python scripts/replay_requests.py run logs/requests.jsonl.gz --target http://127.0.0.1:9000 -o before.jsonl
+    python scripts/replay_requests.py run logs/requests.jsonl --in-process --speed 5 -o after.jsonl
+    python scripts/replay_requests.py diff before.jsonl after.jsonl
+"""
+
+import argparse
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import math
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import zip_longest
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# Response fields that change from call to call without the plan changing
+VOLATILE_FIELDS = ("raw_llm_output", "timings", "profile")
+
+
+# ── Input log ──────────────────────────────────────────────────────────────────
+
+def _open_text(path: str) -> TextIO:
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds from a number or an ISO 8601 string (None if absent / invalid)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def read_log(path: str) -> Iterator[Tuple[int, Optional[float], Any]]:
+    """
+    Streams the log.
+
+    Yields:
+        Tuple (line number, recorded timestamp or None, request body or
+        the raw line if it is not valid JSON)
+    """
+    with _open_text(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield line_no, None, line
+                continue
+            if isinstance(record, dict) and ("request" in record or "body" in record):
+                ts = _parse_timestamp(record.get("ts", record.get("timestamp")))
+                yield line_no, ts, record.get("request", record.get("body"))
+            else:
+                yield line_no, None, record
+
+
+# ── Result hashing ─────────────────────────────────────────────────────────────
+
+def plan_hash(data: Dict[str, Any]) -> str:
+    """Stable hash of a treatment plan (response `data`, volatile fields excluded)."""
+    stable = {k: v for k, v in data.items() if k not in VOLATILE_FIELDS}
+    canonical = json.dumps(stable, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+# ── Senders ────────────────────────────────────────────────────────────────────
+
+Sender = Callable[[Any], Tuple[int, Optional[str], Optional[str]]]
+
+
+def http_sender(target: str, timeout_s: float) -> Sender:
+    """POST /solutions on a running instance (one keep-alive session per thread)."""
+    import requests
+
+    url   = f"{target.rstrip('/')}/solutions"
+    local = threading.local()
+
+    def send(body: Any) -> Tuple[int, Optional[str], Optional[str]]:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        try:
+            response = session.post(url, json=body, timeout=timeout_s)
+        except requests.RequestException as e:
+            return 0, None, type(e).__name__
+        if response.status_code != 200:
+            return response.status_code, None, response.text[:200]
+        return 200, plan_hash(response.json()["data"]), None
+
+    return send
+
+
+def in_process_sender() -> Sender:
+    """Validates like the endpoint, then calls generate_treatment_advice directly."""
+    from pydantic import ValidationError
+
+    from app.rag_pipeline import generate_treatment_advice
+    from app.schemas import SolutionRequest, SolutionResponse
+
+    def send(body: Any) -> Tuple[int, Optional[str], Optional[str]]:
+        try:
+            payload = SolutionRequest.model_validate(body).model_dump()
+        except ValidationError as e:
+            return 422, None, str(e.errors()[0].get("msg"))
+        try:
+            advice = generate_treatment_advice(payload)
+        except Exception as e:
+            return 500, None, f"{type(e).__name__}: {e}"
+        data = SolutionResponse(data=advice).model_dump(mode="json")["data"]
+        return 200, plan_hash(data), None
+
+    return send
+
+
+# ── Replay ─────────────────────────────────────────────────────────────────────
+
+class OrderedWriter:
+    """
+    Writes results in input order although they complete out of order.
+    Only results completed ahead of a pending one are buffered.
+    """
+
+    def __init__(self, out: TextIO):
+        self.out      = out
+        self.next     = 0
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        self.lock     = threading.Lock()
+
+    def put(self, index: int, result: Dict[str, Any]) -> None:
+        with self.lock:
+            self.pending[index] = result
+            while self.next in self.pending:
+                self.out.write(json.dumps(self.pending.pop(self.next)) + "\n")
+                self.next += 1
+
+
+def replay(
+    path: str,
+    send: Sender,
+    out: TextIO,
+    speed: float = 0.0,
+    concurrency: int = 8,
+    limit: Optional[int] = None,
+    progress_every: int = 1000,
+) -> Dict[str, Any]:
+    """
+    Replays the log and streams one result line per request to out.
+
+    speed 0 sends as fast as the concurrency allows; speed > 0 keeps the
+    recorded inter-arrival times divided by speed (lines without a
+    timestamp are sent immediately).
+
+    Returns:
+        Summary dict (requests, errors, wall_s)
+    """
+    writer   = OrderedWriter(out)
+    slots    = threading.BoundedSemaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay")
+    errors   = 0
+    count    = 0
+    lock     = threading.Lock()
+
+    def run_one(index: int, line_no: int, body: Any) -> None:
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            status, digest, error = send(body)
+        except Exception as e:
+            status, digest, error = 0, None, f"{type(e).__name__}: {e}"
+        latency_ms = round((time.perf_counter() - t0) * 1000, 2)
+        result = {"index": index, "line": line_no, "status": status, "latency_ms": latency_ms, "hash": digest}
+        if error:
+            result["error"] = error
+            with lock:
+                errors += 1
+        writer.put(index, result)
+        slots.release()
+
+    start    = time.perf_counter()
+    first_ts: Optional[float] = None
+
+    for index, (line_no, ts, body) in enumerate(read_log(path)):
+        if limit is not None and index >= limit:
+            break
+        if speed > 0 and ts is not None:
+            if first_ts is None:
+                first_ts = ts
+            delay = (ts - first_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        slots.acquire()     # bounded in-flight requests: the log is never read ahead
+        executor.submit(run_one, index, line_no, body)
+        count = index + 1
+        if progress_every and count % progress_every == 0:
+            print(f"[REPLAY] {count} requests sent", file=sys.stderr)
+
+    executor.shutdown(wait=True)
+    return {"requests": count, "errors": errors, "wall_s": round(time.perf_counter() - start, 2)}
+
+
+# ── Diff ───────────────────────────────────────────────────────────────────────
+
+def _read_run(path: str) -> Iterator[Dict[str, Any]]:
+    with _open_text(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if "meta" not in record:
+                    yield record
+
+
+def _percentiles(values: array) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50": None, "p95": None, "p99": None}
+    return {
+        f"p{q}": round(ordered[max(1, math.ceil(q / 100 * len(ordered))) - 1], 2)
+        for q in (50, 95, 99)
+    }
+
+
+def diff_runs(path_a: str, path_b: str, top: int = 10) -> Dict[str, Any]:
+    """
+    Compares two runs of the same log, streamed side by side.
+
+    Returns:
+        Dict with latency percentiles of both runs (successful requests in
+        both), the `top` largest slowdowns, status changes, output drift and
+        the records of either run without a counterpart (`unmatched`: one
+        run interrupted or replayed with --limit)
+    """
+    latencies_a, latencies_b = array("d"), array("d")
+    slowdowns: List[Tuple[float, int, float, float]] = []
+    status_changes: Dict[str, int] = {}
+    drifted, compared, drift_examples = 0, 0, []
+    unmatched = {"a": 0, "b": 0}
+
+    for a, b in zip_longest(_read_run(path_a), _read_run(path_b)):
+        if a is None or b is None:
+            unmatched["b" if a is None else "a"] += 1
+            continue
+        if a["index"] != b["index"]:
+            raise ValueError(f"Runs are not aligned (index {a['index']} vs {b['index']}).")
+        compared += 1
+        if a["status"] != b["status"]:
+            key = f"{a['status']}->{b['status']}"
+            status_changes[key] = status_changes.get(key, 0) + 1
+            continue
+        if a["status"] != 200:
+            continue
+        latencies_a.append(a["latency_ms"])
+        latencies_b.append(b["latency_ms"])
+        entry = (b["latency_ms"] - a["latency_ms"], a["line"], a["latency_ms"], b["latency_ms"])
+        if len(slowdowns) < top:
+            heapq.heappush(slowdowns, entry)
+        else:
+            heapq.heappushpop(slowdowns, entry)
+        if a["hash"] != b["hash"]:
+            drifted += 1
+            if len(drift_examples) < top:
+                drift_examples.append(a["line"])
+
+    p_a, p_b = _percentiles(latencies_a), _percentiles(latencies_b)
+    return {
+        "compared":       compared,
+        "both_ok":        len(latencies_a),
+        "latency_ms":     {"a": p_a, "b": p_b},
+        "latency_ratio":  {q: round(p_b[q] / p_a[q], 3) if p_a[q] else None for q in p_a},
+        "top_slowdowns":  [
+            {"line": line, "a_ms": ms_a, "b_ms": ms_b, "delta_ms": round(delta, 2)}
+            for delta, line, ms_a, ms_b in sorted(slowdowns, reverse=True)
+        ],
+        "status_changes": status_changes,
+        "output_drift":   {
+            "changed":  drifted,
+            "rate":     round(drifted / len(latencies_a), 4) if latencies_a else 0.0,
+            "examples": drift_examples,
+        },
+        "unmatched":      unmatched,
+    }
+
+
+def print_diff(report: Dict[str, Any]) -> None:
+    lat = report["latency_ms"]
+    print(f"[DIFF] {report['compared']} requests compared, {report['both_ok']} successful in both runs")
+    unmatched = report["unmatched"]
+    if unmatched["a"] or unmatched["b"]:
+        print(f"[WARN] Runs differ in length: {unmatched['a']} records only in run A, "
+              f"{unmatched['b']} only in run B (not compared)")
+    print(f"{'':<6} {'run A':>10} {'run B':>10} {'B / A':>8}")
+    for q in ("p50", "p95", "p99"):
+        a, b, ratio = lat["a"][q], lat["b"][q], report["latency_ratio"][q]
+        print(f"{q:<6} {a if a is not None else '-':>10} {b if b is not None else '-':>10} "
+              f"{f'{ratio:.2f}x' if ratio is not None else '-':>8}")
+    if report["top_slowdowns"]:
+        print("Largest slowdowns (log line: A → B ms):")
+        for s in report["top_slowdowns"]:
+            if s["delta_ms"] > 0:
+                print(f"  line {s['line']:>8}: {s['a_ms']:.1f} → {s['b_ms']:.1f} (+{s['delta_ms']:.1f})")
+    if report["status_changes"]:
+        print(f"Status changes: {report['status_changes']}")
+    drift = report["output_drift"]
+    print(f"Output drift: {drift['changed']} plans changed ({drift['rate']:.1%})"
+          + (f", e.g. log lines {drift['examples']}" if drift["examples"] else ""))
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded /solutions requests and compare runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Replay a request log")
+    run_parser.add_argument("log", help="JSON lines log (.gz accepted, '-' for stdin)")
+    target = run_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--target", help="Base URL of a running instance")
+    target.add_argument("--in-process", action="store_true", help="Call generate_treatment_advice directly")
+    run_parser.add_argument("-o", "--output", default="-", help="Run file (JSON lines, default stdout)")
+    run_parser.add_argument("--speed", type=float, default=0.0,
+                            help="0 = as fast as possible, 1 = recorded timing, 10 = 10x faster")
+    run_parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    run_parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    run_parser.add_argument("--timeout", type=float, default=60.0, help="HTTP timeout per request (s)")
+
+    diff_parser = subparsers.add_parser("diff", help="Compare two run files")
+    diff_parser.add_argument("run_a")
+    diff_parser.add_argument("run_b")
+    diff_parser.add_argument("--top", type=int, default=10, help="Slowdowns / drift examples to list")
+    diff_parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "diff":
+        report = diff_runs(args.run_a, args.run_b, top=args.top)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_diff(report)
+        return 0
+
+    send = in_process_sender() if args.in_process else http_sender(args.target, args.timeout)
+    out  = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        out.write(json.dumps({"meta": {
+            "log":        args.log,
+            "target":     "in-process" if args.in_process else args.target,
+            "speed":      args.speed,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }}) + "\n")
+        summary = replay(args.log, send, out, speed=args.speed,
+                         concurrency=args.concurrency, limit=args.limit)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"[REPLAY] {summary['requests']} requests in {summary['wall_s']}s, "
+          f"{summary['errors']} errors", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
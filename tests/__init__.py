@@ -4,6 +4,12 @@ tests — Test suite for the Vitiscan Treatment Plan API.
 Test modules:
     test_units.py           Unit tests for pure functions (no external services)
     test_api_integration.py Integration tests for API endpoints (mocked RAG pipeline)
+    test_embedding_parity.py ONNX vs PyTorch embedding parity (needs an exported model)
+    test_startup.py         Import-time budget for app.main (runs in a subprocess)
+    test_benchmarks.py      Pipeline micro-benchmarks vs recorded baseline (subprocess, BENCHMARKS=1)
+    test_loadtest.py        Smoke run of the offline load-test harness (subprocess)
+    test_replay.py          Request log replay and run diff (subprocess)
+    test_llm_routing.py     LLM backend routing and hedging (local mock routers)
 
 All tests run without external dependencies (Weaviate and HuggingFace are mocked).
 Run with: pytest tests/ -v
@@ -10,17 +10,25 @@ Strategy:
   The mock patches app.main.generate_treatment_advice so the
   FastAPI endpoint receives a realistic response without any cloud call.
 
+  The startup warm-up runs with no steps, so no embedder or Weaviate
+  connection is ever opened either.
+
 Endpoints covered:
   GET  /          → health check
   GET  /health    → detailed health check
-  POST /solutions → treatment plan generation
+  GET  /ready     → readiness (startup warm-up)
+  GET  /metrics   → Prometheus metrics
+  POST /solutions → treatment plan generation (debug, timings, admin profile)
+  POST /admin/rules/reload → dosage rule reload (admin only)
 """
 
 import pytest
 from unittest.mock import patch
 from fastapi.testclient import TestClient
 
+from app.dosage_rules import RulesError
 from app.main import app
+from app.warmup import wait_until_ready
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -56,6 +64,9 @@ MOCK_TREATMENT_RESPONSE = {
         "Always verify local regulations and product labels before application.",
         "Respect pre-harvest intervals for all applied products.",
     ],
+    "strategy":       "rag",
+    "policy":         "llm",
+    "quality":        "full",
     "raw_llm_output": "mock-llm-output",
 }
 
@@ -83,8 +94,10 @@ def client():
     """
     with patch(
         "app.main.generate_treatment_advice",
-        side_effect=lambda payload: MOCK_TREATMENT_RESPONSE.copy(),
-    ):  
+        side_effect=lambda payload, **_: MOCK_TREATMENT_RESPONSE.copy(),
+    ), patch("app.warmup.default_warmup_steps", return_value=[]), \
+         patch("app.main.HEALTH_PROBE_INTERVAL_S", 0), \
+         patch("app.main.DOSAGE_RULES_RELOAD_INTERVAL_S", 0):
         with TestClient(app) as c:
             yield c
 
@@ -133,6 +146,91 @@ class TestHealthEndpoint:
         assert data["status"] == "ok"
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# GET /ready  — readiness probe
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestReadyEndpoint:
+
+    def test_ready_returns_200_after_warmup(self, client):
+        assert wait_until_ready(timeout=5)
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+
+    def test_ready_reports_warmup_timestamps(self, client):
+        assert wait_until_ready(timeout=5)
+        data = client.get("/ready").json()
+        assert data["started_at"] is not None
+        assert data["finished_at"] is not None
+
+    def test_ready_returns_503_while_warming_up(self, client):
+        with patch("app.main.is_ready", return_value=False):
+            response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "warming_up"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# GET /metrics — Prometheus scrape endpoint
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestMetricsEndpoint:
+
+    def test_metrics_returns_prometheus_text(self, client):
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+
+    def test_metrics_exposes_stage_histogram(self, client):
+        body = client.get("/metrics").text
+        assert "vitiscan_stage_duration_seconds" in body
+        assert "vitiscan_query_vector_cache_requests_total" in body
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Tracing middleware — W3C traceparent propagation
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestTraceContext:
+
+    TRACEPARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+    def test_solutions_returns_traceparent(self, client):
+        response = client.post("/solutions", json=VALID_PAYLOAD)
+        assert response.headers["traceparent"].startswith("00-")
+
+    def test_incoming_trace_is_continued(self, client):
+        response = client.post(
+            "/solutions", json=VALID_PAYLOAD, headers={"traceparent": self.TRACEPARENT},
+        )
+        _, trace_id, span_id, _ = response.headers["traceparent"].split("-")
+        assert trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert span_id != "00f067aa0ba902b7"
+
+    def test_probes_are_not_traced(self, client):
+        assert "traceparent" not in client.get("/health").headers
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Server-Timing header and ?timings=true
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestServerTiming:
+
+    def test_every_response_has_server_timing(self, client):
+        for response in (client.get("/"), client.post("/solutions", json=VALID_PAYLOAD)):
+            assert "total;dur=" in response.headers["server-timing"]
+
+    def test_timings_absent_by_default(self, client):
+        data = client.post("/solutions", json=VALID_PAYLOAD).json()["data"]
+        assert "timings" not in data
+
+    def test_timings_flag_adds_breakdown(self, client):
+        data = client.post("/solutions?timings=true", json=VALID_PAYLOAD).json()["data"]
+        assert isinstance(data["timings"], dict)
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # POST /solutions — treatment plan generation
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -209,6 +307,47 @@ class TestSolutionsEndpoint:
         data = client.post("/solutions?debug=true", json=VALID_PAYLOAD).json()["data"]
         assert "raw_llm_output" in data
 
+    def test_solutions_strategy_is_passed_to_the_pipeline(self, client):
+        with patch(
+            "app.main.generate_treatment_advice",
+            side_effect=lambda payload, **_: {**MOCK_TREATMENT_RESPONSE, "strategy": "extractive"},
+        ) as advice:
+            data = client.post("/solutions?strategy=extractive", json=VALID_PAYLOAD).json()["data"]
+        assert advice.call_args.kwargs["strategy"] == "extractive"
+        assert data["strategy"] == "extractive"
+
+    def test_solutions_quality_is_passed_to_the_pipeline(self, client):
+        with patch(
+            "app.main.generate_treatment_advice",
+            side_effect=lambda payload, **_: {**MOCK_TREATMENT_RESPONSE, "quality": "fast"},
+        ) as advice:
+            data = client.post("/solutions?quality=fast", json=VALID_PAYLOAD).json()["data"]
+        assert advice.call_args.kwargs["quality"] == "fast"
+        assert data["quality"] == "fast"
+
+    def test_solutions_unknown_quality_returns_422(self, client):
+        response = client.post("/solutions?quality=instant", json=VALID_PAYLOAD)
+        assert response.status_code == 422
+
+    def test_solutions_unknown_strategy_returns_422(self, client):
+        response = client.post("/solutions?strategy=magic", json=VALID_PAYLOAD)
+        assert response.status_code == 422
+
+    def test_solutions_refresh_requires_admin_token(self, client):
+        with patch("app.main.ADMIN_TOKEN", "s3cret"):
+            response = client.post("/solutions?refresh=true", json=VALID_PAYLOAD)
+        assert response.status_code == 403
+
+    def test_solutions_refresh_with_admin_token(self, client):
+        with patch("app.main.ADMIN_TOKEN", "s3cret"), \
+             patch("app.main.generate_treatment_advice",
+                   side_effect=lambda payload, **_: MOCK_TREATMENT_RESPONSE.copy()) as advice:
+            response = client.post(
+                "/solutions?refresh=true", json=VALID_PAYLOAD, headers={"X-Admin-Token": "s3cret"},
+            )
+        assert response.status_code == 200
+        assert advice.call_args.kwargs["refresh"] is True
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # POST /solutions — input validation (FastAPI / Pydantic)
@@ -273,4 +412,73 @@ class TestSolutionsValidation:
             response = client.post("/solutions", json=payload)
             assert response.status_code == 200, (
                 f"POST /solutions returned {response.status_code} for disease '{disease}'"
-            )
\ No newline at end of file
+            )
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# POST /solutions?profile=true — admin-gated profiling
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestProfileFlag:
+
+    def test_profile_without_admin_token_is_forbidden(self, client):
+        with patch("app.main.ADMIN_TOKEN", "s3cret"):
+            response = client.post("/solutions?profile=true", json=VALID_PAYLOAD)
+        assert response.status_code == 403
+
+    def test_profile_disabled_when_admin_token_unset(self, client):
+        with patch("app.main.ADMIN_TOKEN", ""):
+            response = client.post(
+                "/solutions?profile=true", json=VALID_PAYLOAD, headers={"X-Admin-Token": ""},
+            )
+        assert response.status_code == 403
+
+    def test_profile_with_admin_token(self, client, tmp_path):
+        with patch("app.main.ADMIN_TOKEN", "s3cret"), \
+             patch("app.profiling.PROFILE_DIR", str(tmp_path)):
+            response = client.post(
+                "/solutions?profile=true&profile_mode=deterministic",
+                json=VALID_PAYLOAD,
+                headers={"X-Admin-Token": "s3cret"},
+            )
+        assert response.status_code == 200
+        profile = response.json()["data"]["profile"]
+        assert profile["format"] == "pstats"
+        assert profile["file"].endswith(".prof")
+
+    def test_unknown_profile_mode_returns_422(self, client):
+        with patch("app.main.ADMIN_TOKEN", "s3cret"):
+            response = client.post(
+                "/solutions?profile=true&profile_mode=magic",
+                json=VALID_PAYLOAD,
+                headers={"X-Admin-Token": "s3cret"},
+            )
+        assert response.status_code == 422
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# POST /admin/rules/reload — admin-gated dosage rule reload
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestRulesReload:
+
+    def test_reload_without_admin_token_is_forbidden(self, client):
+        with patch("app.main.ADMIN_TOKEN", "s3cret"):
+            response = client.post("/admin/rules/reload")
+        assert response.status_code == 403
+
+    def test_reload_reports_the_active_rule_set(self, client):
+        with patch("app.main.ADMIN_TOKEN", "s3cret"):
+            response = client.post("/admin/rules/reload", headers={"X-Admin-Token": "s3cret"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["version"]
+        assert data["rules"] > 0
+        assert len(data["checksum"]) == 64
+        assert isinstance(data["changed"], bool)
+
+    def test_invalid_rules_return_422(self, client):
+        with patch("app.main.ADMIN_TOKEN", "s3cret"), \
+             patch("app.main.reload_rules", side_effect=RulesError("dosage.csv:3: unknown mode 'bio'")):
+            response = client.post("/admin/rules/reload", headers={"X-Admin-Token": "s3cret"})
+        assert response.status_code == 422
+        assert "unknown mode" in response.json()["detail"]
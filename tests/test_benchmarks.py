@@ -0,0 +1,44 @@
+"""
+test_benchmarks.py — Performance regression gate for the CPU-side pipeline.
+
+Runs scripts/benchmark_pipeline.py --quick --check in a fresh interpreter and
+fails when a case is slower than the recorded baseline
+(scripts/benchmark_baseline.json) by more than the tolerance.
+
+Timings are normalized by a calibration workload, so the baseline recorded on
+a developer machine stays meaningful on CI runners. The tolerance can be
+widened for noisy runners with BENCHMARK_TOLERANCE (default 1.0 = up to 2x).
+
+Wall-clock ratios still swing with machine load (another test run, a busy
+runner), so the gate is opt-in: it only runs with BENCHMARKS=1, on an
+otherwise idle machine:
+    BENCHMARKS=1 pytest tests/test_benchmarks.py
+
+After an intentional change in cost, re-record the baseline with:
+    python scripts/benchmark_pipeline.py --update-baseline
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+BENCHMARK_TOLERANCE = os.getenv("BENCHMARK_TOLERANCE", "1.0")
+
+
+@pytest.mark.skipif(os.getenv("BENCHMARKS") != "1", reason="timing gate, set BENCHMARKS=1 to run")
+class TestBenchmarks:
+
+    def test_no_regression_against_baseline(self):
+        proc = subprocess.run(
+            [
+                sys.executable, "-W", "ignore", "scripts/benchmark_pipeline.py",
+                "--quick", "--check", "--tolerance", BENCHMARK_TOLERANCE,
+            ],
+            cwd=PROJECT_ROOT, capture_output=True, text=True,
+        )
+        assert proc.returncode == 0, proc.stdout + proc.stderr
@@ -0,0 +1,78 @@
+"""
+test_embedding_parity.py — Parity of the ONNX embedding backend with PyTorch.
+
+The ONNX backend must produce the same retrieval geometry as the reference
+SentenceTransformer model: every vector must reach cosine ≥ 0.99 with its
+torch counterpart, for the fp32 and the int8-quantized model.
+
+Skipped unless the ONNX model has been exported beforehand:
+    python -m app.embeddings export --quantize
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.config import EMBEDDING_MODEL_ID, EMBEDDING_ONNX_DIR
+from app.embeddings import ONNX_CONFIG_FILE, ONNX_INT8_MODEL_FILE, OnnxEmbedder
+from app.ingestion import build_chunk_objects, load_markdown_files
+from app.weaviate_client import build_query_text
+
+MIN_COSINE = 0.99
+
+pytest.importorskip("onnxruntime")
+
+ONNX_DIR = Path(EMBEDDING_ONNX_DIR)
+if not (ONNX_DIR / ONNX_CONFIG_FILE).exists():
+    pytest.skip(
+        f"No exported ONNX model in {ONNX_DIR} (run: python -m app.embeddings export --quantize)",
+        allow_module_level=True,
+    )
+
+
+@pytest.fixture(scope="module")
+def texts():
+    """Realistic inputs: knowledge sub-chunks (ingestion) + query texts (retrieval)."""
+    knowledge_dir = Path(__file__).resolve().parents[1] / "data" / "knowledge"
+    chunks  = build_chunk_objects(load_markdown_files(knowledge_dir))
+    queries = [
+        build_query_text("plasmopara_viticola", "organic", "high"),
+        build_query_text("erysiphe_necator", "conventional", "low"),
+        build_query_text("healthy", None, None),
+    ]
+    return [c["text"] for c in chunks] + queries
+
+
+@pytest.fixture(scope="module")
+def torch_vectors(texts):
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    try:
+        model = sentence_transformers.SentenceTransformer(EMBEDDING_MODEL_ID)
+    except Exception as e:
+        pytest.skip(f"Reference model unavailable: {e}")
+    return model.encode(texts)
+
+
+def _cosines(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+class TestOnnxParity:
+
+    def test_fp32_matches_torch(self, texts, torch_vectors):
+        onnx_vectors = OnnxEmbedder(ONNX_DIR, quantized=False).encode(texts)
+        assert onnx_vectors.shape == torch_vectors.shape
+        assert _cosines(onnx_vectors, torch_vectors).min() >= MIN_COSINE
+
+    def test_int8_matches_torch(self, texts, torch_vectors):
+        if not (ONNX_DIR / ONNX_INT8_MODEL_FILE).exists():
+            pytest.skip("No int8 model exported (use --quantize)")
+        onnx_vectors = OnnxEmbedder(ONNX_DIR, quantized=True).encode(texts)
+        assert _cosines(onnx_vectors, torch_vectors).min() >= MIN_COSINE
+
+    def test_single_text_returns_1d_vector(self, torch_vectors):
+        vector = OnnxEmbedder(ONNX_DIR).encode("grapevine downy mildew")
+        assert vector.shape == (torch_vectors.shape[1],)
@@ -0,0 +1,178 @@
+"""
+test_llm_routing.py — Multi-backend routing and hedging of app.llm_client.
+
+Every backend is a local mock router (scripts/mock_llm_server.py) with its
+own latency or error rate: calls go through real HTTP, no external service.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import call, patch
+
+import pytest
+from prometheus_client import REGISTRY
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+
+from mock_llm_server import LatencyDistribution, MockLLMConfig, MockLLMServer  # noqa: E402
+
+from app.llm_client import (  # noqa: E402
+    LLMBackend,
+    LLMError,
+    backend_stats,
+    backends_for_model,
+    call_llm,
+    hedge_delay,
+    parse_backends,
+    rank_backends,
+    reset_backend_stats,
+)
+
+
+def _server(latency: str = "fixed:0.01", error_rate: float = 0.0) -> MockLLMServer:
+    return MockLLMServer(MockLLMConfig(
+        latency=LatencyDistribution.parse(latency), token_rate=0, error_rate=error_rate,
+    ))
+
+
+def _backend(server: MockLLMServer, model: str = "mock-model") -> LLMBackend:
+    return LLMBackend(url=server.completions_url, model=model)
+
+
+def _hedges(winner: str) -> float:
+    return REGISTRY.get_sample_value("vitiscan_llm_hedges_total", {"winner": winner}) or 0.0
+
+
+@pytest.fixture(autouse=True)
+def _fresh_stats():
+    reset_backend_stats()
+    with patch("app.llm_client.HF_TOKEN", "hf_test"):
+        yield
+    reset_backend_stats()
+
+
+class TestBackendConfiguration:
+
+    def test_model_defaults_to_hf_model_id(self):
+        with patch("app.llm_client.HF_MODEL_ID", "default-model"):
+            backends = parse_backends(["http://a/v1/chat/completions|small-model", "http://b/v1/chat/completions"])
+        assert [b.model for b in backends] == ["small-model", "default-model"]
+        assert backends[0].name == "a/small-model"
+
+    def test_model_override_picks_or_builds_its_backends(self):
+        backends = parse_backends(["http://a|big-model", "http://b|small-model", "http://a|other-model"])
+        assert backends_for_model(backends, None) == backends
+        assert backends_for_model(backends, "small-model") == [backends[1]]
+        assert backends_for_model(backends, "tiny-model") == [
+            LLMBackend(url="http://a", model="tiny-model"), LLMBackend(url="http://b", model="tiny-model"),
+        ]
+
+    def test_entry_without_url_is_rejected(self):
+        with pytest.raises(ValueError):
+            parse_backends(["|some-model"])
+
+    def test_unmeasured_backends_rank_first_then_by_score(self):
+        fast, slow, new = (LLMBackend(url=f"http://{n}", model="m") for n in ("fast", "slow", "new"))
+        backend_stats(slow).record(2.0, ok=True)
+        backend_stats(fast).record(0.2, ok=True)
+        assert rank_backends([slow, fast, new]) == [new, fast, slow]
+
+    def test_errors_demote_a_backend(self):
+        fast, flaky = LLMBackend(url="http://fast", model="m"), LLMBackend(url="http://flaky", model="m")
+        backend_stats(fast).record(0.5, ok=True)
+        backend_stats(flaky).record(0.3, ok=True)
+        for _ in range(5):
+            backend_stats(flaky).record(0.3, ok=False)
+        assert rank_backends([flaky, fast]) == [fast, flaky]
+
+    def test_hedge_delay_is_p95_once_measured(self):
+        backend = LLMBackend(url="http://a", model="m")
+        with patch("app.llm_client.LLM_HEDGE_DELAY_S", 3.0):
+            assert hedge_delay(backend) == 3.0
+            for i in range(1, 21):
+                backend_stats(backend).record(i / 10, ok=True)
+            assert hedge_delay(backend) == pytest.approx(2.0)
+
+
+class TestRouting:
+
+    def test_calls_settle_on_the_fastest_backend(self):
+        with _server("fixed:0.2") as slow, _server("fixed:0.01") as fast:
+            backends = [_backend(slow), _backend(fast)]
+            served = [call_llm("prompt", backends=backends, hedge=False).backend for _ in range(4)]
+        # Each backend is tried once, then the fastest one takes every call
+        assert served == [backends[0].name, backends[1].name, backends[1].name, backends[1].name]
+        assert slow.stats[200] == 1
+
+    def test_failed_attempt_retries_on_the_next_backend(self):
+        with _server(error_rate=1.0) as broken, _server() as healthy, \
+                patch("app.llm_client.time.sleep") as sleep:
+            result = call_llm("prompt", backends=[_backend(broken), _backend(healthy)], hedge=False)
+        assert result.backend == _backend(healthy).name
+        assert result.attempts == 2
+        assert broken.stats[500] == 1
+        # No pause before switching backend (the mock server's own sleeps aside)
+        assert call(1) not in sleep.call_args_list
+
+    def test_every_backend_failing_raises(self):
+        with _server(error_rate=1.0) as a, _server(error_rate=1.0) as b, \
+                patch("app.llm_client.time.sleep"):
+            with pytest.raises(LLMError):
+                call_llm("prompt", backends=[_backend(a), _backend(b)], max_retries=2, hedge=False)
+        assert (a.stats[500], b.stats[500]) == (1, 1)
+
+
+class TestHedging:
+
+    def test_slow_primary_is_hedged_and_the_first_answer_wins(self):
+        before = _hedges("hedge")
+        with _server("fixed:1.0") as slow, _server("fixed:0.01") as fast, \
+                patch("app.llm_client.LLM_HEDGE_DELAY_S", 0.05):
+            t0 = time.perf_counter()
+            result = call_llm("prompt", backends=[_backend(slow), _backend(fast)], hedge=True)
+            elapsed = time.perf_counter() - t0
+        assert result.backend == _backend(fast).name
+        assert result.hedged
+        assert elapsed < 0.8
+        assert _hedges("hedge") == before + 1
+
+    def test_primary_answering_in_time_sends_no_hedge(self):
+        with _server("fixed:0.01") as fast, _server("fixed:0.01") as spare, \
+                patch("app.llm_client.LLM_HEDGE_DELAY_S", 1.0):
+            result = call_llm("prompt", backends=[_backend(fast), _backend(spare)], hedge=True)
+        assert result.backend == _backend(fast).name
+        assert not result.hedged
+        assert spare.stats[200] == 0
+
+    def test_hedge_failure_falls_back_to_the_primary(self):
+        before = _hedges("primary")
+        with _server("fixed:0.3") as slow, _server(error_rate=1.0) as broken, \
+                patch("app.llm_client.LLM_HEDGE_DELAY_S", 0.05):
+            result = call_llm("prompt", backends=[_backend(slow), _backend(broken)], hedge=True)
+        assert result.backend == _backend(slow).name
+        assert broken.stats[500] == 1
+        assert _hedges("primary") == before + 1
+
+    def test_saturated_hedge_slots_send_unhedged(self):
+        before = _hedges("skipped")
+        with _server("fixed:0.3") as slow, _server("fixed:0.01") as spare, \
+                patch("app.llm_client.LLM_HEDGE_DELAY_S", 0.05), \
+                patch("app.llm_client._HEDGE_SLOTS", threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()             # every slot held by other calls
+            result = call_llm("prompt", backends=[_backend(slow), _backend(spare)], hedge=True)
+        assert result.backend == _backend(slow).name
+        assert not result.hedged
+        assert spare.stats[200] == 0
+        assert _hedges("skipped") == before + 1
+
+    def test_hedge_slot_is_released_once_the_call_settles(self):
+        slots = threading.BoundedSemaphore(1)
+        with _server("fixed:0.3") as slow, _server("fixed:0.01") as fast, \
+                patch("app.llm_client.LLM_HEDGE_DELAY_S", 0.05), \
+                patch("app.llm_client._HEDGE_SLOTS", slots):
+            assert call_llm("prompt", backends=[_backend(slow), _backend(fast)], hedge=True).hedged
+            time.sleep(0.1)             # the hedge future's callback releases the slot
+            assert slots.acquire(blocking=False)
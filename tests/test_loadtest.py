@@ -0,0 +1,35 @@
+"""
+test_loadtest.py — Smoke test of the offline load-test harness.
+
+Runs scripts/loadtest.py for 2 seconds against the mock LLM router and the
+retrieval stand-in, in a subprocess, and checks that the real API answered
+every request through the full RAG path (no fallback).
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+
+class TestLoadTest:
+
+    def test_smoke_scenario_serves_all_requests(self):
+        proc = subprocess.run(
+            [
+                sys.executable, "-W", "ignore", "scripts/loadtest.py",
+                "--rps", "5", "--duration", "2",
+                "--llm-latency", "fixed:0.01", "--token-rate", "0", "--json",
+            ],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=180,
+        )
+        assert proc.returncode == 0, proc.stderr
+        report = json.loads(proc.stdout)[0]
+
+        assert report["ok"] > 0
+        assert report["error_rate"] == 0
+        assert report["latency_ms"]["p50"] is not None
+        assert report["mock_llm"] == {"http_200": report["ok"]}
+        assert not any(key.startswith("vitiscan_fallbacks_total") for key in report["pipeline"])
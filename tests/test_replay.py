@@ -0,0 +1,97 @@
+"""
+test_replay.py — Request log replay and run comparison (scripts/replay_requests.py).
+
+Replays run in-process and in a subprocess, in static fallback mode
+(SPACE_ID set, no WEAVIATE_URL): plans are deterministic and no external
+service is called.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+FALLBACK_ENV = {**os.environ, "SPACE_ID": "replay-test", "WEAVIATE_URL": "", "HEALTH_PROBE_INTERVAL_S": "0"}
+
+
+def _replay(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-W", "ignore", "scripts/replay_requests.py", *args],
+        cwd=PROJECT_ROOT, env=FALLBACK_ENV, capture_output=True, text=True, timeout=120,
+    )
+
+
+def _write_log(path: Path) -> None:
+    lines = [
+        json.dumps({"ts": 1717000000 + i * 0.01, "request": {
+            "cnn_label": label, "mode": "organic", "severity": "high", "area_m2": 1000.0 * (i + 1),
+        }})
+        for i, label in enumerate(["plasmopara_viticola", "erysiphe_necator", "healthy"] * 4)
+    ]
+    lines.append(json.dumps({"cnn_label": "healthy", "mode": "bogus", "severity": "low", "area_m2": 1}))
+    lines.append("not json")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+class TestReplay:
+
+    def test_run_records_every_request_in_input_order(self, tmp_path):
+        _write_log(tmp_path / "log.jsonl")
+        proc = _replay("run", str(tmp_path / "log.jsonl"), "--in-process", "--speed", "10",
+                       "--concurrency", "4", "-o", str(tmp_path / "a.jsonl"))
+        assert proc.returncode == 0, proc.stderr
+
+        records = [json.loads(line) for line in (tmp_path / "a.jsonl").read_text().splitlines()]
+        assert "meta" in records[0]
+        results = records[1:]
+        assert [r["index"] for r in results] == list(range(14))
+        assert [r["status"] for r in results] == [200] * 12 + [422, 422]
+        assert all(r["hash"] for r in results[:12])
+        assert all(r["latency_ms"] >= 0 for r in results)
+
+    def test_diff_of_identical_runs_reports_no_drift(self, tmp_path):
+        _write_log(tmp_path / "log.jsonl")
+        for run in ("a", "b"):
+            proc = _replay("run", str(tmp_path / "log.jsonl"), "--in-process", "-o", str(tmp_path / f"{run}.jsonl"))
+            assert proc.returncode == 0, proc.stderr
+
+        proc = _replay("diff", str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl"), "--json")
+        assert proc.returncode == 0, proc.stderr
+        report = json.loads(proc.stdout)
+        assert report["compared"] == 14
+        assert report["both_ok"] == 12
+        assert report["output_drift"]["changed"] == 0
+        assert report["status_changes"] == {}
+        assert report["latency_ms"]["a"]["p50"] is not None
+        assert report["unmatched"] == {"a": 0, "b": 0}
+
+    def test_diff_reports_records_missing_from_a_shorter_run(self, tmp_path):
+        _write_log(tmp_path / "log.jsonl")
+        for run, extra in (("a", ()), ("b", ("--limit", "10"))):
+            proc = _replay("run", str(tmp_path / "log.jsonl"), "--in-process",
+                           "-o", str(tmp_path / f"{run}.jsonl"), *extra)
+            assert proc.returncode == 0, proc.stderr
+
+        report = json.loads(_replay("diff", str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl"), "--json").stdout)
+        assert report["compared"] == 10
+        assert report["unmatched"] == {"a": 4, "b": 0}
+        proc = _replay("diff", str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl"))
+        assert "4 records only in run A" in proc.stdout
+
+    def test_diff_detects_output_drift_and_status_changes(self, tmp_path):
+        _write_log(tmp_path / "log.jsonl")
+        proc = _replay("run", str(tmp_path / "log.jsonl"), "--in-process", "-o", str(tmp_path / "a.jsonl"))
+        assert proc.returncode == 0, proc.stderr
+
+        records = [json.loads(line) for line in (tmp_path / "a.jsonl").read_text().splitlines()]
+        records[1]["hash"] = "0" * 16                       # changed plan
+        records[2].update(status=500, hash=None)            # now failing
+        (tmp_path / "b.jsonl").write_text("\n".join(json.dumps(r) for r in records) + "\n")
+
+        report = json.loads(_replay("diff", str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl"), "--json").stdout)
+        assert report["output_drift"]["changed"] == 1
+        assert report["output_drift"]["examples"] == [1]
+        assert report["status_changes"] == {"200->500": 1}
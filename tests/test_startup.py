@@ -0,0 +1,83 @@
+"""
+test_startup.py — Import-time budget for the API process.
+
+`import app.main` runs on every container cold start and must stay cheap:
+heavy dependencies (weaviate client, torch / sentence-transformers, onnxruntime)
+are loaded lazily by the retrieval and embedding backends, never at import.
+
+Each check runs in a fresh interpreter so that modules already imported by
+other tests do not hide a regression.
+
+The time budget covers the application's own import cost: what `import
+app.main` adds on top of a bare `import fastapi` measured in the same
+interpreter, so the (machine-dependent) framework import does not count.
+It can be adjusted for slow CI runners with IMPORT_TIME_BUDGET_S.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+IMPORT_TIME_BUDGET_S = float(os.getenv("IMPORT_TIME_BUDGET_S", "0.5"))
+
+HEAVY_MODULES = (
+    "weaviate",
+    "grpc",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "onnxruntime",
+)
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import fastapi
+t1 = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - t1
+app.main.root()
+app.main.health_check()
+print(json.dumps({
+    "elapsed": elapsed,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+# The in-process snapshot index (RETRIEVAL_BACKEND=snapshot) serves queries
+# without the Weaviate stack
+SNAPSHOT_PROBE = """
+import json, sys
+import app.snapshot
+print(json.dumps({"loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES + ("frontmatter",),)
+
+
+def _run_probe(probe: str = PROBE) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", probe],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+class TestStartup:
+
+    def test_heavy_dependencies_not_imported(self):
+        """Neither import nor the liveness / health probes may pull heavy libraries."""
+        assert _run_probe()["loaded"] == []
+
+    def test_snapshot_index_does_not_import_weaviate(self):
+        assert _run_probe(SNAPSHOT_PROBE)["loaded"] == []
+
+    def test_import_time_within_budget(self):
+        """Cost on top of `import fastapi`, best of 3 runs to absorb scheduler noise."""
+        best = min(_run_probe()["elapsed"] for _ in range(3))
+        assert best < IMPORT_TIME_BUDGET_S, (
+            f"import app.main took {best:.2f}s beyond fastapi (budget {IMPORT_TIME_BUDGET_S:.2f}s)"
+        )
@@ -6,12 +6,129 @@ They test pure Python logic that can be verified offline.
 
 Covered modules:
   - app.rag_pipeline : infer_season_from_date, parse_llm_structured_response
-  - app.dosage_rules : compute_dosage, _normalize_cnn_label
+  - app.dosage_rules : compute_dosage, _normalize_cnn_label, compiled RuleSet,
+                       rule file loading / validation, region and stage fallback,
+                       hot reload, compute_dosage_batch parity (randomized property test)
+  - app.ingestion    : split_section_blocks, chunk_section, build_chunk_objects,
+                       collection versioning helpers (alias swap, garbage collection)
+  - app.snapshot     : write_snapshot / read_snapshot round trip, SnapshotIndex
+  - app.extractive   : section → plan field mapping, list item extraction,
+                       committed index freshness, extractive strategy and
+                       LLM-error fallback of generate_treatment_advice
+  - app.rag_pipeline : label policies (template / cached / llm), plan cache
+                       stale-while-revalidate (soft / hard TTL, single refresh)
+  - app.rag_pipeline : quality tiers (retrieval depth, context budget,
+                       completion cap, model; fast tier without LLM)
+  - app.plan_store   : plan grid, plan validation, versioned builds (bounded
+                       parallelism, rejected builds, garbage collection),
+                       serving / refresh through generate_treatment_advice
+  - app.warmup       : run_warmup step bookkeeping
+  - app.rag_pipeline : retrieve_chunks caching (Weaviate mocked)
+  - app.health       : cached component health (probes mocked)
+  - app.metrics      : stage timer, parse-path / cache / fallback counters
+  - app.llm_client   : LLMResult accounting (router mocked), generation backend
+                       selection, stub backend through the full pipeline,
+                       local backend (tiny chat tokenizer, model mocked)
+  - app.profiling    : sampling / deterministic request profiles
+  - app.tracing      : spans, traceparent parsing, exporters,
+                       per-stage summary and Server-Timing rendering
 """
 
+import dataclasses
+import json
+import random
+import threading
+import time
+
 import pytest
-from app.rag_pipeline import infer_season_from_date, parse_llm_structured_response
-from app.dosage_rules import compute_dosage, _normalize_cnn_label
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from prometheus_client import REGISTRY
+
+import app.rag_pipeline as rag_pipeline
+from app.rag_pipeline import (
+    clear_plan_cache,
+    clear_retrieval_cache,
+    generate_treatment_advice,
+    infer_season_from_date,
+    label_policy,
+    parse_llm_structured_response,
+    retrieve_chunks,
+)
+from app.config import DISEASE_NAMES, EXTRACTIVE_INDEX_PATH, SUPPORTED_MODES
+import app.dosage_rules as dosage_rules
+from app.dosage_rules import (
+    RulesError,
+    compute_dosage,
+    compute_dosage_arrays,
+    compute_dosage_batch,
+    format_treatment_product,
+    get_rule_set,
+    load_rule_set,
+    reload_rules,
+    resolve_label,
+    _normalize_cnn_label,
+    _round2,
+)
+from app.ingestion import (
+    build_chunk_objects,
+    chunk_section,
+    count_tokens,
+    parse_collection_version,
+    split_section_blocks,
+    swap_alias,
+    versioned_collection_name,
+    versions_to_delete,
+)
+from app.extractive import (
+    build_extractive_plan,
+    build_index_from_knowledge,
+    extract_list_items,
+    get_extractive_index,
+    section_plan_field,
+)
+import app.plan_store as plan_store
+from app.plan_store import PlanStore, plan_grid, precompute_plans, reload_plan_store, validate_plan
+from app.snapshot import SnapshotError, SnapshotIndex, read_snapshot, write_snapshot
+from app.warmup import is_ready, run_warmup
+from app.health import get_component_health, run_probes, weaviate_usable
+import app.llm_client as llm_client
+from app.prompts import fit_context_budget
+from app.llm_client import (
+    LLMBackend,
+    LLMError,
+    LLMResult,
+    LocalGenerator,
+    STUB_PLAN,
+    StubGenerator,
+    call_llm,
+    load_generator,
+)
+from app.metrics import stage
+from app.profiling import profiled
+from app.tracing import (
+    FileExporter,
+    annotate,
+    flush_exports,
+    format_server_timing,
+    format_trace_tree,
+    parse_traceparent,
+    set_exporter,
+    span,
+    start_trace,
+    summarize_stages,
+    trace_to_dict,
+)
+
+
+@pytest.fixture(autouse=True)
+def _no_plan_store(monkeypatch):
+    """Pipeline tests never serve a plan store built on the developer's machine."""
+    monkeypatch.setattr(plan_store, "PLAN_STORE_PATH", "")
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -180,6 +297,255 @@ class TestComputeDosage:
             assert isinstance(result, dict), f"compute_dosage crashed for {disease}"
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# Compiled rule set
+# ═══════════════════════════════════════════════════════════════════════════════
+
+RULES_DIR = Path(__file__).resolve().parents[1] / "data" / "rules"
+
+
+@pytest.fixture
+def rules_dir(tmp_path):
+    """A writable copy of data/rules; the active rule set is restored afterwards."""
+    for name in dosage_rules.RULE_FILES:
+        (tmp_path / name).write_bytes((RULES_DIR / name).read_bytes())
+    active = dosage_rules._RULE_SET
+    yield tmp_path
+    dosage_rules._RULE_SET = active
+
+
+def _append_rows(rules_dir: Path, *rows: str) -> None:
+    with open(rules_dir / "dosage.csv", "a", encoding="utf-8") as f:
+        f.writelines(row + "\n" for row in rows)
+
+
+class TestCompiledRuleSet:
+    """The rule files compile into a read-only RuleSet indexed by (label, mode, region, stage)."""
+
+    def test_default_rules_cover_every_label_and_mode(self):
+        rule_set = get_rule_set()
+        assert {(label, mode) for label, mode, _, _ in rule_set.rules} == {
+            (label, mode) for label in DISEASE_NAMES for mode in SUPPORTED_MODES
+        }
+        assert rule_set.version
+
+    def test_bullets_are_pre_rendered(self):
+        import yaml
+
+        products = yaml.safe_load((RULES_DIR / "products.yaml").read_text(encoding="utf-8"))
+        for (label, mode, _, _), rule in get_rule_set().rules.items():
+            assert list(rule.bullets) == format_treatment_product(products[label][mode])
+
+    def test_effective_dose_per_severity(self):
+        rule = get_rule_set().lookup("plasmopara_viticola", "organic")
+        assert rule.effective_dose["high"] == 2.8 * 1.4
+        assert rule.effective_dose[None] == 2.8
+        assert rule.rounded_dose["high"] == round(2.8 * 1.4, 2)
+
+    def test_table_and_records_are_immutable(self):
+        rule_set = get_rule_set()
+        rule = rule_set.lookup("healthy", "organic")
+        with pytest.raises(TypeError):
+            rule_set.rules[rule.key] = rule
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            rule.kind = 3
+        with pytest.raises(TypeError):
+            rule.effective_dose["low"] = 1.0
+
+    @pytest.mark.parametrize("raw", [
+        "plasmopara_viticola", "Plasmopara_Viticola", "  healthy.md ", "ERYSIPHE_NECATOR.MD",
+        "unknown_disease", "", None,
+    ])
+    def test_resolve_label_matches_regex_normalization(self, raw):
+        assert resolve_label(raw) == _normalize_cnn_label(raw)
+
+    def test_each_call_returns_its_own_bullet_list(self):
+        first = compute_dosage("erysiphe_necator", "organic", 1000.0)
+        first["treatment_product"].append("mutated")
+        assert "mutated" not in compute_dosage("erysiphe_necator", "organic", 1000.0)["treatment_product"]
+
+
+class TestRuleFiles:
+    """Loading, validation, region / stage fallback and hot reload of the rule files."""
+
+    def test_region_and_stage_rules_take_precedence(self, rules_dir):
+        _append_rows(
+            rules_dir,
+            "plasmopara_viticola,organic,bordeaux,*,2.0,300.0",
+            "plasmopara_viticola,organic,*,flowering,2.4,300.0",
+            "plasmopara_viticola,organic,bordeaux,flowering,3.0,320.0",
+        )
+        rule_set = load_rule_set(rules_dir)
+
+        def dose(region, stage):
+            return rule_set.lookup("plasmopara_viticola", "organic", region, stage).effective_dose[None]
+
+        assert dose(" Bordeaux ", "Flowering") == 3.0
+        assert dose("bordeaux", "veraison") == 2.0
+        assert dose("bordeaux", None) == 2.0
+        assert dose("alsace", "flowering") == 2.4
+        assert dose("alsace", None) == 2.8
+        assert dose(None, None) == 2.8
+        assert rule_set.lookup("plasmopara_viticola", "biodynamic", "bordeaux", None) is None
+
+    def test_compute_dosage_uses_the_regional_rule(self, rules_dir):
+        _append_rows(rules_dir, "erysiphe_necator,organic,champagne,*,4.0,250.0")
+        reload_rules(rules_dir)
+
+        regional = compute_dosage("erysiphe_necator", "organic", 10000.0, region="Champagne")
+        default  = compute_dosage("erysiphe_necator", "organic", 10000.0)
+        assert regional["dose_l_ha"] == 4.0
+        assert default["dose_l_ha"] == 6.0
+        assert set(regional) == set(default)
+
+    @pytest.mark.parametrize("row, message", [
+        ("plasmopara_viticola,organic,*,*,1.0,300.0", "duplicate"),
+        ("unknown_disease,organic,*,*,1.0,300.0", "unknown label"),
+        ("healthy,biodynamic,*,*,0.0,0.0", "unknown mode"),
+        ("healthy,organic,alsace,*,-1,0.0", "non-negative"),
+        ("healthy,organic,alsace,*,1.0,lots", "must be a number"),
+    ])
+    def test_invalid_rows_are_rejected(self, rules_dir, row, message):
+        _append_rows(rules_dir, row)
+        with pytest.raises(RulesError, match=message):
+            load_rule_set(rules_dir)
+
+    def test_rule_without_default_row_is_rejected(self, rules_dir):
+        path = rules_dir / "dosage.csv"
+        rows = [r for r in path.read_text(encoding="utf-8").splitlines() if not r.startswith("healthy,organic,")]
+        path.write_text("\n".join(rows + ["healthy,organic,alsace,*,0.0,0.0"]) + "\n", encoding="utf-8")
+        with pytest.raises(RulesError, match="default"):
+            load_rule_set(rules_dir)
+
+    def test_manifest_must_cover_every_severity(self, rules_dir):
+        path = rules_dir / "manifest.yaml"
+        path.write_text(path.read_text(encoding="utf-8").replace("  high: 1.4\n", ""), encoding="utf-8")
+        with pytest.raises(RulesError, match="high"):
+            load_rule_set(rules_dir)
+
+    def test_missing_file_is_rejected(self, rules_dir):
+        (rules_dir / "products.yaml").unlink()
+        with pytest.raises(RulesError, match="products.yaml"):
+            load_rule_set(rules_dir)
+
+    def test_reload_swaps_only_when_files_change(self, rules_dir):
+        first, changed = reload_rules(rules_dir)
+        assert changed and get_rule_set() is first
+
+        same, changed = reload_rules()
+        assert not changed and same is first
+
+        _append_rows(rules_dir, "colomerus_vitis,organic,alsace,*,1.5,200.0")
+        second, changed = reload_rules()
+        assert changed and get_rule_set() is second
+        assert second.checksum != first.checksum
+        # The previous rule set is left untouched for requests still reading it
+        assert first.lookup("colomerus_vitis", "organic", "alsace").effective_dose[None] == 1.2
+
+    def test_invalid_reload_keeps_the_active_rules(self, rules_dir):
+        active, _ = reload_rules(rules_dir)
+        _append_rows(rules_dir, "healthy,organic,*,*,0.0,0.0")
+
+        with pytest.raises(RulesError):
+            reload_rules()
+        assert get_rule_set() is active
+        assert compute_dosage("healthy", "organic", 100.0)["configured"] is True
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# compute_dosage_batch
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Valid values plus the edge cases compute_dosage normalizes or rejects
+_BATCH_LABELS = [
+    "colomerus_vitis", "elsinoe_ampelina", "erysiphe_necator", "guignardia_bidwellii",
+    "healthy", "phaeomoniella_chlamydospora", "plasmopara_viticola",
+    " Healthy.md", "PLASMOPARA_VITICOLA", "unknown_disease", "", None,
+]
+_BATCH_MODES      = ["conventional", "organic", "Organic", "biodynamic", ""]
+_BATCH_SEVERITIES = ["low", "moderate", "high", " HIGH ", "extreme", "", None]
+
+
+class TestComputeDosageBatch:
+    """compute_dosage_batch must return exactly what compute_dosage returns, plot by plot."""
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_parity_with_scalar_on_random_plots(self, seed):
+        rng = random.Random(seed)
+        n = 2000
+        labels     = [rng.choice(_BATCH_LABELS) for _ in range(n)]
+        modes      = [rng.choice(_BATCH_MODES) for _ in range(n)]
+        severities = [rng.choice(_BATCH_SEVERITIES) for _ in range(n)]
+        areas      = [
+            rng.choice([0.0, rng.uniform(0, 1), rng.uniform(0, 1e6), float(rng.randint(0, 500_000))])
+            for _ in range(n)
+        ]
+        margin = rng.choice([0.0, 0.10, 0.25])
+
+        expected = [
+            compute_dosage(label, mode, area, severity=severity, safety_margin=margin)
+            for label, mode, area, severity in zip(labels, modes, areas, severities)
+        ]
+        assert compute_dosage_batch(labels, modes, areas, severities, safety_margin=margin) == expected
+
+    def test_parity_with_scalar_on_regional_rules(self, rules_dir):
+        _append_rows(
+            rules_dir,
+            "plasmopara_viticola,organic,bordeaux,*,2.0,300.0",
+            "plasmopara_viticola,organic,*,flowering,2.4,300.0",
+            "healthy,conventional,bordeaux,flowering,0.5,150.0",
+        )
+        reload_rules(rules_dir)
+        rng = random.Random(0)
+        n = 1000
+        labels  = [rng.choice(["plasmopara_viticola", "healthy", "erysiphe_necator"]) for _ in range(n)]
+        modes   = [rng.choice(["organic", "conventional"]) for _ in range(n)]
+        regions = [rng.choice(["bordeaux", "Bordeaux ", "alsace", "", None]) for _ in range(n)]
+        stages  = [rng.choice(["flowering", "veraison", None]) for _ in range(n)]
+        areas   = [rng.uniform(0, 1e5) for _ in range(n)]
+
+        expected = [
+            compute_dosage(label, mode, area, region=region, stage=stage)
+            for label, mode, area, region, stage in zip(labels, modes, areas, regions, stages)
+        ]
+        assert compute_dosage_batch(labels, modes, areas, regions=regions, stages=stages) == expected
+
+    def test_accepts_numpy_columns_and_default_severity(self):
+        labels = np.array(["plasmopara_viticola", "healthy", "phaeomoniella_chlamydospora"])
+        modes  = np.array(["organic", "conventional", "organic"])
+        areas  = np.array([12500.0, 300.0, 8000.0])
+
+        expected = [compute_dosage(l, m, a) for l, m, a in zip(labels.tolist(), modes.tolist(), areas.tolist())]
+        assert compute_dosage_batch(labels, modes, areas) == expected
+
+    def test_results_do_not_share_bullet_lists(self):
+        first, second = compute_dosage_batch(["erysiphe_necator"] * 2, ["organic"] * 2, [1000.0, 1000.0])
+        first["treatment_product"].append("mutated")
+        assert "mutated" not in second["treatment_product"]
+
+    def test_arrays_mark_unknown_rules(self):
+        arrays = compute_dosage_arrays(["plasmopara_viticola", "unknown_disease"], ["organic", "organic"], [10000.0, 10000.0])
+        assert arrays["rule"][1] == -1
+        assert np.isnan(arrays["product_l"][1])
+        assert arrays["product_l"][0] == pytest.approx(2.8 * 1.1)
+
+    def test_vectorized_rounding_matches_round(self):
+        rng = random.Random(0)
+        values = (
+            [rng.uniform(0, 1e6) for _ in range(20000)]
+            + [k / 1000 for k in range(20000)]                 # exact and near .5 ties
+            + [1.005, 2.675, 0.125, -1.005, 1e14 + 0.125, 0.0]
+        )
+        assert _round2(np.array(values)).tolist() == [round(v, 2) for v in values]
+
+    def test_empty_input(self):
+        assert compute_dosage_batch([], [], []) == []
+
+    def test_mismatched_lengths_raise(self):
+        with pytest.raises(ValueError):
+            compute_dosage_batch(["healthy"], ["organic", "organic"], [1.0])
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # parse_llm_structured_response
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -265,4 +631,1165 @@ class TestParseLLMStructuredResponse:
         }'''
         result = parse_llm_structured_response(raw)
         assert result["treatment_actions"]  == []
-        assert result["preventive_actions"] == []
\ No newline at end of file
+        assert result["preventive_actions"] == []
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# split_section_blocks / chunk_section / build_chunk_objects
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestChunking:
+    """Tests for the token-window sub-chunking used at ingestion."""
+
+    SECTION_TEXT = """Intro paragraph about the disease.
+
+**On leaves:**
+- yellow oily spots
+- white downy growth
+
+## Conventional
+
+Alternate fungicide families to limit resistance.
+
+### Timing
+
+- intervene before rain
+- renew after washout
+"""
+
+    def test_bullet_group_kept_with_intro_line(self):
+        blocks = split_section_blocks(self.SECTION_TEXT)
+        assert blocks[1]["text"].startswith("**On leaves:**")
+        assert "- white downy growth" in blocks[1]["text"]
+
+    def test_subheadings_define_subsections(self):
+        blocks = split_section_blocks(self.SECTION_TEXT)
+        assert [b["subsection"] for b in blocks] == ["", "", "Conventional", "Timing"]
+
+    def test_horizontal_rules_are_dropped(self):
+        blocks = split_section_blocks("First.\n\n---\n\nSecond.")
+        assert [b["text"] for b in blocks] == ["First.", "Second."]
+
+    def test_subsections_start_new_chunks(self):
+        chunks = chunk_section("5. Treatment", self.SECTION_TEXT, max_tokens=200)
+        assert [c["subsection"] for c in chunks] == ["", "Conventional", "Timing"]
+        assert chunks[1]["text"].startswith("5. Treatment — Conventional")
+
+    def test_chunks_respect_token_window(self):
+        long_text = "\n\n".join(f"Paragraph {i} " + "word " * 30 for i in range(10))
+        chunks = chunk_section("Section", long_text, max_tokens=50, overlap_tokens=10)
+        assert len(chunks) > 1
+        assert all(c["token_count"] <= 50 for c in chunks)
+
+    def test_oversized_line_is_split(self):
+        chunks = chunk_section("Section", "word " * 300, max_tokens=64, overlap_tokens=8)
+        assert len(chunks) > 1
+        assert all(c["token_count"] <= 64 for c in chunks)
+
+    def test_consecutive_chunks_overlap(self):
+        text = "\n".join(f"- bullet number {i} with a few words" for i in range(30))
+        chunks = chunk_section("Section", text, max_tokens=60, overlap_tokens=15)
+        last_line = chunks[0]["text"].splitlines()[-1]
+        assert last_line in chunks[1]["text"]
+
+    def test_token_count_is_precomputed(self):
+        chunks = chunk_section("Section", self.SECTION_TEXT)
+        for c in chunks:
+            assert c["token_count"] == count_tokens(c["text"])
+
+    def test_build_chunk_objects_keeps_parent_metadata(self):
+        fiche = {
+            "meta": {
+                "id": "plasmopara_viticola",
+                "cnn_label": "plasmopara_viticola",
+                "disease_name": "Downy Mildew",
+                "farming_mode": ["organic", "conventional"],
+            },
+            "content": "# 5. Treatment\n\n" + self.SECTION_TEXT,
+        }
+        chunks = build_chunk_objects([fiche], max_tokens=40, overlap_tokens=0)
+        assert len(chunks) > 1
+        for c in chunks:
+            assert c["section"] == "5. Treatment"
+            assert c["cnn_label"] == "plasmopara_viticola"
+            assert c["farming_mode"] == "organic, conventional"
+        assert [c["chunk_index"] for c in chunks] == list(range(len(chunks)))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Blue/green collection versioning
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestCollectionVersioning:
+    """Tests for the versioned collection helpers in ingestion."""
+
+    def test_versioned_name_round_trip(self):
+        assert parse_collection_version(versioned_collection_name(7)) == 7
+
+    def test_non_versioned_names_are_ignored(self):
+        assert parse_collection_version("VitiScanKnowledge") is None
+        assert parse_collection_version("OtherCollection_v3") is None
+
+    def test_gc_keeps_newest_versions(self):
+        assert versions_to_delete([1, 2, 3, 4], live_version=4, keep=2) == [1, 2]
+
+    def test_gc_never_deletes_live_version(self):
+        # A newer version that failed to go live must not evict the served one
+        assert versions_to_delete([1, 2, 3, 4], live_version=1, keep=2) == [2]
+
+    def test_swap_updates_existing_alias(self):
+        client = MagicMock()
+        client.alias.exists.return_value = True
+        swap_alias(client, "VitiScanKnowledge_v3")
+        client.alias.update.assert_called_once_with(
+            alias_name="VitiScanKnowledge", new_target_collection="VitiScanKnowledge_v3",
+        )
+        client.collections.delete.assert_not_called()
+
+    def test_swap_migrates_legacy_collection(self):
+        client = MagicMock()
+        client.alias.exists.return_value = False
+        client.collections.exists.return_value = True
+        swap_alias(client, "VitiScanKnowledge_v1")
+        client.collections.delete.assert_called_once_with("VitiScanKnowledge")
+        client.alias.create.assert_called_once_with(
+            alias_name="VitiScanKnowledge", target_collection="VitiScanKnowledge_v1",
+        )
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Extractive plans (no LLM)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_PLAN_PAYLOAD = {
+    "cnn_label": "plasmopara_viticola", "mode": "organic", "severity": "high",
+    "area_m2": 1000, "date_iso": "2024-06-01",
+}
+
+
+_LLM_PLAN = json.dumps({
+    "diagnostic": "Downy mildew on young leaves.", "treatment_actions": ["Apply copper."],
+    "preventive_actions": [], "warnings": [],
+})
+
+
+class TestExtractivePlans:
+    """Tests for app.extractive and the extractive strategy of the pipeline."""
+
+    def test_section_titles_map_to_plan_fields(self):
+        assert section_plan_field("4. Treatment strategies — organic") == ("treatment_actions", "organic")
+        assert section_plan_field("5. Preventive measures") == ("preventive_actions", "*")
+        assert section_plan_field("6. Safety and precautions") == ("warnings", "*")
+        assert section_plan_field("1. Description and symptoms") == ("diagnostic", "*")
+        assert section_plan_field("4. No treatment required") == ("", "")
+
+    def test_short_bullets_are_merged_under_their_intro(self):
+        text = "- Alternate families.\n\nFinal choice depends on:\n- grape variety\n- plot history"
+        assert extract_list_items(text) == [
+            "Alternate families.",
+            "Final choice depends on: grape variety, plot history.",
+        ]
+
+    def test_committed_index_matches_knowledge_sheets(self):
+        """data/extractive_index.json must be rebuilt when the sheets change."""
+        committed = json.loads(Path(EXTRACTIVE_INDEX_PATH).read_text(encoding="utf-8"))
+        assert committed == build_index_from_knowledge()
+
+    def test_plan_only_uses_treatments_of_the_mode(self):
+        index = get_extractive_index()["labels"]["plasmopara_viticola"]["treatment_actions"]
+        plan  = build_extractive_plan("plasmopara_viticola", "organic", "high")
+        assert plan["treatment_actions"]
+        assert not set(plan["treatment_actions"]) & set(index["conventional"])
+        assert plan["diagnostic"].startswith("Downy Mildew — reported severity: high.")
+
+    def test_retrieved_chunks_come_first(self):
+        chunk = {
+            "cnn_label": "plasmopara_viticola", "section": "7. Watch points",
+            "plan_field": "warnings", "plan_mode": "*",
+            "text": "7. Watch points\n\n- Check the spray volume after rain.",
+        }
+        plan = build_extractive_plan("plasmopara_viticola", "organic", "high", [chunk])
+        assert plan["warnings"][0] == "Check the spray volume after rain."
+
+    def test_extractive_strategy_does_not_call_the_llm(self):
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=None), \
+             patch("app.rag_pipeline.call_llm") as llm:
+            result = generate_treatment_advice(_PLAN_PAYLOAD, strategy="extractive")
+        llm.assert_not_called()
+        assert result["strategy"] == "extractive"
+        assert result["treatment_actions"]
+        assert result["treatment_plan"]
+
+    def test_llm_error_falls_back_to_extractive_plan(self):
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm", side_effect=LLMError("rate limited")):
+            result = generate_treatment_advice(_PLAN_PAYLOAD, strategy="rag")
+        assert result["strategy"] == "extractive_fallback"
+        assert result["treatment_actions"]
+        assert any("language model was unavailable" in w for w in result["warnings"])
+
+    def test_llm_error_without_fallback_returns_generic_plan(self):
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.EXTRACTIVE_FALLBACK", False), \
+             patch("app.rag_pipeline.call_llm", side_effect=LLMError("rate limited")):
+            result = generate_treatment_advice(_PLAN_PAYLOAD, strategy="rag")
+        assert result["strategy"] == "rag"
+        assert result["treatment_actions"] == []
+
+    def test_unknown_strategy_is_rejected(self):
+        with pytest.raises(ValueError):
+            generate_treatment_advice(_PLAN_PAYLOAD, strategy="magic")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Label policies (template / cached / llm)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestLabelPolicies:
+    """Tests for the per-label short-circuit policies of generate_treatment_advice."""
+
+    def setup_method(self):
+        clear_plan_cache()
+
+    def teardown_method(self):
+        clear_plan_cache()
+
+    def test_default_policies(self):
+        assert label_policy("healthy") == "template"
+        assert label_policy("phaeomoniella_chlamydospora") == "template"
+        assert label_policy("plasmopara_viticola") == "llm"
+
+    def test_template_skips_retrieval_and_llm(self):
+        payload = {**_PLAN_PAYLOAD, "cnn_label": "phaeomoniella_chlamydospora"}
+        with patch("app.rag_pipeline.retrieve_chunks") as retrieve, \
+             patch("app.rag_pipeline.call_llm") as llm:
+            result = generate_treatment_advice(payload)
+        retrieve.assert_not_called()
+        llm.assert_not_called()
+        assert result["policy"] == "template"
+        assert result["treatment_actions"]
+        assert result["treatment_plan"]["area_m2"] == payload["area_m2"]
+
+    def test_template_plans_are_not_shared_between_responses(self):
+        payload = {**_PLAN_PAYLOAD, "cnn_label": "healthy"}
+        generate_treatment_advice(payload)["preventive_actions"].append("mutated")
+        assert "mutated" not in generate_treatment_advice(payload)["preventive_actions"]
+
+    def test_refresh_rebuilds_template_plans(self):
+        payload = {**_PLAN_PAYLOAD, "cnn_label": "healthy"}
+        generate_treatment_advice(payload)
+        with patch("app.rag_pipeline.build_extractive_plan", wraps=rag_pipeline.build_extractive_plan) as build, \
+             patch("app.rag_pipeline.call_llm") as llm:
+            generate_treatment_advice(payload)
+            assert build.call_count == 0
+            result = generate_treatment_advice(payload, refresh=True)
+            assert build.call_count == 1
+        llm.assert_not_called()
+        assert result["policy"] == "template"
+
+    def test_cached_policy_generates_once_per_key(self):
+        with patch.dict("app.rag_pipeline.LABEL_POLICIES", {"plasmopara_viticola": "cached"}), \
+             patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm", return_value=LLMResult(text=_LLM_PLAN)) as llm:
+            first  = generate_treatment_advice(_PLAN_PAYLOAD)
+            second = generate_treatment_advice({**_PLAN_PAYLOAD, "area_m2": 5000})
+            generate_treatment_advice({**_PLAN_PAYLOAD, "severity": "low"})
+        assert llm.call_count == 2
+        assert second["policy"] == "cached"
+        assert second["treatment_actions"] == first["treatment_actions"]
+        assert second["treatment_plan"]["area_m2"] == 5000
+
+    def test_cached_policy_does_not_keep_fallback_plans(self):
+        with patch.dict("app.rag_pipeline.LABEL_POLICIES", {"plasmopara_viticola": "cached"}), \
+             patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm", side_effect=LLMError("down")) as llm:
+            generate_treatment_advice(_PLAN_PAYLOAD)
+            generate_treatment_advice(_PLAN_PAYLOAD)
+        assert llm.call_count == 2
+
+    def test_stale_plan_is_served_while_one_regeneration_runs(self):
+        started, release = threading.Event(), threading.Event()
+        texts = iter([_LLM_PLAN, _LLM_PLAN.replace("copper", "sulfur")])
+
+        def llm(*args, **kwargs):
+            text = next(texts)
+            if "sulfur" in text:
+                started.set()
+                release.wait(5)
+            return LLMResult(text=text)
+
+        stale_before = _sample("vitiscan_plan_cache_stale_total")
+        with patch.dict("app.rag_pipeline.LABEL_POLICIES", {"plasmopara_viticola": "cached"}), \
+             patch("app.rag_pipeline.PLAN_CACHE_SOFT_TTL_S", 0), \
+             patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm", side_effect=llm) as call:
+            generate_treatment_advice(_PLAN_PAYLOAD)
+            stale = [generate_treatment_advice(_PLAN_PAYLOAD) for _ in range(3)]
+            assert started.wait(5)
+            assert call.call_count == 2          # one background regeneration only
+            release.set()
+            for future in list(rag_pipeline._REVALIDATING.values()):
+                future.result(timeout=5)
+            fresh = generate_treatment_advice(_PLAN_PAYLOAD)
+        assert all(r["treatment_actions"] == ["Apply copper."] for r in stale)
+        assert fresh["treatment_actions"] == ["Apply sulfur."]
+        assert _sample("vitiscan_plan_cache_stale_total") >= stale_before + 3
+
+    def test_failed_regeneration_keeps_the_stale_plan(self):
+        errors_before = _sample("vitiscan_plan_refresh_seconds_count", outcome="error")
+        with patch.dict("app.rag_pipeline.LABEL_POLICIES", {"plasmopara_viticola": "cached"}), \
+             patch("app.rag_pipeline.PLAN_CACHE_SOFT_TTL_S", 0), \
+             patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm",
+                   side_effect=[LLMResult(text=_LLM_PLAN), LLMError("down")]):
+            generate_treatment_advice(_PLAN_PAYLOAD)
+            generate_treatment_advice(_PLAN_PAYLOAD)
+            for future in list(rag_pipeline._REVALIDATING.values()):
+                future.result(timeout=5)
+        assert _sample("vitiscan_plan_refresh_seconds_count", outcome="error") == errors_before + 1
+        key = (("plasmopara_viticola", "organic", "high", "summer"), "rag", "full")
+        assert rag_pipeline._PLAN_CACHE[key][1]["treatment_actions"] == ["Apply copper."]
+
+    def test_plan_past_hard_ttl_is_regenerated_in_the_request(self):
+        with patch.dict("app.rag_pipeline.LABEL_POLICIES", {"plasmopara_viticola": "cached"}), \
+             patch("app.rag_pipeline.PLAN_CACHE_HARD_TTL_S", 0), \
+             patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm", return_value=LLMResult(text=_LLM_PLAN)) as llm:
+            generate_treatment_advice(_PLAN_PAYLOAD)
+            generate_treatment_advice(_PLAN_PAYLOAD)
+        assert llm.call_count == 2
+        assert not rag_pipeline._REVALIDATING
+
+    def test_llm_policy_is_reported(self):
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm", return_value=LLMResult(text=_LLM_PLAN)):
+            result = generate_treatment_advice(_PLAN_PAYLOAD)
+        assert result["policy"] == "llm"
+        assert result["strategy"] == "rag"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Plan store (nightly precomputation)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _stored_plan(payload, strategy):
+    return {
+        "cnn_label":          payload["cnn_label"],
+        "strategy":           strategy,
+        "diagnostic":         f"Precomputed plan for {payload['cnn_label']} ({payload['date_iso'] or 'no date'}).",
+        "treatment_actions":  ["Apply a copper-based product."],
+        "preventive_actions": ["Open the canopy."],
+        "warnings":           [],
+        "area_m2":            payload["area_m2"],
+        "treatment_plan":     {},
+    }
+
+
+_SUMMER_KEY = ("plasmopara_viticola", "organic", "high", "summer")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Empty plan store served by the pipeline (PLAN_STORE_PATH patched)."""
+    path = tmp_path / "plans.sqlite"
+    monkeypatch.setattr(plan_store, "PLAN_STORE_PATH", str(path))
+    reload_plan_store()
+    yield PlanStore(path)
+    reload_plan_store()
+
+
+class TestPlanStore:
+    """Tests for app.plan_store and plan store serving in generate_treatment_advice."""
+
+    def test_grid_covers_every_combination(self):
+        with patch.dict("app.rag_pipeline.LABEL_POLICIES", {}, clear=True):
+            grid = plan_grid()
+        assert len(grid) == len(set(grid)) == 7 * 2 * 3 * 5
+
+    def test_grid_leaves_out_template_labels(self):
+        with patch.dict("app.rag_pipeline.LABEL_POLICIES", {"healthy": "template", "plasmopara_viticola": "cached"},
+                        clear=True):
+            labels = {key[0] for key in plan_grid()}
+        assert "healthy" not in labels
+        assert "plasmopara_viticola" in labels
+        assert len(labels) == 6
+
+    def test_validation_rejects_fallback_and_empty_plans(self):
+        valid = _stored_plan({"cnn_label": "healthy", "date_iso": "", "area_m2": 1}, "rag")
+        assert validate_plan(valid) == []
+        assert validate_plan({**valid, "strategy": "extractive_fallback"})
+        assert validate_plan({**valid, "treatment_actions": [], "preventive_actions": []})
+        assert validate_plan({**valid, "warnings": ["```json"]})
+
+    def test_build_goes_live_with_bounded_parallelism(self, store):
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def generate(payload, strategy):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.001)
+            with lock:
+                running[0] -= 1
+            return _stored_plan(payload, strategy)
+
+        summary = precompute_plans(store, workers=3, generate=generate)
+        assert summary["status"] == "live"
+        assert summary["plans"] == len(plan_grid())
+        assert peak[0] <= 3
+        assert store.live_run()["version"] == summary["version"]
+
+    def test_failed_build_keeps_previous_version_live(self, store):
+        first = precompute_plans(store, generate=_stored_plan, keys=[_SUMMER_KEY])
+
+        def flaky(payload, strategy):
+            return {**_stored_plan(payload, strategy), "strategy": "extractive_fallback"}
+
+        second = precompute_plans(store, generate=flaky, keys=[_SUMMER_KEY])
+        assert second["status"] == "rejected"
+        assert second["failures"]
+        assert store.live_run()["version"] == first["version"]
+
+    def test_old_versions_are_garbage_collected(self, store):
+        for _ in range(4):
+            precompute_plans(store, generate=_stored_plan, keys=[_SUMMER_KEY])
+        assert len(store.runs()) == 3
+        assert sorted(store.garbage_collect(keep=1)) == [2, 3]
+        assert [run["version"] for run in store.runs()] == [4]
+
+    def test_pipeline_serves_stored_plan_for_the_requested_area(self, store):
+        version = precompute_plans(store, generate=_stored_plan, keys=[_SUMMER_KEY])["version"]
+        payload = {**_PLAN_PAYLOAD, "area_m2": 2500}
+        with patch("app.rag_pipeline.retrieve_chunks") as retrieve, \
+             patch("app.rag_pipeline.call_llm") as llm:
+            result = generate_treatment_advice(payload)
+        retrieve.assert_not_called()
+        llm.assert_not_called()
+        assert result["policy"] == "precomputed"
+        assert result["plan_version"] == version
+        assert result["diagnostic"].startswith("Precomputed plan")
+        assert result["treatment_plan"]["area_m2"] == 2500
+
+    def test_miss_and_other_strategy_are_generated_live(self, store):
+        precompute_plans(store, generate=_stored_plan, keys=[_SUMMER_KEY])
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm", return_value=LLMResult(text=_LLM_PLAN)):
+            assert generate_treatment_advice({**_PLAN_PAYLOAD, "severity": "low"})["policy"] == "llm"
+            assert generate_treatment_advice(_PLAN_PAYLOAD, strategy="extractive")["policy"] == "llm"
+
+    def test_live_version_is_swapped_never_mutated(self, store):
+        precompute_plans(store, generate=_stored_plan, keys=[_SUMMER_KEY])
+        before = plan_store._live_plans()
+        refreshed = {**_stored_plan(_PLAN_PAYLOAD, "rag"), "diagnostic": "Refreshed plan for downy mildew."}
+        assert plan_store.refresh_plan(_SUMMER_KEY, refreshed)
+        # A reader still holding the previous snapshot keeps a consistent view
+        assert before.plans[_SUMMER_KEY]["diagnostic"].startswith("Precomputed plan")
+        assert plan_store.lookup_plan(_SUMMER_KEY)["diagnostic"] == "Refreshed plan for downy mildew."
+        assert plan_store._live_plans().version == before.version
+
+    def test_refresh_regenerates_and_updates_the_store(self, store):
+        precompute_plans(store, generate=_stored_plan, keys=[_SUMMER_KEY])
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=[]), \
+             patch("app.rag_pipeline.call_llm", return_value=LLMResult(text=_LLM_PLAN)) as llm:
+            refreshed = generate_treatment_advice(_PLAN_PAYLOAD, refresh=True)
+            served    = generate_treatment_advice(_PLAN_PAYLOAD)
+        assert llm.call_count == 1
+        assert refreshed["policy"] == "llm"
+        assert served["policy"] == "precomputed"
+        assert served["treatment_actions"] == refreshed["treatment_actions"]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Quality tiers (fast / balanced / full)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _sized_chunk(index, tokens=400):
+    return {"text": f"Chunk {index}. " + "word " * (tokens - 3), "cnn_label": "plasmopara_viticola"}
+
+
+class TestQualityTiers:
+    """Tests for the QoS tiers of generate_treatment_advice (retrieval and LLM mocked)."""
+
+    def test_context_budget_keeps_relevance_order(self):
+        chunks = [_sized_chunk(0, 400), _sized_chunk(1, 700), _sized_chunk(2, 400)]
+        assert fit_context_budget(chunks, 0) is chunks
+        assert fit_context_budget(chunks, 900) == [chunks[0], chunks[2]]
+
+    def test_context_budget_uses_the_stored_token_count(self):
+        chunks = [{**_sized_chunk(0, 400), "token_count": 1000}, _sized_chunk(1, 400)]
+        with patch("app.prompts.count_tokens", wraps=count_tokens) as count:
+            assert fit_context_budget(chunks, 900) == [chunks[1]]
+        assert count.call_count == 1        # only the chunk without a stored count
+
+    def test_first_chunk_is_cut_when_nothing_fits(self):
+        kept = fit_context_budget([_sized_chunk(0, 400)], 100)
+        assert len(kept) == 1
+        assert count_tokens(kept[0]["text"]) == kept[0]["token_count"] == 100
+        assert kept[0]["text"].startswith("Chunk 0. word")
+
+    def test_fast_tier_answers_without_llm(self):
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=[]) as retrieve, \
+             patch("app.rag_pipeline.call_llm") as llm:
+            result = generate_treatment_advice(_PLAN_PAYLOAD, quality="fast")
+        llm.assert_not_called()
+        assert retrieve.call_args.kwargs["top_k"] == 3
+        assert (result["strategy"], result["quality"]) == ("extractive", "fast")
+        assert result["treatment_actions"]
+
+    def test_fast_tier_serves_the_plan_store(self, store):
+        precompute_plans(store, generate=_stored_plan, keys=[_SUMMER_KEY])
+        with patch("app.rag_pipeline.retrieve_chunks") as retrieve:
+            result = generate_treatment_advice(_PLAN_PAYLOAD, quality="fast")
+        retrieve.assert_not_called()
+        assert result["policy"] == "precomputed"
+        assert result["diagnostic"].startswith("Precomputed plan")
+
+    def test_balanced_tier_budgets_context_and_completion(self):
+        chunks = [_sized_chunk(i) for i in range(5)]
+        with patch.dict("app.rag_pipeline.QUALITY_TIERS",
+                        {"balanced": {**rag_pipeline.QUALITY_TIERS["balanced"], "model": "small-model"}}), \
+             patch("app.rag_pipeline.retrieve_chunks", return_value=chunks) as retrieve, \
+             patch("app.rag_pipeline.call_llm", return_value=LLMResult(text=_LLM_PLAN)) as llm:
+            result = generate_treatment_advice(_PLAN_PAYLOAD, quality="balanced")
+        prompt = llm.call_args.args[0]
+        assert retrieve.call_args.kwargs["top_k"] == 5
+        assert "Chunk 1." in prompt and "Chunk 2." not in prompt
+        assert llm.call_args.kwargs["max_new_tokens"] == 450
+        assert llm.call_args.kwargs["model"] == "small-model"
+        assert (result["strategy"], result["quality"]) == ("rag", "balanced")
+
+    def test_full_tier_is_the_unbudgeted_pipeline(self):
+        chunks = [_sized_chunk(i) for i in range(8)]
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=chunks) as retrieve, \
+             patch("app.rag_pipeline.call_llm", return_value=LLMResult(text=_LLM_PLAN)) as llm:
+            result = generate_treatment_advice(_PLAN_PAYLOAD)
+        assert retrieve.call_args.kwargs["top_k"] == 8
+        assert "Chunk 7." in llm.call_args.args[0]
+        assert llm.call_args.kwargs["max_new_tokens"] == 700
+        assert llm.call_args.kwargs["model"] is None
+        assert result["quality"] == "full"
+
+    def test_unknown_quality_is_rejected(self):
+        with pytest.raises(ValueError):
+            generate_treatment_advice(_PLAN_PAYLOAD, quality="instant")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Knowledge index snapshots
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestSnapshot:
+    """Tests for snapshot export/import files and the in-process index."""
+
+    CHUNKS = [
+        {"text": "Copper treatment.", "cnn_label": "plasmopara_viticola",
+         "disease_id": "plasmopara_viticola", "farming_mode": "organic"},
+        {"text": "Fungicide rotation.", "cnn_label": "plasmopara_viticola",
+         "disease_id": "plasmopara_viticola", "farming_mode": "conventional"},
+        {"text": "Sulfur treatment.", "cnn_label": "erysiphe_necator",
+         "disease_id": "erysiphe_necator", "farming_mode": "organic, conventional"},
+    ]
+    VECTORS = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+
+    def test_round_trip(self, tmp_path):
+        write_snapshot(tmp_path, self.CHUNKS, self.VECTORS, model_id="test-model")
+        chunks, vectors, manifest = read_snapshot(tmp_path, model_id="test-model")
+        assert chunks == self.CHUNKS
+        assert vectors.dtype == np.float32
+        assert vectors.shape == (3, 3)
+        assert manifest["dimension"] == 3
+        assert manifest["count"] == 3
+
+    def test_model_mismatch_is_rejected(self, tmp_path):
+        write_snapshot(tmp_path, self.CHUNKS, self.VECTORS, model_id="test-model")
+        with pytest.raises(SnapshotError):
+            read_snapshot(tmp_path, model_id="another-model")
+
+    def test_vector_count_mismatch_is_rejected(self, tmp_path):
+        with pytest.raises(SnapshotError):
+            write_snapshot(tmp_path, self.CHUNKS, self.VECTORS[:2], model_id="test-model")
+
+    def test_index_filters_by_disease_and_mode(self):
+        index   = SnapshotIndex(self.CHUNKS, np.array(self.VECTORS))
+        results = index.search([0.0, 0.0, 1.0], "plasmopara_viticola", "organic", top_k=5)
+        assert [r["text"] for r in results] == ["Copper treatment."]
+
+    def test_index_ranks_by_cosine_distance(self):
+        index   = SnapshotIndex(self.CHUNKS, np.array(self.VECTORS))
+        results = index.search([0.1, 0.9, 0.0], "plasmopara_viticola", None, top_k=5)
+        assert results[0]["text"] == "Fungicide rotation."
+        assert results[0]["distance"] < results[1]["distance"]
+
+    def test_index_retries_without_mode_filter(self):
+        index   = SnapshotIndex(self.CHUNKS, np.array(self.VECTORS))
+        results = index.search([1.0, 0.0, 0.0], "plasmopara_viticola", "biodynamic", top_k=5)
+        assert len(results) == 2
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Startup warm-up
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestWarmup:
+    """Tests for run_warmup() in app.warmup (steps are stubbed)."""
+
+    def test_successful_steps_are_recorded(self):
+        state = run_warmup(steps=[("embedder", lambda: None)])
+        assert state["status"] == "ready"
+        assert state["steps"]["embedder"]["status"] == "ok"
+        assert "duration_ms" in state["steps"]["embedder"]
+
+    def test_failing_step_does_not_block_readiness(self):
+        def broken():
+            raise RuntimeError("Weaviate down")
+
+        state = run_warmup(steps=[("retrieval_backend", broken), ("caches", lambda: None)])
+        assert is_ready()
+        assert state["steps"]["retrieval_backend"]["status"] == "error"
+        assert "Weaviate down" in state["steps"]["retrieval_backend"]["detail"]
+        assert state["steps"]["caches"]["status"] == "ok"
+
+    def test_skipped_step_is_reported(self):
+        state = run_warmup(steps=[("embedder", lambda: "skipped (static fallback mode)")])
+        assert state["steps"]["embedder"]["status"] == "skipped"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# retrieve_chunks — retrieval cache
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@contextmanager
+def _fake_weaviate_client(shared=False):
+    yield MagicMock()
+
+
+class TestRetrievalCache:
+    """Tests for the retrieval cache in rag_pipeline (Weaviate is mocked)."""
+
+    CHUNKS = [{"text": "Apply copper before rain."}]
+
+    def setup_method(self):
+        clear_retrieval_cache()
+
+    def test_second_call_is_served_from_cache(self):
+        with patch("app.rag_pipeline.weaviate_usable", return_value=True), \
+             patch("app.rag_pipeline.weaviate_client", _fake_weaviate_client), \
+             patch("app.rag_pipeline.search_treatment_chunks", return_value=self.CHUNKS) as search:
+            first  = retrieve_chunks("plasmopara_viticola", "organic", "low")
+            second = retrieve_chunks("plasmopara_viticola", "organic", "low")
+        assert first == second == self.CHUNKS
+        assert search.call_count == 1
+
+    def test_empty_results_are_not_cached(self):
+        with patch("app.rag_pipeline.weaviate_usable", return_value=True), \
+             patch("app.rag_pipeline.weaviate_client", _fake_weaviate_client), \
+             patch("app.rag_pipeline.search_treatment_chunks", return_value=[]) as search:
+            retrieve_chunks("plasmopara_viticola", "organic", "low")
+            retrieve_chunks("plasmopara_viticola", "organic", "low")
+        # 2 calls per retrieval: with mode filter, then without
+        assert search.call_count == 4
+
+    def test_unavailable_weaviate_returns_none(self):
+        with patch("app.rag_pipeline.weaviate_usable", return_value=False):
+            assert retrieve_chunks("plasmopara_viticola", "organic", "low") is None
+
+    def test_shallower_tier_reuses_a_deeper_result(self):
+        chunks = [{"text": f"Chunk {i}."} for i in range(8)]
+        with patch("app.rag_pipeline.weaviate_usable", return_value=True), \
+             patch("app.rag_pipeline.weaviate_client", _fake_weaviate_client), \
+             patch("app.rag_pipeline.search_treatment_chunks", return_value=chunks) as search:
+            retrieve_chunks("plasmopara_viticola", "organic", "low", top_k=8)
+            shallow = retrieve_chunks("plasmopara_viticola", "organic", "low", top_k=3)
+        assert shallow == chunks[:3]
+        assert search.call_count == 1
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# health — cached component health
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@contextmanager
+def _isolated_health(weaviate_status="ok", llm_status="ok"):
+    """Runs with fresh health state and probes returning fixed statuses."""
+    probes = {
+        "weaviate": lambda: (weaviate_status, "probe"),
+        "llm":      lambda: (llm_status, "probe"),
+    }
+    fresh_state = {
+        name: {"status": "unknown", "message": "", "checked_at": None, "latency_ms": None}
+        for name in probes
+    }
+    with patch.dict("app.health.PROBES", probes), \
+         patch.dict("app.health._STATE", fresh_state), \
+         patch.dict("app.health._HISTORY", {name: deque(maxlen=3) for name in probes}), \
+         patch("app.health.weaviate_configured", return_value=True):
+        yield
+
+
+class TestHealthMonitor:
+    """Tests for the background health monitor state (probes are mocked)."""
+
+    def test_probe_results_are_cached_with_timestamp(self):
+        with _isolated_health():
+            run_probes()
+            weaviate = get_component_health()["weaviate"]
+        assert weaviate["status"] == "ok"
+        assert weaviate["checked_at"] is not None
+        assert weaviate["latency_ms"] >= 0
+
+    def test_history_is_bounded(self):
+        with _isolated_health():
+            for _ in range(5):
+                run_probes()
+            history = get_component_health()["llm"]["history"]
+        assert len(history) == 3
+        assert all(entry["status"] == "ok" for entry in history)
+
+    def test_weaviate_down_is_not_usable(self):
+        with _isolated_health(weaviate_status="down"):
+            assert weaviate_usable() is True   # not probed yet: assumed up
+            run_probes()
+            assert weaviate_usable() is False
+
+    def test_failing_probe_is_recorded_as_down(self):
+        def boom():
+            raise RuntimeError("connection refused")
+
+        with _isolated_health(), patch.dict("app.health.PROBES", {"weaviate": boom}):
+            run_probes()
+            weaviate = get_component_health()["weaviate"]
+        assert weaviate["status"] == "down"
+        assert "connection refused" in weaviate["message"]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# metrics — Prometheus instrumentation
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetrics:
+    """Tests for the pipeline instrumentation (counter deltas, no HTTP server)."""
+
+    def test_stage_timer_observes_duration(self):
+        before = _sample("vitiscan_stage_duration_seconds_count", stage="unit_test")
+        with stage("unit_test"):
+            pass
+        assert _sample("vitiscan_stage_duration_seconds_count", stage="unit_test") == before + 1
+
+    def test_stage_timer_observes_on_exception(self):
+        before = _sample("vitiscan_stage_duration_seconds_count", stage="unit_test_error")
+        with pytest.raises(ValueError):
+            with stage("unit_test_error"):
+                raise ValueError("boom")
+        assert _sample("vitiscan_stage_duration_seconds_count", stage="unit_test_error") == before + 1
+
+    @pytest.mark.parametrize("raw, path", [
+        ('{"diagnostic": "ok", "warnings": []}', "json"),
+        ('"diagnostic": "broken json", "warnings": ["x"]', "heuristic"),
+        ("plain prose answer", "raw_text"),
+        ("", "empty"),
+    ])
+    def test_parse_path_is_counted(self, raw, path):
+        before = _sample("vitiscan_llm_parse_total", path=path)
+        parse_llm_structured_response(raw)
+        assert _sample("vitiscan_llm_parse_total", path=path) == before + 1
+
+    def test_retrieval_cache_hit_and_miss_are_counted(self):
+        clear_retrieval_cache()
+        hits   = _sample("vitiscan_cache_requests_total", cache="retrieval", result="hit")
+        misses = _sample("vitiscan_cache_requests_total", cache="retrieval", result="miss")
+        with patch("app.rag_pipeline.weaviate_usable", return_value=True), \
+             patch("app.rag_pipeline.weaviate_client", _fake_weaviate_client), \
+             patch("app.rag_pipeline.search_treatment_chunks", return_value=[{"text": "t"}]):
+            retrieve_chunks("erysiphe_necator", "organic", "high")
+            retrieve_chunks("erysiphe_necator", "organic", "high")
+        assert _sample("vitiscan_cache_requests_total", cache="retrieval", result="miss") == misses + 1
+        assert _sample("vitiscan_cache_requests_total", cache="retrieval", result="hit") == hits + 1
+
+    def test_static_fallback_is_counted(self):
+        before = _sample("vitiscan_fallbacks_total", reason="weaviate_unavailable")
+        with patch("app.rag_pipeline.retrieve_chunks", return_value=None):
+            generate_treatment_advice({
+                "cnn_label": "erysiphe_necator", "mode": "organic", "severity": "low",
+                "area_m2": 1000, "date_iso": "2024-06-01",
+            })
+        assert _sample("vitiscan_fallbacks_total", reason="weaviate_unavailable") == before + 1
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# tracing — spans and W3C trace context
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class _MemoryExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+class TestTracing:
+    """Tests for app.tracing (export is disabled unless a test sets an exporter)."""
+
+    TRACE_ID  = "4bf92f3577b34da6a3ce929d0e0e4736"
+    PARENT_ID = "00f067aa0ba902b7"
+
+    def teardown_method(self):
+        set_exporter(None)
+
+    def test_parse_valid_traceparent(self):
+        header = f"00-{self.TRACE_ID}-{self.PARENT_ID}-01"
+        assert parse_traceparent(header) == (self.TRACE_ID, self.PARENT_ID, True)
+
+    def test_parse_unsampled_traceparent(self):
+        header = f"00-{self.TRACE_ID}-{self.PARENT_ID}-00"
+        assert parse_traceparent(header)[2] is False
+
+    @pytest.mark.parametrize("header", [
+        None, "", "garbage",
+        "00-00000000000000000000000000000000-00f067aa0ba902b7-01",
+        "00-4bf92f3577b34da6a3ce929d0e0e4736-0000000000000000-01",
+    ])
+    def test_parse_invalid_traceparent(self, header):
+        assert parse_traceparent(header) is None
+
+    def test_span_outside_trace_is_noop(self):
+        with span("orphan") as s:
+            annotate(ignored=True)
+        assert s is None
+
+    def test_child_spans_link_to_parent(self):
+        with start_trace("request") as root:
+            with span("retrieval") as retrieval:
+                with span("near_vector", with_mode=True) as query:
+                    pass
+        assert [s.name for s in root.spans] == ["request", "retrieval", "near_vector"]
+        assert retrieval.parent_id == root.span_id
+        assert query.parent_id == retrieval.span_id
+        assert query.attributes == {"with_mode": True}
+        assert all(s.duration_ms is not None for s in root.spans)
+
+    def test_incoming_traceparent_is_continued(self):
+        with start_trace("request", traceparent=f"00-{self.TRACE_ID}-{self.PARENT_ID}-01") as root:
+            pass
+        assert root.trace_id == self.TRACE_ID
+        assert root.parent_id == self.PARENT_ID
+
+    def test_exception_is_recorded_on_span(self):
+        with start_trace("request") as root:
+            with pytest.raises(RuntimeError):
+                with span("llm_attempt", attempt=1):
+                    raise RuntimeError("timeout")
+        assert "timeout" in root.spans[1].attributes["error"]
+
+    def test_finished_trace_is_exported(self):
+        exporter = _MemoryExporter()
+        set_exporter(exporter)
+        with start_trace("request"):
+            with span("parse"):
+                annotate(path="json")
+        flush_exports()
+        assert len(exporter.traces) == 1
+        assert exporter.traces[0]["spans"][1]["attributes"] == {"path": "json"}
+
+    def test_file_exporter_writes_json_lines(self, tmp_path):
+        exporter = FileExporter(tmp_path / "traces.jsonl")
+        with start_trace("request") as root:
+            with span("prompt"):
+                pass
+        exporter.export(trace_to_dict(root))
+        exporter.export(trace_to_dict(root))
+        lines = (tmp_path / "traces.jsonl").read_text(encoding="utf-8").splitlines()
+        assert len(lines) == 2
+
+    def test_trace_tree_is_indented(self):
+        with start_trace("request") as root:
+            with span("pipeline"):
+                with span("llm"):
+                    pass
+        tree = format_trace_tree(trace_to_dict(root)).splitlines()
+        assert tree[0].startswith("request")
+        assert tree[1].startswith("  pipeline")
+        assert tree[2].startswith("    llm")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# tracing — per-stage summary (Server-Timing / ?timings=true)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestStageSummary:
+    """Tests for summarize_stages() and format_server_timing()."""
+
+    @staticmethod
+    def _request_spans(retrieval_cache="miss", embed=True):
+        with start_trace("POST /solutions") as root:
+            with span("retrieval", cache=retrieval_cache):
+                if embed:
+                    with span("embed"):
+                        pass
+                with span("near_vector", with_mode=True):
+                    pass
+                with span("near_vector", with_mode=False):
+                    pass
+            with span("llm"):
+                with span("llm_attempt", attempt=1, error="timeout"):
+                    pass
+                with span("llm_attempt", attempt=2, prompt_tokens=400, completion_tokens=90):
+                    pass
+            with span("parse", path="json"):
+                pass
+            with span("dosage"):
+                pass
+        return root.spans
+
+    def test_retries_are_counted(self):
+        summary = summarize_stages(self._request_spans())
+        assert summary["search"]["queries"] == 2
+        assert summary["llm"]["attempts"] == 2
+
+    def test_token_usage_is_reported(self):
+        llm = summarize_stages(self._request_spans())["llm"]
+        assert llm["prompt_tokens"] == 400
+        assert llm["completion_tokens"] == 90
+
+    def test_cache_results_are_reported(self):
+        summary = summarize_stages(self._request_spans())
+        assert summary["retrieval"]["cache"] == "miss"
+        assert summary["embedding"]["cache"] == "miss"
+        assert summary["parse"]["path"] == "json"
+
+    def test_missing_embed_span_means_vector_cache_hit(self):
+        summary = summarize_stages(self._request_spans(embed=False))
+        assert summary["embedding"] == {"ms": 0.0, "cache": "hit"}
+
+    def test_retrieval_cache_hit_skips_embedding(self):
+        with start_trace("POST /solutions") as root:
+            with span("retrieval", cache="hit"):
+                pass
+        summary = summarize_stages(root.spans)
+        assert summary["retrieval"]["cache"] == "hit"
+        assert "embedding" not in summary
+
+    def test_server_timing_format(self):
+        header = format_server_timing(
+            {
+                "retrieval": {"ms": 3.14, "cache": "hit"},
+                "llm":       {"ms": 812.0, "attempts": 2, "prompt_tokens": 400, "completion_tokens": 90},
+            },
+            total_ms=820.5,
+        )
+        assert header == (
+            'retrieval;dur=3.1;desc="cache=hit", '
+            'llm;dur=812.0;desc="attempts=2 tokens=400+90", '
+            'total;dur=820.5'
+        )
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# llm_client — result object and usage accounting
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _router_response(content="{}", usage=None, finish_reason="stop", status_code=200):
+    response = MagicMock(status_code=status_code, text="error body")
+    response.json.return_value = {
+        "model":   "test-model",
+        "choices": [{"message": {"content": content}, "finish_reason": finish_reason}],
+        "usage":   usage or {},
+    }
+    return response
+
+
+class TestLLMClient:
+    """Tests for call_llm's LLMResult (HTTP calls mocked, retry sleep skipped)."""
+
+    USAGE = {"prompt_tokens": 812, "completion_tokens": 240, "total_tokens": 1052}
+
+    def _call(self, *responses):
+        with patch("app.llm_client.HF_TOKEN", "hf_test"), \
+             patch("app.llm_client.time.sleep"), \
+             patch("app.llm_client.requests.post", side_effect=list(responses)):
+            return call_llm("prompt", max_new_tokens=700)
+
+    def test_result_carries_usage(self):
+        result = self._call(_router_response('{"diagnostic": "x"}', usage=self.USAGE))
+        assert result.text == '{"diagnostic": "x"}'
+        assert (result.prompt_tokens, result.completion_tokens, result.total_tokens) == (812, 240, 1052)
+        assert result.model == "test-model"
+        assert result.latency_s >= 0
+        assert result.attempts == 1
+
+    def test_missing_usage_gives_none(self):
+        result = self._call(_router_response("text"))
+        assert result.prompt_tokens is None
+        assert result.tokens_per_second is None
+
+    def test_length_finish_reason_is_truncation(self):
+        before = _sample("vitiscan_llm_finish_total", reason="length")
+        result = self._call(_router_response("{", usage=self.USAGE, finish_reason="length"))
+        assert result.truncated
+        assert _sample("vitiscan_llm_finish_total", reason="length") == before + 1
+
+    def test_tokens_are_counted(self):
+        before = _sample("vitiscan_llm_tokens_total", kind="completion")
+        self._call(_router_response("ok", usage=self.USAGE))
+        assert _sample("vitiscan_llm_tokens_total", kind="completion") == before + 240
+
+    def test_retry_reports_attempt_number(self):
+        result = self._call(_router_response(status_code=503), _router_response("ok"))
+        assert result.attempts == 2
+
+    def test_all_attempts_failing_raises(self):
+        with pytest.raises(LLMError):
+            self._call(_router_response(status_code=500), _router_response(status_code=500))
+
+
+class TestGenerationBackends:
+    """Tests for the generation backend selection (stub backend, no model or network)."""
+
+    @pytest.fixture
+    def stub(self, monkeypatch):
+        stub = StubGenerator(delay_s=0.05)
+        monkeypatch.setattr(llm_client, "_GENERATOR", stub)
+        return stub
+
+    def test_stub_returns_a_valid_plan_after_its_delay(self, stub):
+        result = call_llm("prompt " * 100, max_new_tokens=700)
+        assert result.latency_s >= 0.05
+        assert result.backend == "stub"
+        assert result.prompt_tokens == len("prompt " * 100) // 4
+        assert parse_llm_structured_response(result.text) == STUB_PLAN
+
+    def test_stub_serves_the_full_pipeline(self, stub):
+        with patch.dict("app.rag_pipeline.LABEL_POLICIES", {}, clear=True), \
+             patch("app.rag_pipeline.retrieve_chunks", return_value=[]):
+            result = generate_treatment_advice(_PLAN_PAYLOAD)
+        assert (result["strategy"], result["policy"]) == ("rag", "llm")
+        assert result["diagnostic"] == STUB_PLAN["diagnostic"]
+        assert validate_plan(result, "rag") == []
+
+    def test_unavailable_backend_is_an_llm_error(self, monkeypatch):
+        monkeypatch.setattr(llm_client, "_GENERATOR", None)
+        monkeypatch.setattr(llm_client, "_GENERATOR_FAILURE", None)
+        with patch("app.llm_client.load_generator", side_effect=RuntimeError("requires torch and transformers")):
+            with pytest.raises(LLMError, match="unavailable"):
+                call_llm("prompt")
+
+    def test_failed_load_is_not_retried_on_every_call(self, monkeypatch):
+        monkeypatch.setattr(llm_client, "_GENERATOR", None)
+        monkeypatch.setattr(llm_client, "_GENERATOR_FAILURE", None)
+        with patch("app.llm_client.load_generator", side_effect=OSError("model not found")) as load:
+            for _ in range(3):
+                with pytest.raises(LLMError, match="model not found"):
+                    call_llm("prompt")
+            assert load.call_count == 1
+
+            llm_client.reload_generator()
+            with pytest.raises(LLMError):
+                call_llm("prompt")
+            assert load.call_count == 2
+
+    def test_explicit_http_backends_bypass_the_configured_backend(self, stub):
+        with patch("app.llm_client.HF_TOKEN", "hf_test"), \
+             patch("app.llm_client.requests.post", return_value=_router_response("ok")):
+            result = call_llm("prompt", backends=[LLMBackend(url="http://router/v1/chat/completions", model="m")])
+        assert result.text == "ok"
+
+    def test_unknown_backend_is_rejected(self):
+        with pytest.raises(ValueError):
+            load_generator("gpu")
+
+
+def _tiny_chat_tokenizer():
+    """Word-level tokenizer with a chat template, pad id 0 (built offline)."""
+    tokenizers   = pytest.importorskip("tokenizers")
+    transformers = pytest.importorskip("transformers")
+    words = ["<pad>", "<eos>", "<unk>", "user", "assistant", ":", "copper", "spray", "now", "prompt"]
+    model = tokenizers.models.WordLevel({w: i for i, w in enumerate(words)}, unk_token="<unk>")
+    backend = tokenizers.Tokenizer(model)
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        pad_token="<pad>",
+        eos_token="<eos>",
+        unk_token="<unk>",
+        chat_template=(
+            "{% for m in messages %}{{ m['role'] }} : {{ m['content'] }} {% endfor %}"
+            "{% if add_generation_prompt %}assistant : {% endif %}"
+        ),
+    )
+
+
+class TestLocalGenerator:
+    """Tests for llm_client.LocalGenerator (tiny tokenizer, model.generate mocked)."""
+
+    @pytest.fixture
+    def local(self):
+        torch     = pytest.importorskip("torch")
+        tokenizer = _tiny_chat_tokenizer()
+        model     = MagicMock()
+        model.generate.side_effect = lambda input_ids, **kwargs: torch.cat(
+            [input_ids, torch.tensor([tokenizer.convert_tokens_to_ids(["copper", "spray", "now"])])], dim=1,
+        )
+        with patch("transformers.AutoTokenizer.from_pretrained", return_value=tokenizer), \
+             patch("transformers.AutoModelForCausalLM.from_pretrained", return_value=model):
+            yield LocalGenerator(model_id="tiny")
+
+    def test_chat_template_prompt_is_generated(self, local):
+        result = local.generate("prompt", max_new_tokens=3, temperature=0.0, top_p=1.0)
+        assert result.text == "copper spray now"
+        assert (result.prompt_tokens, result.completion_tokens) == (5, 3)
+        assert result.finish_reason == "length"
+        kwargs = local.model.generate.call_args.kwargs
+        assert kwargs["attention_mask"].shape == (1, 5)
+        assert kwargs["pad_token_id"] == 0
+
+    def test_completion_below_the_cap_stops(self, local):
+        assert local.generate("prompt", max_new_tokens=50, temperature=0.0, top_p=1.0).finish_reason == "stop"
+
+    def test_model_load_failure_is_a_runtime_error(self):
+        pytest.importorskip("torch")
+        with patch("transformers.AutoTokenizer.from_pretrained", side_effect=ValueError("bad config")):
+            with pytest.raises(RuntimeError, match="bad config"):
+                LocalGenerator(model_id="broken")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# profiling — per-request profiles
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _busy_work(duration_s=0.05):
+    deadline = time.perf_counter() + duration_s
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(200))
+    return total
+
+
+class TestProfiling:
+    """Tests for app.profiling (profiles written to a temporary directory)."""
+
+    def test_sampling_profile_writes_collapsed_stacks(self, tmp_path):
+        with patch("app.profiling.PROFILE_DIR", str(tmp_path)):
+            with profiled("sampling", label="unit") as session:
+                _busy_work()
+        report = session.report
+        assert report["format"] == "collapsed"
+        assert report["samples"] > 0
+        folded = Path(report["file"]).read_text(encoding="utf-8")
+        assert "_busy_work" in folded
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in folded.splitlines())
+
+    def test_deterministic_profile_reports_top_functions(self, tmp_path):
+        with patch("app.profiling.PROFILE_DIR", str(tmp_path)):
+            with profiled("deterministic", label="unit") as session:
+                _busy_work(0.01)
+        assert session.report["file"].endswith(".prof")
+        assert any("_busy_work" in row["function"] or "sum" in row["function"]
+                   for row in session.report["top"])
+
+    def test_unknown_mode_raises(self):
+        with pytest.raises(ValueError):
+            with profiled("pyinstrument"):
+                pass